@@ -0,0 +1,167 @@
+"""
+Benchmarks of the primality engines and the prime search
+"""
+import argparse
+import json
+import os
+import platform
+import time
+
+import primality
+from checkpoint import encode_int
+from main import DEFAULT_GENERATOR, GENERATORS, run_search
+
+# Fixed inputs: name -> (numbers, expected verdict)
+INPUTS = {
+    'primes-10': ([1000000007, 9999999967], True),
+    'composites-10': ([2001290189, 9999999969], False),
+    'primes-20': ([10000000000000000051, 99999999999999999989], True),
+    'composites-20': ([20000000151000000203, 99999999999999999991], False),
+    'primes-40': ([1000000000000000000000000000000000000003,
+                   9999999999999999999999999999999999999983], True),
+    'composites-40': ([2000000000000000003310000000000000001121,
+                       9999999999999999999999999999999999999981], False),
+    'carmichael': ([561, 1105, 1729, 2465, 2821, 6601, 8911, 3215031751,
+                    10024450170427279369,
+                    1000000014634489660629392778850185650209], False),
+}
+
+# Largest number of digits each engine is benchmarked on
+ENGINE_DIGIT_LIMITS = {
+    'trial': 12,
+}
+
+
+def bench_engine(engine, numbers, expected, min_time):
+    """
+    Runs a primality engine over fixed inputs, repeatedly.
+    :param engine: Name of the primality engine
+    :param numbers: Numbers to check
+    :param expected: Expected verdict for every number
+    :param min_time: Minimum running time, in seconds
+    :return: Dictionary with the counts, rates and correctness
+    """
+    check = primality.get_engine(engine)
+    candidates = primes = 0
+    correct = True
+    start_time = time.perf_counter()
+
+    while True:
+        for n in numbers:
+            verdict = check(n)
+            candidates += 1
+            primes += verdict
+            correct = correct and verdict == expected
+        seconds = time.perf_counter() - start_time
+        if seconds >= min_time:
+            break
+
+    return {
+        'candidates': candidates,
+        'primes': primes,
+        'seconds': seconds,
+        'candidates_per_s': candidates / seconds,
+        'primes_per_s': primes / seconds,
+        'correct': correct,
+    }
+
+
+def bench_engines(engines, min_time):
+    """
+    Benchmarks the primality engines on every fixed input.
+    :param engines: Names of the primality engines
+    :param min_time: Minimum running time per engine and input, in seconds
+    :return: List of results
+    """
+    results = []
+    for engine in engines:
+        limit = ENGINE_DIGIT_LIMITS.get(engine)
+        for name, (numbers, expected) in INPUTS.items():
+            if limit is not None:
+                numbers = [n for n in numbers if len(str(n)) <= limit]
+            if not numbers:
+                continue
+            result = bench_engine(engine, numbers, expected, min_time)
+            results.append({'engine': engine, 'input': name, **result})
+            print(f"{engine:>12} {name:>14}: "
+                  f"{result['candidates_per_s']:12.1f} candidates/s "
+                  f"{'' if result['correct'] else ' WRONG'}")
+    return results
+
+
+def bench_search(engines, process_counts, generator, search_time):
+    """
+    Benchmarks the block search.
+    :param engines: Names of the primality engines
+    :param process_counts: Numbers of worker processes
+    :param generator: Name of the candidate generator
+    :param search_time: Time budget of each search, in seconds
+    :return: List of results
+    """
+    results = []
+    for engine in engines:
+        for processes in process_counts:
+            start_time = time.perf_counter()
+            max_prime, reports = run_search(processes, search_time,
+                                            engine=engine, generator=generator)
+            seconds = time.perf_counter() - start_time
+            tested = sum(report['tested'] for report in reports)
+            primes = sum(report['primes'] for report in reports)
+            digits = primality.count_digits(max_prime)
+
+            results.append({
+                'engine': engine,
+                'generator': generator,
+                'processes': processes,
+                'seconds': seconds,
+                'candidates': tested,
+                'primes': primes,
+                'candidates_per_s': tested / seconds,
+                'primes_per_s': primes / seconds,
+                'largest_prime': encode_int(max_prime),
+                'digits': digits,
+            })
+            print(f"{engine:>12} {processes:>3} processes: "
+                  f"{tested / seconds:10.1f} candidates/s "
+                  f"{primes / seconds:8.1f} primes/s {digits:>6} digits")
+    return results
+
+
+if __name__ == '__main__':
+    cpu_count = os.cpu_count() or 1
+    default_processes = sorted({n for n in (1, 2, 4) if n < cpu_count} | {cpu_count})
+
+    parser = argparse.ArgumentParser(description='Benchmarks the prime search.')
+    parser.add_argument('--engines', nargs='+', default=list(primality.ENGINES),
+                        choices=list(primality.ENGINES),
+                        help='primality engines to benchmark')
+    parser.add_argument('--processes', nargs='+', type=int, default=default_processes,
+                        help='numbers of worker processes for the search')
+    parser.add_argument('--generator', default=DEFAULT_GENERATOR,
+                        choices=list(GENERATORS),
+                        help='candidate generator for the search')
+    parser.add_argument('--min-time', type=float, default=1.0,
+                        help='minimum seconds per engine and input')
+    parser.add_argument('--search-time', type=float, default=5.0,
+                        help='time budget of each search, in seconds')
+    parser.add_argument('--skip-search', action='store_true',
+                        help='only benchmark the primality engines')
+    parser.add_argument('--output', metavar='PATH',
+                        help='file where the results are saved as JSON')
+    args = parser.parse_args()
+
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': cpu_count,
+        'engines': bench_engines(args.engines, args.min_time),
+        'search': [],
+    }
+    if not args.skip_search:
+        search_engines = [e for e in args.engines if e not in ENGINE_DIGIT_LIMITS]
+        report['search'] = bench_search(search_engines, args.processes,
+                                        args.generator, args.search_time)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
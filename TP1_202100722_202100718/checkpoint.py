@@ -0,0 +1,80 @@
+"""
+Checkpoints of the prime search
+"""
+import json
+import os
+
+CHECKPOINT_VERSION = 2
+
+
+def encode_int(n):
+    """
+    Encodes an integer for JSON (hexadecimal, not bound by the int/str
+    conversion digit limit).
+    :param n: Integer
+    :return: Hexadecimal string
+    """
+    return hex(n)
+
+
+def decode_int(s):
+    """
+    Decodes an integer encoded by encode_int.
+    :param s: Hexadecimal string
+    :return: Integer
+    """
+    return int(s, 16)
+
+
+def save_checkpoint(path, max_prime, scheduler=None, blocks=(), values=(),
+                    elapsed=0.0, scheduler_kind=None):
+    """
+    Writes a checkpoint atomically (temporary file, then rename).
+    :param path: Checkpoint file
+    :param max_prime: Maximum prime number found so far
+    :param scheduler: Cursor (level, index) of the block scheduler, if any
+    :param blocks: Unfinished blocks (lo, hi) of the block workers
+    :param values: Next values of the progression workers
+    :param elapsed: Total search time so far, in seconds
+    :param scheduler_kind: Work distribution strategy of the search, to check on resume
+    :return: None
+    """
+    state = {
+        'version': CHECKPOINT_VERSION,
+        'scheduler_kind': scheduler_kind,
+        'max_prime': encode_int(max_prime),
+        'scheduler': list(scheduler) if scheduler is not None else None,
+        'blocks': [[encode_int(lo), encode_int(hi)] for lo, hi in blocks],
+        'values': [encode_int(value) for value in values],
+        'elapsed': elapsed,
+    }
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(state, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """
+    Reads a checkpoint.
+    :param path: Checkpoint file
+    :return: Dictionary with max_prime, scheduler_kind, scheduler, blocks, values
+             and elapsed
+    """
+    with open(path, encoding='utf-8') as file:
+        state = json.load(file)
+
+    if state.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f'Unsupported checkpoint version: {state.get("version")}')
+
+    return {
+        'max_prime': decode_int(state['max_prime']),
+        'scheduler_kind': state['scheduler_kind'],
+        'scheduler': tuple(state['scheduler']) if state['scheduler'] else None,
+        'blocks': [(decode_int(lo), decode_int(hi)) for lo, hi in state['blocks']],
+        'values': [decode_int(value) for value in state['values']],
+        'elapsed': state['elapsed'],
+    }
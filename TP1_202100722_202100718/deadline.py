@@ -0,0 +1,50 @@
+"""
+Cooperative stop condition of the search workers
+"""
+import math
+import time
+
+# Calls to Deadline.check between reads of the clock and the cancel event
+DEFAULT_CLOCK_INTERVAL = 64
+
+
+class Deadline:
+    """
+    Time limit of a worker, together with a shared cancel event (set when
+    the target is reached or the user interrupts the search). check() is
+    meant to be called for every candidate and only reads the clock and the
+    event every interval calls; poll() reads them right away.
+    """
+
+    def __init__(self, timeout=None, cancel=None, interval=DEFAULT_CLOCK_INTERVAL):
+        """
+        :param timeout: Seconds from now, None for no time limit
+        :param cancel: multiprocessing.Event shared by the workers, if any
+        :param interval: Calls to check between reads of the clock and the event
+        """
+        self.end = math.inf if timeout is None else time.time() + timeout
+        self.cancel = cancel
+        self.interval = interval
+        self.expired = False
+        self._countdown = interval
+
+    def check(self):
+        """
+        Counts a unit of work.
+        :return: True once the worker must stop
+        """
+        self._countdown -= 1
+        if self._countdown > 0:
+            return self.expired
+        self._countdown = self.interval
+        return self.poll()
+
+    def poll(self):
+        """
+        Reads the clock and the cancel event.
+        :return: True once the worker must stop
+        """
+        if not self.expired:
+            self.expired = (time.time() >= self.end
+                            or (self.cancel is not None and self.cancel.is_set()))
+        return self.expired
@@ -0,0 +1,377 @@
+"""
+Prime search over several hosts: a TCP coordinator and its workers
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import socket
+import socketserver
+import threading
+import time
+
+import primality
+from checkpoint import decode_int, encode_int
+from deadline import Deadline
+from main import DEFAULT_GENERATOR, GENERATORS, parse_int, scan_block
+from scheduler import DEFAULT_GROWTH, BlockScheduler
+from stats import WorkerStats
+
+DEFAULT_PORT = 8500
+
+# Seconds without news from a worker before its block is handed out again
+DEFAULT_HEARTBEAT_TIMEOUT = 10
+
+# Heartbeats sent per heartbeat timeout
+HEARTBEATS_PER_TIMEOUT = 3
+
+# Seconds the coordinator keeps answering 'done' after the search ends
+SHUTDOWN_GRACE = 1
+
+
+def send_message(file, message):
+    """
+    Writes a message as one line of JSON.
+    :param file: Binary file of the socket
+    :param message: Dictionary
+    :return: None
+    """
+    file.write(json.dumps(message).encode('utf-8') + b'\n')
+    file.flush()
+
+
+def receive_message(file):
+    """
+    Reads a message written by send_message.
+    :param file: Binary file of the socket
+    :return: Dictionary, or None if the connection was closed
+    """
+    line = file.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+class CoordinatorServer(socketserver.ThreadingTCPServer):
+    """TCP server of the coordinator, one thread per worker connection."""
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class CoordinatorHandler(socketserver.StreamRequestHandler):
+    """Connection of one worker."""
+
+    def handle(self):
+        self.server.coordinator.handle_connection(self.rfile, self.wfile)
+
+
+class Coordinator:
+    """
+    Hands out blocks of the search space to the workers and collects their
+    primes. Every worker holds at most one block and reports its progress
+    with heartbeats; the unfinished part of the block of a worker that
+    disconnects or stays silent for longer than the heartbeat timeout is
+    handed out again.
+    """
+
+    def __init__(self, host='localhost', port=DEFAULT_PORT, scheduler=None,
+                 engine=primality.DEFAULT_ENGINE, generator=DEFAULT_GENERATOR,
+                 heartbeat_timeout=DEFAULT_HEARTBEAT_TIMEOUT, target=None):
+        """
+        :param host: Address to listen on
+        :param port: Port to listen on (0 for any free port)
+        :param scheduler: BlockScheduler (an open-ended one by default)
+        :param engine: Name of the primality engine the workers use
+        :param generator: Name of the candidate generator the workers use
+        :param heartbeat_timeout: Seconds without news before a block is reassigned
+        :param target: Stop once the maximum reaches this value, if any
+        """
+        self.scheduler = scheduler or BlockScheduler(growth=DEFAULT_GROWTH,
+                                                     blocks_per_level=1)
+        self.engine = engine
+        self.generator = generator
+        self.heartbeat_timeout = heartbeat_timeout
+        self.target = target
+        self.max_prime = 1
+        self.lock = threading.Lock()
+        # Worker -> [lo, hi, time of the last message]
+        self.assignments = {}
+        # Unfinished blocks of lost workers
+        self.pending = []
+        self.exhausted = False
+        self.finished = False
+        self.next_worker = 0
+
+        self.server = CoordinatorServer((host, port), CoordinatorHandler)
+        self.server.coordinator = self
+
+    @property
+    def address(self):
+        """Address (host, port) the coordinator listens on."""
+        return self.server.server_address
+
+    def handle_connection(self, rfile, wfile):
+        """
+        Answers the messages of one worker until it disconnects.
+        :param rfile: Binary file to read from
+        :param wfile: Binary file to write to
+        :return: None
+        """
+        with self.lock:
+            worker = self.next_worker
+            self.next_worker += 1
+        try:
+            while True:
+                message = receive_message(rfile)
+                if message is None:
+                    break
+                send_message(wfile, self.handle(worker, message))
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.release(worker)
+
+    def handle(self, worker, message):
+        """
+        Answers a message of a worker.
+        :param worker: Worker number
+        :param message: Dictionary with the message type and its fields
+        :return: Reply (dictionary)
+        """
+        if not isinstance(message, dict):
+            return {'type': 'error', 'message': 'Messages must be JSON objects'}
+        kind = message.get('type')
+        try:
+            prime = message.get('prime')
+            prime = decode_int(prime) if prime is not None else None
+            progress = decode_int(message['progress']) if kind == 'heartbeat' else None
+        except (KeyError, TypeError, ValueError):
+            return {'type': 'error', 'message': 'Invalid prime or progress'}
+
+        with self.lock:
+            if kind == 'hello':
+                return {'type': 'welcome', 'worker': worker,
+                        'engine': self.engine, 'generator': self.generator,
+                        'heartbeat': self.heartbeat_timeout / HEARTBEATS_PER_TIMEOUT}
+
+            if prime is not None:
+                self.max_prime = max(self.max_prime, prime)
+
+            if kind == 'heartbeat':
+                assignment = self.assignments.get(worker)
+                if assignment is not None:
+                    assignment[1] = progress
+                    assignment[2] = time.time()
+                return self.reply('ack')
+
+            if kind == 'result':
+                self.assignments.pop(worker, None)
+                return self.reply('ack')
+
+            if kind == 'request':
+                if self.finished:
+                    return self.reply('done')
+                block = self.take_block()
+                if block is None:
+                    return self.reply('done' if self.finished else 'wait')
+                lo, hi = block
+                self.assignments[worker] = [lo, hi, time.time()]
+                return self.reply('block', lo=encode_int(lo), hi=encode_int(hi))
+
+            return {'type': 'error', 'message': f'Unknown message type: {kind}'}
+
+    def reply(self, kind, **fields):
+        """Reply with the current maximum (call with the lock held)."""
+        return {'type': 'done' if self.finished else kind,
+                'max': encode_int(self.max_prime), **fields}
+
+    def take_block(self):
+        """
+        Next block that can beat the maximum, lost blocks first (call with
+        the lock held).
+        :return: Tuple (lo, hi), or None if there is none right now
+        """
+        while self.pending:
+            lo, hi = self.pending.pop()
+            if hi > self.max_prime + 1:
+                return lo, hi
+        if not self.exhausted:
+            block = self.scheduler.next_block(self.max_prime)
+            if block is not None:
+                return block
+            self.exhausted = True
+        if not self.assignments:
+            self.finished = True
+        return None
+
+    def release(self, worker):
+        """
+        Queues the unfinished part of the block of a lost worker.
+        :param worker: Worker number
+        :return: None
+        """
+        with self.lock:
+            assignment = self.assignments.pop(worker, None)
+            if assignment is not None and assignment[0] < assignment[1]:
+                self.pending.append((assignment[0], assignment[1]))
+
+    def reap(self):
+        """
+        Reassigns the blocks of the workers silent for too long.
+        :return: None
+        """
+        deadline = time.time() - self.heartbeat_timeout
+        with self.lock:
+            silent = [worker for worker, (_, _, seen) in self.assignments.items()
+                      if seen < deadline]
+        for worker in silent:
+            self.release(worker)
+
+    def serve(self, timeout=None):
+        """
+        Runs the search until the timeout, the target or the end of the
+        search space.
+        :param timeout: Seconds to search, None for no time limit
+        :return: Maximum prime number found
+        """
+        timeout = math.inf if timeout is None else timeout
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        start_time = time.time()
+        try:
+            while time.time() - start_time < timeout:
+                time.sleep(min(self.heartbeat_timeout / HEARTBEATS_PER_TIMEOUT,
+                               max(timeout - (time.time() - start_time), 0)))
+                self.reap()
+                with self.lock:
+                    if self.target is not None and self.max_prime >= self.target:
+                        self.finished = True
+                    if self.finished:
+                        break
+        except KeyboardInterrupt:
+            # Ends the search, keeping the maximum found so far
+            pass
+        try:
+            with self.lock:
+                self.finished = True
+            # Lets the workers hear that the search is over
+            time.sleep(SHUTDOWN_GRACE)
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+        return self.max_prime
+
+
+def run_remote_worker(host, port=DEFAULT_PORT, timeout=None, refresh_interval=1):
+    """
+    Searches the blocks handed out by a coordinator until it is done.
+    :param host: Address of the coordinator
+    :param port: Port of the coordinator
+    :param timeout: Seconds to search, None until the coordinator is done
+    :param refresh_interval: Candidates tested between checks for a heartbeat
+    :return: Final report of the worker counters (see stats.WorkerStats)
+    """
+    deadline = Deadline(timeout)
+
+    with socket.create_connection((host, port)) as sock:
+        file = sock.makefile('rwb')
+
+        def call(kind, **fields):
+            send_message(file, {'type': kind, **fields})
+            reply = receive_message(file)
+            if reply is None:
+                raise ConnectionError('The coordinator closed the connection')
+            return reply
+
+        welcome = call('hello')
+        stats = WorkerStats(welcome['worker'])
+        check = primality.get_engine(welcome['engine'])
+        block_generator = GENERATORS[welcome['generator']](1)
+        interval = welcome['heartbeat']
+
+        try:
+            while not deadline.poll():
+                reply = call('request')
+                if reply['type'] == 'done':
+                    break
+                if reply['type'] == 'wait':
+                    time.sleep(interval)
+                    continue
+
+                lo, hi = decode_int(reply['lo']), decode_int(reply['hi'])
+                state = {'max': decode_int(reply['max']), 'beat': time.time()}
+
+                def refresh(candidate):
+                    if deadline.check():
+                        return None
+                    if time.time() - state['beat'] >= interval:
+                        beat = call('heartbeat', progress=encode_int(candidate + 1))
+                        if beat['type'] == 'done':
+                            return None
+                        state['max'] = decode_int(beat['max'])
+                        state['beat'] = time.time()
+                    return state['max']
+
+                prime, finished = scan_block(lo, hi, block_generator, check, refresh,
+                                             refresh_interval, stats)
+                if not finished:
+                    break
+                call('result', prime=encode_int(prime) if prime is not None else None)
+        except ConnectionError:
+            pass
+
+    return stats.report(final=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Searches for the largest prime number on several hosts.')
+    commands = parser.add_subparsers(dest='command', metavar='command', required=True)
+
+    coordinator_parser = commands.add_parser('coordinator', help='hand out the blocks of the search')
+    coordinator_parser.add_argument('--host', default='0.0.0.0',
+                                    help='address to listen on')
+    coordinator_parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                                    help='port to listen on')
+    coordinator_parser.add_argument('--engine', default=primality.DEFAULT_ENGINE,
+                                    choices=list(primality.ENGINES),
+                                    help='primality engine of the workers')
+    coordinator_parser.add_argument('--generator', default=DEFAULT_GENERATOR,
+                                    choices=list(GENERATORS),
+                                    help='candidate generator of the workers')
+    coordinator_parser.add_argument('-t', '--timeout', type=float,
+                                    help='time budget in seconds (default: no limit)')
+    coordinator_parser.add_argument('--target-digits', type=int,
+                                    help='stop once a prime with this many digits is found')
+    coordinator_parser.add_argument('--upper-bound', type=parse_int,
+                                    help='only search primes below this bound (e.g. 10**100)')
+    coordinator_parser.add_argument('--heartbeat-timeout', type=float,
+                                    default=DEFAULT_HEARTBEAT_TIMEOUT,
+                                    help='seconds without news before a block is reassigned')
+
+    worker_parser = commands.add_parser('worker', help='search the blocks of a coordinator')
+    worker_parser.add_argument('host', help='address of the coordinator')
+    worker_parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                               help='port of the coordinator')
+    worker_parser.add_argument('-p', '--processes', type=int, default=os.cpu_count() or 1,
+                               help='number of worker processes (default: one per CPU)')
+    worker_parser.add_argument('-t', '--timeout', type=float,
+                               help='time budget in seconds (default: until the coordinator is done)')
+    args = parser.parse_args()
+
+    if args.command == 'coordinator':
+        target = 10 ** (args.target_digits - 1) if args.target_digits else None
+        scheduler = BlockScheduler(growth=DEFAULT_GROWTH, blocks_per_level=1,
+                                   limit=args.upper_bound)
+        coordinator = Coordinator(args.host, args.port, scheduler, args.engine,
+                                  args.generator, args.heartbeat_timeout, target)
+        max_prime = coordinator.serve(args.timeout)
+        print(f"{max_prime} ({primality.count_digits(max_prime)})")
+    else:
+        workers = [multiprocessing.Process(target=run_remote_worker,
+                                           args=(args.host, args.port, args.timeout))
+                   for _ in range(args.processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
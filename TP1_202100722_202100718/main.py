@@ -1,74 +1,796 @@
+import argparse
 import math
 import multiprocessing
+import os
+import signal
+import sys
 import time
+from collections import deque
+from queue import Empty
 
+import primality
+import sieve
+import special
+import streaming
+import vectorized
+import wheel
+from checkpoint import load_checkpoint, save_checkpoint
+from deadline import Deadline
+from scheduler import DEFAULT_GROWTH, BlockScheduler
+from shared_state import SharedBlock, SharedInt
+from stats import WorkerStats, aggregate, format_report
 
-def is_prime(n):
+# Candidates tested between reads of the shared maximum
+DEFAULT_REFRESH_INTERVAL = 64
+
+# Seconds between checkpoints
+DEFAULT_CHECKPOINT_INTERVAL = 5
+
+# Candidate generators, by name: built with the step of the progression,
+# their survivors(value, count) method returns the candidates of a window
+GENERATORS = {
+    'sieve': sieve.ProgressionSieve,
+    'wheel': wheel.WheelProgression,
+    'vector': vectorized.VectorProgression,
+}
+
+DEFAULT_GENERATOR = 'sieve'
+
+# Work distribution strategies: shared blocks from the top (BlockScheduler),
+# one fixed arithmetic progression per worker, or numbers of special form
+# (Mersenne numbers with Lucas-Lehmer, Proth numbers with Proth's theorem)
+SCHEDULERS = ('blocks', 'progression', 'mersenne', 'proth')
+
+# Schedulers with their own primality tests and candidates (no engine or generator)
+SPECIAL_SCHEDULERS = ('mersenne', 'proth')
+
+DEFAULT_SCHEDULER = 'blocks'
+
+# Time budget when no other stopping condition is given, in seconds
+DEFAULT_TIMEOUT = 60
+
+# Seconds between checks of the target by the main process
+CANCEL_POLL_INTERVAL = 0.1
+
+# Block size of the descending search, in average prime gaps (ln N) near N
+GAP_WINDOWS = 4
+
+# Smallest block size of the descending search
+MIN_GAP_WINDOW = 64
+
+
+def is_prime(n, engine=primality.DEFAULT_ENGINE):
     """
-    Check if a number is prime, using the form 6k+-1.
+    Check if a number is prime, using one of the primality engines.
     :param n: Number to check
+    :param engine: Name of the primality engine (see primality.ENGINES)
     :return: True if the number is prime, False otherwise
     """
-    if n <= 1:
-        return False
-    elif n <= 3:
-        return True
-    elif n % 2 == 0 or n % 3 == 0:
-        return False
-    i = 5
-    while i * i <= int(math.sqrt(n)):
-        if n % i == 0 or n % (i + 2) == 0:
-            return False
-        i += 6
-    return True
+    return primality.is_prime(n, engine)
 
 
-def find_max_prime(timeout, shared_max_prime, lock, value, step):
+def find_max_prime(timeout, shared_max_prime, value, step,
+                   window=sieve.DEFAULT_WINDOW,
+                   refresh_interval=DEFAULT_REFRESH_INTERVAL,
+                   generator=DEFAULT_GENERATOR, frontier=None,
+                   engine=primality.DEFAULT_ENGINE, results=None, worker=0,
+                   stats_interval=None, target=None, upper_bound=None,
+                   cancel=None):
     """
     Find the maximum prime number in a given range.
-    :param timeout: Time limit for the worker
-    :param shared_max_prime: Maximum prime number found so far
-    :param lock: Lock to access the shared maximum prime number
+    Candidates are generated a window at a time, so only the ones without
+    small prime factors reach the primality test.
+    :param timeout: Time limit for the worker, None for no limit
+    :param shared_max_prime: Maximum prime number found so far (SharedInt)
     :param value: Value to search
     :param step: Value to increment the search
+    :param window: Number of candidates sieved at once
+    :param refresh_interval: Candidates tested between reads of the shared maximum
+    :param generator: Name of the candidate generator (see GENERATORS)
+    :param frontier: SharedInt updated with the next value to search, if any
+    :param engine: Name of the primality engine (see primality.ENGINES)
+    :param results: Queue that receives the worker reports (WorkerStats), if any
+    :param worker: Worker number, for the reports
+    :param stats_interval: Seconds between live reports, None for a final report only
+    :param target: Stop once the maximum reaches this value, if any
+    :param upper_bound: Only search values below this bound, if any
+    :param cancel: Event shared by the workers, set to stop them early, if any
+    :return: None
+    """
+    deadline = Deadline(timeout, cancel)
+    progression = GENERATORS[generator](step)
+    check = primality.get_engine(engine)
+    stats = WorkerStats(worker, results, stats_interval)
+    shared_max_prime.stats = stats
+
+    while not deadline.poll():
+        # Local copy of the shared maximum, refreshed periodically
+        current_max = shared_max_prime.value
+        if target is not None and current_max >= target:
+            break
+        if value <= current_max:
+            value = current_max + step
+        count = window
+        if upper_bound is not None:
+            if value >= upper_bound:
+                break
+            count = min(window, (upper_bound - value + step - 1) // step)
+        if frontier is not None:
+            frontier.value = value
+
+        candidates = progression.survivors(value, count)
+        stats.window(count, len(candidates))
+        for i, candidate in enumerate(candidates):
+            if deadline.check():
+                break
+            if i % refresh_interval == 0:
+                current_max = shared_max_prime.value
+                stats.tick()
+            if candidate > current_max:
+                stats.tested += 1
+                if check(candidate):
+                    stats.primes += 1
+                    shared_max_prime.update_max(candidate)
+                    current_max = candidate
+
+        value += count * step
+
+    stats.publish(final=True)
+
+
+def scan_block(lo, hi, block_generator, check, refresh,
+               refresh_interval=DEFAULT_REFRESH_INTERVAL, stats=None):
+    """
+    Sieves a block and tests it from the top, stopping at its first prime
+    or at the maximum found so far.
+    :param lo: Lower bound of the block (inclusive)
+    :param hi: Upper bound of the block (exclusive)
+    :param block_generator: Candidate generator with step 1
+    :param check: Primality test
+    :param refresh: Function called every refresh_interval candidates with
+                    the next candidate, returning the maximum found so far,
+                    or None to stop
+    :param refresh_interval: Candidates tested between calls to refresh
+    :param stats: WorkerStats updated with the counters, if any
+    :return: Tuple (prime found or None, whether the block was finished)
+    """
+    stats = stats or WorkerStats(None)
+    candidates = block_generator.survivors(lo, hi - lo)
+    stats.window(hi - lo, len(candidates))
+    for i, candidate in enumerate(reversed(candidates)):
+        if i % refresh_interval == 0:
+            stats.tick()
+            current_max = refresh(candidate)
+            if current_max is None:
+                return None, False
+        if candidate <= current_max:
+            break
+        stats.tested += 1
+        if check(candidate):
+            stats.primes += 1
+            return candidate, True
+    return None, True
+
+
+def find_max_prime_in_blocks(timeout, shared_max_prime, scheduler,
+                             refresh_interval=DEFAULT_REFRESH_INTERVAL,
+                             generator=DEFAULT_GENERATOR, frontier=None,
+                             blocks=(), engine=primality.DEFAULT_ENGINE,
+                             results=None, worker=0, stats_interval=None,
+                             target=None, cancel=None):
+    """
+    Find the maximum prime number in the blocks handed out by a scheduler.
+    Each block is sieved and tested from the top, stopping at its first prime.
+    :param timeout: Time limit for the worker, None for no limit
+    :param shared_max_prime: Maximum prime number found so far (SharedInt)
+    :param scheduler: Shared BlockScheduler
+    :param refresh_interval: Candidates tested between reads of the shared maximum
+    :param generator: Name of the candidate generator (see GENERATORS)
+    :param frontier: SharedBlock updated with the unfinished part of the block, if any
+    :param blocks: Blocks (lo, hi) to finish before taking new ones
+    :param engine: Name of the primality engine (see primality.ENGINES)
+    :param results: Queue that receives the worker reports (WorkerStats), if any
+    :param worker: Worker number, for the reports
+    :param stats_interval: Seconds between live reports, None for a final report only
+    :param target: Stop once the maximum reaches this value, if any
+    :param cancel: Event shared by the workers, set to stop them early, if any
+    :return: None
+    """
+    deadline = Deadline(timeout, cancel)
+    block_generator = GENERATORS[generator](1)
+    check = primality.get_engine(engine)
+    stats = WorkerStats(worker, results, stats_interval)
+    shared_max_prime.stats = stats
+    pending = list(blocks)
+
+    while not deadline.poll():
+        current_max = shared_max_prime.value
+        if target is not None and current_max >= target:
+            break
+        if pending:
+            block = pending.pop()
+            if frontier is not None:
+                frontier.set(*block)
+        else:
+            # Registered in the frontier under the lock of the cursor
+            block = scheduler.next_block(current_max, frontier)
+        if block is None:
+            break
+        lo, hi = block
+
+        def refresh(candidate):
+            if frontier is not None:
+                frontier.set(lo, candidate + 1)
+            if deadline.poll():
+                return None
+            return shared_max_prime.value
+
+        prime, finished = scan_block(lo, hi, block_generator, check, refresh,
+                                     refresh_interval, stats)
+        if prime is not None:
+            shared_max_prime.update_max(prime)
+
+        if finished and frontier is not None:
+            frontier.set(lo, lo)
+
+    stats.publish(final=True)
+
+
+def find_mersenne_prime(timeout, shared_max_prime, scheduler, frontier=None,
+                        exponents=(), results=None, worker=0,
+                        stats_interval=None, target=None, cancel=None):
+    """
+    Find the maximum Mersenne prime 2^p - 1, over the exponents handed out
+    by a scheduler. Exponents with a small factor are skipped; the others
+    are checked with Lucas-Lehmer.
+    :param timeout: Time limit for the worker, None for no limit
+    :param shared_max_prime: Maximum prime number found so far (SharedInt)
+    :param scheduler: Shared special.MersenneScheduler
+    :param frontier: SharedInt updated with the exponent being checked (0 when idle), if any
+    :param exponents: Exponents to check before taking new ones
+    :param results: Queue that receives the worker reports (WorkerStats), if any
+    :param worker: Worker number, for the reports
+    :param stats_interval: Seconds between live reports, None for a final report only
+    :param target: Stop once the maximum reaches this value, if any
+    :param cancel: Event shared by the workers, set to stop them early, if any
+    :return: None
+    """
+    deadline = Deadline(timeout, cancel)
+    stats = WorkerStats(worker, results, stats_interval)
+    shared_max_prime.stats = stats
+    pending = list(exponents)
+
+    while not deadline.poll():
+        current_max = shared_max_prime.value
+        stats.tick()
+        if target is not None and current_max >= target:
+            break
+        if pending:
+            p = pending.pop()
+            if frontier is not None:
+                frontier.value = p
+        else:
+            p = scheduler.next_exponent(frontier)
+        if p is None:
+            break
+
+        has_factor = p > 2 and special.mersenne_factor(p) is not None
+        stats.window(1, 0 if has_factor else 1)
+        if not has_factor and (1 << p) - 1 > current_max:
+            stats.tested += 1
+            verdict = special.lucas_lehmer(p, deadline)
+            if verdict is None:
+                break
+            if verdict:
+                stats.primes += 1
+                shared_max_prime.update_max((1 << p) - 1)
+
+        if frontier is not None:
+            frontier.value = 0
+
+    stats.publish(final=True)
+
+
+def find_proth_prime(timeout, shared_max_prime, scheduler,
+                     refresh_interval=DEFAULT_REFRESH_INTERVAL, frontier=None,
+                     results=None, worker=0, stats_interval=None, target=None,
+                     cancel=None):
+    """
+    Find the maximum Proth prime k * 2^n + 1, over the batches handed out by
+    a scheduler. Batches are sieved as the progression of step 2^(n + 1) and
+    the survivors are checked with Proth's theorem.
+    :param timeout: Time limit for the worker, None for no limit
+    :param shared_max_prime: Maximum prime number found so far (SharedInt)
+    :param scheduler: Shared special.ProthScheduler
+    :param refresh_interval: Candidates tested between reads of the shared maximum
+    :param frontier: SharedBlock updated with the batch (n, k) being checked ((0, 0) when idle), if any
+    :param results: Queue that receives the worker reports (WorkerStats), if any
+    :param worker: Worker number, for the reports
+    :param stats_interval: Seconds between live reports, None for a final report only
+    :param target: Stop once the maximum reaches this value, if any
+    :param cancel: Event shared by the workers, set to stop them early, if any
+    :return: None
+    """
+    deadline = Deadline(timeout, cancel)
+    stats = WorkerStats(worker, results, stats_interval)
+    shared_max_prime.stats = stats
+    progressions = {}
+
+    while not deadline.poll():
+        current_max = shared_max_prime.value
+        if target is not None and current_max >= target:
+            break
+        batch = scheduler.next_batch(current_max, frontier)
+        if batch is None:
+            break
+        n, k, count = batch
+        if n not in progressions:
+            progressions.clear()
+            progressions[n] = sieve.ProgressionSieve(1 << (n + 1))
+
+        finished = True
+        candidates = progressions[n].survivors((k << n) + 1, count)
+        stats.window(count, len(candidates))
+        for i, candidate in enumerate(candidates):
+            if i % refresh_interval == 0:
+                current_max = shared_max_prime.value
+                stats.tick()
+                if deadline.poll():
+                    finished = False
+                    break
+            # Another worker already found a prime with this exponent
+            if current_max.bit_length() > n:
+                break
+            if scheduler.limit is not None and candidate >= scheduler.limit:
+                break
+            stats.tested += 1
+            if special.proth_test(candidate >> n, n):
+                stats.primes += 1
+                shared_max_prime.update_max(candidate)
+                current_max = shared_max_prime.value
+
+        if finished and frontier is not None:
+            frontier.set(0, 0)
+
+    stats.publish(final=True)
+
+
+def run_worker(cpu, strategy, *args, **kwargs):
+    """
+    Runs a worker strategy, pinned to a CPU when given. Interrupts are left
+    to the main process, which stops the workers through the cancel event.
+    :param cpu: CPU for the worker process, None to leave it unpinned
+    :param strategy: Worker strategy (find_max_prime or find_max_prime_in_blocks)
+    :return: None
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if cpu is not None:
+        os.sched_setaffinity(0, {cpu})
+    strategy(*args, **kwargs)
+
+
+def worker_cpus(num_processes, affinity):
+    """
+    CPUs the worker processes are pinned to.
+    :param num_processes: Number of worker processes
+    :param affinity: Pin every worker process to its own CPU
+    :return: List with a CPU (or None, unpinned) per worker
+    """
+    if not affinity:
+        return [None] * num_processes
+    available = sorted(os.sched_getaffinity(0))
+    return [available[p % len(available)] for p in range(num_processes)]
+
+
+def drain(queue, items):
+    """
+    Moves the items waiting in a queue to a list, without blocking.
+    :param queue: Multiprocessing queue
+    :param items: List (or deque) that receives the items
     :return: None
     """
+    while True:
+        try:
+            items.append(queue.get_nowait())
+        except Empty:
+            return
+
+
+def run_search(num_processes, worker_timeout, checkpoint_path=None,
+               checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL, resume=False,
+               engine=primality.DEFAULT_ENGINE, generator=DEFAULT_GENERATOR,
+               stats_interval=None, on_report=None, scheduler=DEFAULT_SCHEDULER,
+               target_digits=None, upper_bound=None, affinity=False):
+    """
+    Runs the prime search on several worker processes.
+    :param num_processes: Number of worker processes
+    :param worker_timeout: Timeout for each worker, None for no time limit
+    :param checkpoint_path: File for periodic checkpoints, None to disable them
+    :param checkpoint_interval: Seconds between checkpoints
+    :param resume: Restart from the checkpoint file
+    :param engine: Name of the primality engine (see primality.ENGINES)
+    :param generator: Name of the candidate generator (see GENERATORS)
+    :param stats_interval: Seconds between live worker reports, None for final reports only
+    :param on_report: Function called with every worker report, live or final
+    :param scheduler: Work distribution strategy (see SCHEDULERS)
+    :param target_digits: Stop once a prime with this many digits is found, if any
+    :param upper_bound: Only search primes below this bound, if any
+    :param affinity: Pin every worker process to its own CPU
+    :return: Tuple (maximum prime number found, list of final worker reports),
+             also when the search is interrupted
+    """
+    if scheduler not in SCHEDULERS:
+        raise ValueError(f'Unknown scheduler: {scheduler}')
+    target = 10 ** (target_digits - 1) if target_digits else None
+
+    # Max prime number
+    max_prime = SharedInt(1)
+
+    # Shared queue of work: blocks of the search space (one per level, with
+    # growing levels), Mersenne exponents or Proth batches
+    if scheduler == 'mersenne':
+        limit = upper_bound.bit_length() - 1 if upper_bound else None
+        work_queue = special.MersenneScheduler(limit=limit)
+    elif scheduler == 'proth':
+        work_queue = special.ProthScheduler(limit=upper_bound)
+    else:
+        work_queue = BlockScheduler(growth=DEFAULT_GROWTH, blocks_per_level=1,
+                                    limit=upper_bound)
+
+    # Unfinished blocks or batches, or next values or exponents, per worker
+    if scheduler in ('blocks', 'proth'):
+        frontiers = [SharedBlock() for _ in range(num_processes)]
+    else:
+        frontiers = [SharedInt() for _ in range(num_processes)]
+    resumed = [[] for _ in range(num_processes)]
+    resumed_values = []
+    elapsed = 0.0
+
+    if resume:
+        state = load_checkpoint(checkpoint_path)
+        if state['scheduler_kind'] != scheduler:
+            raise ValueError(f'The checkpoint was written by the {state["scheduler_kind"]} '
+                             f'scheduler, not {scheduler}')
+        max_prime.value = state['max_prime']
+        if state['scheduler'] is not None and scheduler != 'progression':
+            work_queue.cursor = state['scheduler']
+        for i, item in enumerate(state['blocks'] if scheduler == 'blocks' else state['values']):
+            resumed[i % num_processes].append(item)
+        resumed_values = state['values']
+        elapsed = state['elapsed']
+
+    def save():
+        if checkpoint_path is None:
+            return
+        elapsed_time = elapsed + time.time() - start_time
+        # The cursor is read before the frontiers: work taken in between is
+        # already in its frontier, so it is saved twice rather than lost
+        cursor = work_queue.cursor
+        if scheduler == 'blocks':
+            blocks = [block for block in (f.get() for f in frontiers)
+                      if block[0] < block[1]]
+            save_checkpoint(checkpoint_path, max_prime.value, cursor,
+                            blocks, elapsed=elapsed_time, scheduler_kind=scheduler)
+        elif scheduler == 'mersenne':
+            exponents = [f.value for f in frontiers if f.value]
+            save_checkpoint(checkpoint_path, max_prime.value, cursor,
+                            values=exponents, elapsed=elapsed_time,
+                            scheduler_kind=scheduler)
+        elif scheduler == 'proth':
+            # Rewound to the earliest unfinished batch
+            batches = [batch for batch in (f.get() for f in frontiers) if batch[0]]
+            save_checkpoint(checkpoint_path, max_prime.value, min(batches + [cursor]),
+                            elapsed=elapsed_time, scheduler_kind=scheduler)
+        else:
+            save_checkpoint(checkpoint_path, max_prime.value,
+                            values=[f.value for f in frontiers],
+                            elapsed=elapsed_time, scheduler_kind=scheduler)
+
+    def collect():
+        # Reports are taken one at a time, finals kept first, so an
+        # interrupt in on_report loses none of them
+        drain(results, received)
+        while received:
+            report = received.popleft()
+            if report['final']:
+                reports.append(report)
+            if on_report is not None:
+                on_report(report)
+
+    cpus = worker_cpus(num_processes, affinity)
+
+    # Worker processes, reporting through the results queue and stopped
+    # early through the cancel event
+    results = multiprocessing.Queue()
+    cancel = multiprocessing.Event()
+    reports = []
+    received = deque()
+    workers = []
+    for p in range(num_processes):
+        kwargs = {'frontier': frontiers[p],
+                  'cancel': cancel,
+                  'results': results,
+                  'worker': p,
+                  'stats_interval': stats_interval,
+                  'target': target}
+        if scheduler == 'mersenne':
+            args = (find_mersenne_prime, worker_timeout, max_prime, work_queue)
+            kwargs['exponents'] = resumed[p]
+        elif scheduler == 'proth':
+            args = (find_proth_prime, worker_timeout, max_prime, work_queue)
+        elif scheduler == 'blocks':
+            args = (find_max_prime_in_blocks, worker_timeout, max_prime, work_queue)
+            kwargs.update(blocks=resumed[p], engine=engine, generator=generator)
+        else:
+            start_value = resumed_values[p] if p < len(resumed_values) else 1 + p * (100 ** p)
+            args = (find_max_prime, worker_timeout, max_prime, start_value, 100 ** p)
+            kwargs.update(upper_bound=upper_bound, engine=engine, generator=generator)
+        workers.append(multiprocessing.Process(target=run_worker,
+                                               args=(cpus[p], *args),
+                                               kwargs=kwargs))
+
+    poll_interval = min(checkpoint_interval, stats_interval or checkpoint_interval,
+                        CANCEL_POLL_INTERVAL)
     start_time = time.time()
+    next_checkpoint = start_time + checkpoint_interval
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            while worker.is_alive():
+                worker.join(poll_interval)
+                collect()
+                if target is not None and max_prime.value >= target:
+                    cancel.set()
+                if time.time() >= next_checkpoint:
+                    save()
+                    next_checkpoint += checkpoint_interval
+    except KeyboardInterrupt:
+        # The workers stop at their next check and still report: the queue
+        # is drained while joining them, as a worker only exits once its
+        # reports are flushed to the queue
+        cancel.set()
+        for worker in workers:
+            while worker.is_alive():
+                worker.join(poll_interval)
+                collect()
+    collect()
+    save()
+
+    return max_prime.value, reports
+
+
+def gap_window(n, gaps=GAP_WINDOWS):
+    """
+    Block size of the descending search below n: a few average prime gaps
+    (ln n), so the first blocks are likely to hold a prime.
+    :param n: Upper bound of the search
+    :param gaps: Average prime gaps per block
+    :return: Numbers per block
+    """
+    return max(MIN_GAP_WINDOW, math.ceil(math.log(n) * gaps))
+
+
+def largest_prime_below(n, num_processes, engine=primality.DEFAULT_ENGINE,
+                        generator=DEFAULT_GENERATOR, window=None, affinity=False):
+    """
+    Finds the largest prime below n.
+    The interval below n is split into blocks handed out from the top, and
+    every block is sieved and tested from the top. Once a prime is found,
+    blocks below it are no longer handed out and the workers scanning them
+    stop, while the blocks above it are finished, so the search ends as soon
+    as the prime is confirmed to be the largest.
+    :param n: Upper bound (exclusive)
+    :param num_processes: Number of worker processes
+    :param engine: Name of the primality engine (see primality.ENGINES)
+    :param generator: Name of the candidate generator (see GENERATORS)
+    :param window: Numbers per block (gap_window(n) by default)
+    :param affinity: Pin every worker process to its own CPU
+    :return: Largest prime below n, or None if there is none
+    """
+    if n <= 2:
+        return None
+
+    max_prime = SharedInt(1)
+    scheduler = BlockScheduler(ceiling=n, block_size=window or gap_window(n))
+    cpus = worker_cpus(num_processes, affinity)
+
+    # The shared maximum is read before every candidate, so workers below
+    # the prime stop right away
+    cancel = multiprocessing.Event()
+    workers = [multiprocessing.Process(target=run_worker,
+                                       args=(cpus[p], find_max_prime_in_blocks,
+                                             None, max_prime, scheduler, 1),
+                                       kwargs={'generator': generator,
+                                               'engine': engine,
+                                               'worker': p,
+                                               'cancel': cancel})
+               for p in range(num_processes)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        cancel.set()
+        for worker in workers:
+            worker.join()
+        raise
+
+    return max_prime.value if max_prime.value > 1 else None
 
-    while time.time() - start_time < timeout:
-        if value > shared_max_prime.value:
-            if is_prime(value):
-                with lock:
-                    shared_max_prime.value = value
+
+def parse_int(text):
+    """
+    Parses an integer, also written as a sum of powers (10**12+10**9 or 2^64).
+    :param text: Text to parse
+    :return: Integer
+    """
+    total = 0
+    for term in text.split('+'):
+        for operator in ('**', '^'):
+            if operator in term:
+                base, exponent = term.split(operator, 1)
+                total += int(base) ** int(exponent)
+                break
         else:
-            value = shared_max_prime.value
+            total += int(term)
+    return total
+
+
+def build_parser():
+    """
+    Builds the command-line parser.
+    :return: ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description='Searches for the largest prime number.')
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count() or 1,
+                        help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--affinity', action='store_true',
+                        help='pin every worker process to its own CPU')
+    parser.add_argument('--engine', choices=list(primality.ENGINES),
+                        help=f'primality engine (default: {primality.DEFAULT_ENGINE}; '
+                             'not used by the special-form schedulers)')
+    parser.add_argument('--generator', choices=list(GENERATORS),
+                        help=f'candidate generator (default: {DEFAULT_GENERATOR}; '
+                             'not used by the special-form schedulers)')
+    parser.add_argument('--scheduler', default=DEFAULT_SCHEDULER,
+                        choices=SCHEDULERS,
+                        help='work distribution between the workers, or special-form search')
+    parser.add_argument('-t', '--timeout', type=float,
+                        help=f'time budget in seconds (default: {DEFAULT_TIMEOUT} '
+                             'without another stopping condition)')
+    parser.add_argument('--target-digits', type=int,
+                        help='stop once a prime with this many digits is found')
+    parser.add_argument('--upper-bound', type=parse_int,
+                        help='only search primes below this bound (e.g. 10**100)')
+    parser.add_argument('--below', type=parse_int, metavar='N',
+                        help='find the largest prime below N, searching down from N')
+    parser.add_argument('--checkpoint', metavar='PATH',
+                        help='file where the search progress is saved periodically')
+    parser.add_argument('--checkpoint-interval', type=float,
+                        default=DEFAULT_CHECKPOINT_INTERVAL,
+                        help='seconds between checkpoints')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue the search saved in the checkpoint file')
+    parser.add_argument('--stats', action='store_true',
+                        help='print the counters of every worker at the end')
+    parser.add_argument('--stats-interval', type=float, metavar='SECONDS',
+                        help='also print the worker counters while searching')
+
+    # Without a command, the options above run the maximum prime search
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    enumerate_parser = commands.add_parser('primes', help='list every prime in a range')
+    enumerate_parser.add_argument('start', type=parse_int,
+                                  help='lower bound (inclusive)')
+    enumerate_parser.add_argument('stop', type=parse_int,
+                                  help='upper bound (exclusive), at most 2**64')
+    enumerate_parser.add_argument('-p', '--processes', type=int,
+                                  default=os.cpu_count() or 1,
+                                  help='number of worker processes (default: one per CPU)')
+    enumerate_parser.add_argument('--segment-size', type=parse_int,
+                                  default=streaming.DEFAULT_SEGMENT_SIZE,
+                                  help='numbers sieved per segment')
+    enumerate_parser.add_argument('-o', '--output', metavar='PATH',
+                                  help='binary file for the primes (little-endian uint64)')
+    enumerate_parser.add_argument('--count', action='store_true',
+                                  help='only print how many primes there are')
+    return parser
+
+
+def list_primes(args):
+    """
+    Runs the primes command: prints or writes every prime in a range.
+    :param args: Parsed command-line arguments
+    :return: None
+    """
+    if args.output:
+        count = streaming.write_primes(args.output, args.start, args.stop,
+                                       args.processes, args.segment_size)
+        print(count)
+        return
+
+    count = 0
+    for chunk in streaming.prime_chunks(args.start, args.stop, args.processes,
+                                        args.segment_size):
+        count += len(chunk)
+        # Segments without primes would print an empty line
+        if chunk and not args.count:
+            print('\n'.join(map(str, chunk)))
+    if args.count:
+        print(count)
+
+
+def main(argv=None):
+    """
+    Command-line entry point.
+    :param argv: Command-line arguments (sys.argv by default)
+    :return: None
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    # Special-form primes can be longer than the int/str conversion limit
+    if hasattr(sys, 'set_int_max_str_digits'):
+        sys.set_int_max_str_digits(0)
+    if args.command == 'primes':
+        if args.stop - 1 > streaming.MAX_VALUE:
+            parser.error('primes only lists primes below 2**64')
+        list_primes(args)
+        return
+
+    if args.resume and not args.checkpoint:
+        parser.error('--resume requires --checkpoint')
+    if args.resume:
+        kind = load_checkpoint(args.checkpoint)['scheduler_kind']
+        if kind != args.scheduler:
+            parser.error(f'the checkpoint was written by the {kind} scheduler, '
+                         f'resume it with --scheduler {kind}')
+    if args.processes < 1:
+        parser.error('--processes must be at least 1')
+    if args.affinity and not hasattr(os, 'sched_setaffinity'):
+        parser.error('--affinity is not supported on this platform')
+    if (args.below is None and args.scheduler in SPECIAL_SCHEDULERS
+            and (args.engine or args.generator)):
+        parser.error(f'--engine and --generator do not apply to the {args.scheduler} scheduler')
+    args.engine = args.engine or primality.DEFAULT_ENGINE
+    args.generator = args.generator or DEFAULT_GENERATOR
+
+    if args.below is not None:
+        start_time = time.time()
+        prime = largest_prime_below(args.below, args.processes, args.engine,
+                                    args.generator, affinity=args.affinity)
+        print(f"{prime} ({primality.count_digits(prime) if prime else 0}) "
+              f"in {time.time() - start_time:.3f} s")
+        return
+
+    timeout = args.timeout
+    if timeout is None and args.target_digits is None and args.upper_bound is None:
+        timeout = DEFAULT_TIMEOUT
+
+    def print_live_report(report):
+        if not report['final']:
+            print(format_report(report))
+
+    max_prime, reports = run_search(args.processes, timeout, args.checkpoint,
+                                    args.checkpoint_interval, args.resume,
+                                    engine=args.engine,
+                                    generator=args.generator,
+                                    stats_interval=args.stats_interval,
+                                    on_report=print_live_report,
+                                    scheduler=args.scheduler,
+                                    target_digits=args.target_digits,
+                                    upper_bound=args.upper_bound,
+                                    affinity=args.affinity)
+
+    # Print the counters of every worker and their totals
+    if args.stats or args.stats_interval:
+        for report in sorted(reports, key=lambda r: r['worker']):
+            print(format_report(report))
+        print(format_report(aggregate(reports)))
 
-        value += step
+    # Print the maximum prime number found
+    print(f"{max_prime} ({primality.count_digits(max_prime)})")
 
 
 if __name__ == '__main__':
-    with multiprocessing.Manager() as manager:
-        # Max prime number
-        max_prime = manager.Value('i', 1)
-
-        # Lock to access the shared maximum prime number
-        smp_lock = manager.Lock()
-
-        # Number of processes
-        num_processes = 8
-
-        # Timeout for each worker
-        worker_timeout = 60
-
-        # Multiprocessing pool
-        with multiprocessing.Pool(num_processes) as pool:
-            pool.starmap(find_max_prime,
-                         [(worker_timeout,
-                           max_prime,
-                           smp_lock,
-                           (1 + p * (100 ** p)),  # Start value
-                           (100 ** p))  # Step
-                          for p in range(num_processes)])
-
-        # Print the maximum prime number found
-        print(f"{max_prime.value} ({len(str(max_prime.value))})")
+    main()
@@ -0,0 +1,278 @@
+"""
+Primality testing engines
+"""
+import math
+
+# Upper bound (exclusive) of the small primes used by the pre-screen
+SMALL_PRIME_LIMIT = 1000
+
+# Deterministic Miller-Rabin witness sets: (bound, witnesses) means that the
+# witnesses decide primality for every n < bound
+MR_WITNESSES = (
+    (2047, (2,)),
+    (1373653, (2, 3)),
+    (25326001, (2, 3, 5)),
+    (3215031751, (2, 3, 5, 7)),
+    (2152302898747, (2, 3, 5, 7, 11)),
+    (3474749660383, (2, 3, 5, 7, 11, 13)),
+    (341550071728321, (2, 3, 5, 7, 11, 13, 17)),
+    (3825123056546413051, (2, 3, 5, 7, 11, 13, 17, 19, 23)),
+    (318665857834031151167461, (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)),
+    (3317044064679887385961981, (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)),
+)
+
+# Numbers below this bound are decided deterministically by Miller-Rabin
+MR_DETERMINISTIC_LIMIT = MR_WITNESSES[-1][0]
+
+
+def primes_up_to(limit):
+    """
+    Sieve of Eratosthenes.
+    :param limit: Upper bound (exclusive)
+    :return: List of the primes below the limit
+    """
+    if limit < 3:
+        return []
+    sieve = bytearray([1]) * limit
+    sieve[0] = sieve[1] = 0
+    for i in range(2, math.isqrt(limit - 1) + 1):
+        if sieve[i]:
+            sieve[i * i::i] = bytes(len(range(i * i, limit, i)))
+    return [i for i, flag in enumerate(sieve) if flag]
+
+
+SMALL_PRIMES = primes_up_to(SMALL_PRIME_LIMIT)
+
+
+def small_prime_screen(n):
+    """
+    Decide primality by trial division with the small primes, when possible.
+    :param n: Number to check
+    :return: True or False if decided, None if n has no small factor
+    """
+    if n < 2:
+        return False
+    for p in SMALL_PRIMES:
+        if n % p == 0:
+            return n == p
+    if n < SMALL_PRIME_LIMIT * SMALL_PRIME_LIMIT:
+        return True
+    return None
+
+
+def trial_division(n):
+    """
+    Check if a number is prime, using the form 6k+-1.
+    :param n: Number to check
+    :return: True if the number is prime, False otherwise
+    """
+    if n <= 1:
+        return False
+    elif n <= 3:
+        return True
+    elif n % 2 == 0 or n % 3 == 0:
+        return False
+    i = 5
+    while i * i <= n:
+        if n % i == 0 or n % (i + 2) == 0:
+            return False
+        i += 6
+    return True
+
+
+def is_strong_probable_prime(n, a):
+    """
+    Strong Fermat (Miller-Rabin) test for an odd n > 2.
+    :param n: Number to check
+    :param a: Witness
+    :return: True if n is a strong probable prime to base a, False otherwise
+    """
+    a %= n
+    if a == 0:
+        return True
+    d = n - 1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    x = pow(a, d, n)
+    if x == 1 or x == n - 1:
+        return True
+    for _ in range(s - 1):
+        x = x * x % n
+        if x == n - 1:
+            return True
+    return False
+
+
+def miller_rabin(n):
+    """
+    Miller-Rabin test with deterministic witness sets.
+    Above MR_DETERMINISTIC_LIMIT the largest witness set is used, so the
+    result is only a strong probable prime.
+    :param n: Number to check
+    :return: True if the number is prime, False otherwise
+    """
+    if n < 4:
+        return n > 1
+    if n % 2 == 0:
+        return False
+    witnesses = MR_WITNESSES[-1][1]
+    for bound, bases in MR_WITNESSES:
+        if n < bound:
+            witnesses = bases
+            break
+    return all(is_strong_probable_prime(n, a) for a in witnesses)
+
+
+def jacobi(a, n):
+    """
+    Jacobi symbol (a/n).
+    :param a: Integer
+    :param n: Odd positive integer
+    :return: -1, 0 or 1
+    """
+    a %= n
+    result = 1
+    while a:
+        while a % 2 == 0:
+            a //= 2
+            if n % 8 in (3, 5):
+                result = -result
+        a, n = n, a
+        if a % 4 == 3 and n % 4 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+
+def is_strong_lucas_probable_prime(n):
+    """
+    Strong Lucas test with Selfridge's parameters, for an odd n > 2.
+    :param n: Number to check
+    :return: True if n is a strong Lucas probable prime, False otherwise
+    """
+    if math.isqrt(n) ** 2 == n:
+        return False
+
+    # First D in 5, -7, 9, -11, ... with (D/n) = -1
+    d = 5
+    while True:
+        j = jacobi(d, n)
+        if j == -1:
+            break
+        if j == 0 and abs(d) != n:
+            return False
+        d = -d - 2 if d > 0 else -d + 2
+    p = 1
+    q = (1 - d) // 4
+
+    # n + 1 = k * 2^s, with k odd
+    k = n + 1
+    s = 0
+    while k % 2 == 0:
+        k //= 2
+        s += 1
+
+    # Compute U_k, V_k and Q^k by binary expansion of k
+    u = 1
+    v = p
+    qk = q % n
+    for bit in bin(k)[3:]:
+        u = u * v % n
+        v = (v * v - 2 * qk) % n
+        qk = qk * qk % n
+        if bit == '1':
+            u, v = (p * u + v) % n, (d * u + p * v) % n
+            if u % 2:
+                u += n
+            u = u // 2
+            if v % 2:
+                v += n
+            v = v // 2
+            qk = qk * q % n
+
+    if u == 0 or v == 0:
+        return True
+    for _ in range(s - 1):
+        v = (v * v - 2 * qk) % n
+        if v == 0:
+            return True
+        qk = qk * qk % n
+    return False
+
+
+def bpsw(n):
+    """
+    Baillie-PSW test: strong base 2 test followed by a strong Lucas test.
+    No composite is known to pass it.
+    :param n: Number to check
+    :return: True if the number is (probably) prime, False otherwise
+    """
+    if n < 4:
+        return n > 1
+    if n % 2 == 0:
+        return False
+    return is_strong_probable_prime(n, 2) and is_strong_lucas_probable_prime(n)
+
+
+def auto(n):
+    """
+    Small-prime pre-screen, then deterministic Miller-Rabin below
+    MR_DETERMINISTIC_LIMIT and BPSW above it.
+    :param n: Number to check
+    :return: True if the number is prime, False otherwise
+    """
+    screened = small_prime_screen(n)
+    if screened is not None:
+        return screened
+    if n < MR_DETERMINISTIC_LIMIT:
+        return miller_rabin(n)
+    return bpsw(n)
+
+
+# Available engines, by name
+ENGINES = {
+    'auto': auto,
+    'trial': trial_division,
+    'miller-rabin': miller_rabin,
+    'bpsw': bpsw,
+}
+
+DEFAULT_ENGINE = 'auto'
+
+
+def get_engine(name):
+    """
+    Returns a primality engine.
+    :param name: Engine name
+    :return: Function that checks if a number is prime
+    """
+    try:
+        return ENGINES[name]
+    except KeyError:
+        raise ValueError(f'Unknown primality engine: {name}') from None
+
+
+def is_prime(n, engine=DEFAULT_ENGINE):
+    """
+    Check if a number is prime.
+    :param n: Number to check
+    :param engine: Name of the primality engine
+    :return: True if the number is prime, False otherwise
+    """
+    return get_engine(engine)(n)
+
+
+def count_digits(n):
+    """
+    Number of decimal digits of an integer, without converting it to a
+    string (str() is limited to 4300 digits since Python 3.11).
+    :param n: Integer
+    :return: Number of digits
+    """
+    n = abs(n)
+    if n < 10:
+        return 1
+    digits = int(n.bit_length() * math.log10(2))
+    return digits + 1 if n >= 10 ** digits else digits
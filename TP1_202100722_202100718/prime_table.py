@@ -0,0 +1,135 @@
+"""
+Shared table of small primes, persisted to a file and memory-mapped
+"""
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_right
+
+import primality
+
+# Default table file, shared by every process of the user (in their cache
+# directory, so other users cannot plant or lock it)
+DEFAULT_TABLE_PATH = os.path.join(os.environ.get('XDG_CACHE_HOME')
+                                  or os.path.join(os.path.expanduser('~'), '.cache'),
+                                  'cpd_tp1', 'primes.bin')
+
+# Header: magic, format version, item size (4 or 8), bound, number of primes.
+# The primes follow as raw unsigned integers, in native byte order
+HEADER = struct.Struct('<4sBB2xQQ')
+MAGIC = b'PRMT'
+TABLE_VERSION = 1
+
+# Tables opened by this process, by path
+_tables = {}
+
+
+class PrimeTable:
+    """
+    Read-only view of a table file: the primes below its bound, as a
+    sequence of integers backed by a memory map, so every process reading
+    the same file shares its pages.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Table file
+        """
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            self._map.close()
+            raise ValueError(f'Not a prime table: {path}')
+        magic, version, itemsize, self.bound, count = HEADER.unpack_from(self._map)
+        end = HEADER.size + count * itemsize
+        # A truncated table would silently miss its largest primes
+        if (magic != MAGIC or version != TABLE_VERSION or itemsize not in (4, 8)
+                or len(self._map) != end):
+            self._map.close()
+            raise ValueError(f'Not a prime table: {path}')
+        typecode = 'I' if itemsize == 4 else 'Q'
+        self.primes = memoryview(self._map)[HEADER.size:end].cast(typecode)
+        self.path = path
+
+    def __len__(self):
+        return len(self.primes)
+
+    def __getitem__(self, index):
+        return self.primes[index]
+
+    def __iter__(self):
+        return iter(self.primes)
+
+    def up_to(self, limit):
+        """
+        :param limit: Upper bound (inclusive), at most the bound of the table
+        :return: Memoryview of the primes up to the limit (not a copy: it
+            keeps the memory map alive after close)
+        """
+        return self.primes[:bisect_right(self.primes, limit)]
+
+    def close(self):
+        """
+        Releases the memory map (and forgets the table, if cached). While
+        views returned by up_to are alive, the map is only unmapped once the
+        last of them is released.
+        :return: None
+        """
+        if _tables.get(self.path) is self:
+            del _tables[self.path]
+        self.primes.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # Views of the map are still exported
+            pass
+
+
+def write_table(path, bound):
+    """
+    Builds the table of the primes below a bound and writes it atomically
+    (temporary file, then rename).
+    :param path: Table file
+    :param bound: Upper bound (exclusive)
+    :return: None
+    """
+    primes = primality.primes_up_to(bound)
+    typecode = 'I' if bound <= 2 ** 32 else 'Q'
+    table = array(typecode, primes)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, TABLE_VERSION, table.itemsize, bound, len(table)))
+        table.tofile(file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_table(bound, path=DEFAULT_TABLE_PATH):
+    """
+    Opens the shared table of the primes below a bound. The file is only
+    rebuilt when it is missing, invalid or smaller than the bound, so it is
+    normally built once and memory-mapped by every process afterwards.
+    :param bound: Upper bound (exclusive) the table must cover
+    :param path: Table file
+    :return: PrimeTable (may cover a larger bound)
+    """
+    table = _tables.get(path)
+    if table is not None and table.bound >= bound:
+        return table
+
+    try:
+        table = PrimeTable(path)
+    except (OSError, ValueError, TypeError, struct.error):
+        table = None
+    if table is None or table.bound < bound:
+        if table is not None:
+            table.close()
+        write_table(path, bound)
+        table = PrimeTable(path)
+
+    _tables[path] = table
+    return table
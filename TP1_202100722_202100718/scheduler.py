@@ -0,0 +1,113 @@
+"""
+Block scheduler for the prime search
+"""
+import multiprocessing
+
+# Numbers per block
+DEFAULT_BLOCK_SIZE = 2 ** 14
+
+# Ceiling of the first level of an open-ended search
+DEFAULT_CEILING = 2 ** 64
+
+# Ceiling multiplier between levels of an open-ended search
+DEFAULT_GROWTH = 2 ** 64
+
+
+class BlockScheduler:
+    """
+    Shared queue of disjoint blocks [lo, hi) of the search space.
+    The space below the ceiling is handed out from the top down, one block
+    per request, skipping blocks that cannot beat the current maximum.
+    With a growth factor the search is open-ended: once a level is used up,
+    the next one starts below ceiling * growth ** level, up to the limit
+    (if any). The level that reaches the limit is searched in full.
+    The queue is a cursor (level, index) in shared memory advanced under a
+    lock, so blocks are produced on demand. Must be shared with the worker
+    processes on creation (process arguments).
+    """
+
+    def __init__(self, ceiling=DEFAULT_CEILING, block_size=DEFAULT_BLOCK_SIZE,
+                 floor=2, growth=None, blocks_per_level=None, limit=None,
+                 ctx=None):
+        """
+        :param ceiling: Upper bound (exclusive) of the first level
+        :param block_size: Numbers per block
+        :param floor: Lower bound (inclusive) of the first level
+        :param growth: Ceiling multiplier between levels, None for a bounded search
+        :param blocks_per_level: Blocks handed out per level, None for all
+        :param limit: Upper bound (exclusive) of every level, None for no bound
+        :param ctx: Multiprocessing context (the default one if omitted)
+        """
+        if block_size <= 0:
+            raise ValueError('The block size must be positive')
+        if growth is not None and growth <= 1:
+            raise ValueError('The growth factor must be greater than 1')
+        ctx = ctx or multiprocessing.get_context()
+        self.ceiling = ceiling
+        self.block_size = block_size
+        self.floor = floor
+        self.growth = growth
+        self.blocks_per_level = blocks_per_level
+        self.limit = limit
+        self.lock = ctx.Lock()
+        self._level = ctx.RawValue('Q', 0)
+        self._index = ctx.RawValue('Q', 0)
+
+    @property
+    def cursor(self):
+        """Position (level, index) of the queue."""
+        with self.lock:
+            return self._level.value, self._index.value
+
+    @cursor.setter
+    def cursor(self, cursor):
+        with self.lock:
+            self._level.value, self._index.value = cursor
+
+    def level_bounds(self, level):
+        """
+        Bounds of a level.
+        :param level: Level number
+        :return: Tuple (floor, ceiling)
+        """
+        if level == 0:
+            floor, ceiling = self.floor, self.ceiling
+        else:
+            growth = self.growth or 1
+            floor = self.ceiling * growth ** (level - 1)
+            ceiling = self.ceiling * growth ** level
+        if self.limit is not None:
+            floor, ceiling = min(floor, self.limit), min(ceiling, self.limit)
+        return floor, ceiling
+
+    def next_block(self, current_max=0, frontier=None):
+        """
+        Takes the next block from the queue.
+        :param current_max: Maximum prime found so far
+        :param frontier: SharedBlock set to the block before the cursor is
+            released, so a checkpoint always sees it in one or the other
+        :return: Tuple (lo, hi) or None if no block can beat the maximum
+        """
+        with self.lock:
+            while True:
+                level = self._level.value
+                index = self._index.value
+                floor, ceiling = self.level_bounds(level)
+                hi = ceiling - index * self.block_size
+                lo = max(hi - self.block_size, floor)
+                last_level = self.growth is None or ceiling == self.limit
+
+                used_up = (hi <= floor or hi <= current_max + 1
+                           or (self.blocks_per_level is not None
+                               and index >= self.blocks_per_level
+                               and not last_level))
+                if not used_up:
+                    if frontier is not None:
+                        frontier.set(lo, hi)
+                    self._index.value = index + 1
+                    return lo, hi
+
+                if last_level:
+                    return None
+                self._level.value = level + 1
+                self._index.value = 0
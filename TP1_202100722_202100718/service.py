@@ -0,0 +1,296 @@
+"""
+Primality query service: batched queries over TCP, a process pool and an LRU cache
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import socketserver
+import threading
+from collections import OrderedDict
+
+import primality
+from checkpoint import decode_int, encode_int
+from distributed import receive_message, send_message
+
+DEFAULT_PORT = 8600
+
+# Verdicts kept by the cache
+DEFAULT_CACHE_SIZE = 2 ** 16
+
+# Numbers below this bound are checked in the server thread, without the pool
+INLINE_LIMIT = 2 ** 64
+
+# Pool tasks per process for the large numbers of a batch (the numbers below
+# INLINE_LIMIT never reach the pool)
+CHUNKS_PER_PROCESS = 4
+
+
+def decode_number(n):
+    """
+    Decodes a queried number. Strings must be hexadecimal with the 0x prefix
+    (as encode_int writes them): a string of decimal digits is ambiguous, so
+    it is rejected rather than read as hexadecimal.
+    :param n: Integer or hexadecimal string
+    :return: Integer
+    """
+    if isinstance(n, str):
+        if not n.lstrip('-').lower().startswith('0x'):
+            raise ValueError(f'Not a 0x-prefixed hexadecimal number: {n}')
+        return decode_int(n)
+    return int(n)
+
+
+class LRUCache:
+    """
+    Bounded mapping that evicts the least recently used entry, counting its
+    hits and misses.
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        """
+        :param maxsize: Number of entries kept
+        """
+        if maxsize <= 0:
+            raise ValueError('The cache size must be positive')
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Looks up an entry, marking it as recently used.
+        :param key: Key
+        :param default: Value returned on a miss
+        :return: Cached value or the default
+        """
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        Adds or updates an entry, evicting the oldest one when full.
+        :param key: Key
+        :param value: Value
+        :return: None
+        """
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    @property
+    def hit_rate(self):
+        """Fraction of the lookups that were hits (0 before any lookup)."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def info(self):
+        """
+        :return: Dictionary with the hits, misses, hit rate, size and maximum size
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate, 'size': len(self),
+                'maxsize': self.maxsize}
+
+
+class PrimalityService:
+    """
+    Answers batches of primality queries: cached verdicts first, then the
+    small numbers in the calling thread and the large ones on a process pool.
+    Safe to share between threads.
+    """
+
+    def __init__(self, processes=None, cache_size=DEFAULT_CACHE_SIZE,
+                 engine=primality.DEFAULT_ENGINE):
+        """
+        :param processes: Number of worker processes (one per CPU by default)
+        :param cache_size: Verdicts kept by the cache
+        :param engine: Name of the primality engine (see primality.ENGINES)
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.check = primality.get_engine(engine)
+        self.cache = LRUCache(cache_size)
+        self.lock = threading.Lock()
+        self.pool = multiprocessing.Pool(self.processes)
+
+    def is_prime(self, numbers):
+        """
+        Checks a batch of numbers.
+        :param numbers: Integers
+        :return: List of verdicts, in the same order
+        """
+        unique = list(dict.fromkeys(numbers))
+        verdicts = {}
+        with self.lock:
+            for n in unique:
+                verdict = self.cache.get(n)
+                if verdict is not None:
+                    verdicts[n] = verdict
+
+        missing = [n for n in unique if n not in verdicts]
+        small = [n for n in missing if n < INLINE_LIMIT]
+        large = [n for n in missing if n >= INLINE_LIMIT]
+        for n in small:
+            verdicts[n] = self.check(n)
+        if large:
+            chunksize = max(1, len(large) // (self.processes * CHUNKS_PER_PROCESS))
+            for n, verdict in zip(large, self.pool.map(self.check, large, chunksize)):
+                verdicts[n] = verdict
+
+        with self.lock:
+            for n in missing:
+                self.cache.put(n, verdicts[n])
+        return [verdicts[n] for n in numbers]
+
+    def stats(self):
+        """
+        :return: Cache statistics (see LRUCache.info)
+        """
+        with self.lock:
+            return self.cache.info()
+
+    def close(self):
+        """
+        Stops the process pool.
+        :return: None
+        """
+        self.pool.terminate()
+        self.pool.join()
+
+
+class PrimalityServer(socketserver.ThreadingTCPServer):
+    """TCP server of a PrimalityService, one thread per client connection."""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        """
+        :param address: Address (host, port) to listen on
+        :param service: PrimalityService
+        """
+        super().__init__(address, PrimalityHandler)
+        self.service = service
+
+
+class PrimalityHandler(socketserver.StreamRequestHandler):
+    """
+    Connection of one client. Messages are lines of JSON: {"type": "query",
+    "numbers": [...]} (0x-prefixed hexadecimal strings or integers) is answered with
+    {"type": "result", "primes": [...]}, and {"type": "stats"} with the
+    cache statistics.
+    """
+
+    def handle(self):
+        while True:
+            try:
+                message = receive_message(self.rfile)
+            except ValueError:
+                send_message(self.wfile, {'type': 'error', 'message': 'Invalid JSON'})
+                continue
+            if message is None:
+                return
+            send_message(self.wfile, self.reply(message))
+
+    def reply(self, message):
+        """
+        :param message: Dictionary with the message type and its fields
+        :return: Reply (dictionary)
+        """
+        if not isinstance(message, dict):
+            return {'type': 'error', 'message': 'Messages must be JSON objects'}
+        kind = message.get('type')
+        if kind == 'query':
+            try:
+                numbers = [decode_number(n) for n in message['numbers']]
+            except (KeyError, TypeError, ValueError):
+                return {'type': 'error', 'message': 'Invalid numbers'}
+            return {'type': 'result', 'primes': self.server.service.is_prime(numbers)}
+        if kind == 'stats':
+            return {'type': 'stats', **self.server.service.stats()}
+        return {'type': 'error', 'message': f'Unknown message type: {kind}'}
+
+
+class PrimalityClient:
+    """
+    Client of a PrimalityServer.
+    """
+
+    def __init__(self, host='localhost', port=DEFAULT_PORT):
+        """
+        :param host: Address of the server
+        :param port: Port of the server
+        """
+        self.sock = socket.create_connection((host, port))
+        self.file = self.sock.makefile('rwb')
+
+    def call(self, message):
+        """
+        Sends a message and waits for the reply.
+        :param message: Dictionary
+        :return: Reply (dictionary)
+        """
+        send_message(self.file, message)
+        reply = receive_message(self.file)
+        if reply is None:
+            raise ConnectionError('The server closed the connection')
+        if reply['type'] == 'error':
+            raise ValueError(reply['message'])
+        return reply
+
+    def is_prime(self, numbers):
+        """
+        :param numbers: Integers
+        :return: List of verdicts, in the same order
+        """
+        return self.call({'type': 'query', 'numbers': [encode_int(n) for n in numbers]})['primes']
+
+    def stats(self):
+        """
+        :return: Cache statistics of the server
+        """
+        reply = self.call({'type': 'stats'})
+        del reply['type']
+        return reply
+
+    def close(self):
+        """
+        Closes the connection.
+        :return: None
+        """
+        self.file.close()
+        self.sock.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Answers primality queries over TCP.')
+    parser.add_argument('--host', default='localhost', help='address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port to listen on')
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count() or 1,
+                        help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help='verdicts kept by the LRU cache')
+    parser.add_argument('--engine', default=primality.DEFAULT_ENGINE,
+                        choices=list(primality.ENGINES), help='primality engine')
+    args = parser.parse_args()
+
+    service = PrimalityService(args.processes, args.cache_size, args.engine)
+    server = PrimalityServer((args.host, args.port), service)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        print(service.stats())
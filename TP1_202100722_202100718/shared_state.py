@@ -0,0 +1,156 @@
+"""
+Shared state between worker processes
+"""
+import multiprocessing
+import time
+
+# Default capacity of a shared integer, in bytes (~157k decimal digits)
+DEFAULT_MAX_BYTES = 1 << 16
+
+
+class SharedInt:
+    """
+    Arbitrary-precision integer in shared memory.
+    The value is stored as signed little-endian bytes in a raw array and
+    written under a native lock. A version counter is bumped on every write,
+    so readers reuse their last decoded value while it is unchanged.
+    Must be shared with the worker processes on creation (process arguments).
+    """
+
+    # WorkerStats of the current process, if attached: counts the reads and
+    # the lock acquisitions (with their wait time)
+    stats = None
+
+    def __init__(self, value=0, max_bytes=DEFAULT_MAX_BYTES, ctx=None):
+        """
+        :param value: Initial value
+        :param max_bytes: Capacity in bytes
+        :param ctx: Multiprocessing context (the default one if omitted)
+        """
+        ctx = ctx or multiprocessing.get_context()
+        self.lock = ctx.Lock()
+        self._buffer = ctx.RawArray('B', max_bytes)
+        self._size = ctx.RawValue('I', 0)
+        self._version = ctx.RawValue('Q', 0)
+        self._cached_version = None
+        self._cached_value = None
+        self._write(value)
+
+    @property
+    def version(self):
+        """Number of writes so far (read without locking)."""
+        return self._version.value
+
+    @property
+    def value(self):
+        """Current value."""
+        if self.stats is not None:
+            self.stats.shared_reads += 1
+        if self._version.value != self._cached_version:
+            self._acquire()
+            try:
+                self._cached_value = self._read()
+                self._cached_version = self._version.value
+            finally:
+                self.lock.release()
+        return self._cached_value
+
+    @value.setter
+    def value(self, value):
+        with self.lock:
+            self._write(value)
+
+    def compare_and_set(self, expected, value):
+        """
+        Replaces the value if it is still the expected one.
+        :param expected: Value the caller last saw
+        :param value: New value
+        :return: True if the value was replaced, False otherwise
+        """
+        with self.lock:
+            if self._read() != expected:
+                return False
+            self._write(value)
+            return True
+
+    def update_max(self, candidate):
+        """
+        Replaces the value if the candidate is greater.
+        :param candidate: Candidate value
+        :return: True if the value was replaced, False otherwise
+        """
+        self._acquire()
+        try:
+            if candidate <= self._read():
+                return False
+            self._write(candidate)
+            return True
+        finally:
+            self.lock.release()
+
+    def _acquire(self):
+        """Acquires the lock, recording it in the attached stats."""
+        if self.stats is None:
+            self.lock.acquire()
+            return
+        start = time.perf_counter()
+        self.lock.acquire()
+        self.stats.lock_wait += time.perf_counter() - start
+        self.stats.lock_acquisitions += 1
+
+    def _bytes(self):
+        """Byte view of the shared buffer."""
+        return memoryview(self._buffer).cast('B')
+
+    def _read(self):
+        """Decodes the value. The lock must be held."""
+        data = self._bytes()[:self._size.value]
+        return int.from_bytes(data, 'little', signed=True)
+
+    def _write(self, value):
+        """Encodes the value. The lock must be held."""
+        size = value.bit_length() // 8 + 1
+        if size > len(self._buffer):
+            raise OverflowError(f'Value needs {size} bytes, the shared '
+                                f'buffer only has {len(self._buffer)}')
+        self._bytes()[:size] = value.to_bytes(size, 'little', signed=True)
+        self._size.value = size
+        self._version.value += 1
+        self._cached_value = value
+        self._cached_version = self._version.value
+
+
+class SharedBlock:
+    """
+    Pair of shared integers (lo, hi), read and written together.
+    Used for the unfinished part of the block a worker is scanning.
+    """
+
+    def __init__(self, lo=0, hi=0, max_bytes=DEFAULT_MAX_BYTES, ctx=None):
+        """
+        :param lo: Initial lower bound
+        :param hi: Initial upper bound
+        :param max_bytes: Capacity in bytes of each bound
+        :param ctx: Multiprocessing context (the default one if omitted)
+        """
+        ctx = ctx or multiprocessing.get_context()
+        self.lock = ctx.Lock()
+        self._lo = SharedInt(lo, max_bytes, ctx)
+        self._hi = SharedInt(hi, max_bytes, ctx)
+
+    def get(self):
+        """
+        :return: Tuple (lo, hi)
+        """
+        with self.lock:
+            return self._lo.value, self._hi.value
+
+    def set(self, lo, hi):
+        """
+        :param lo: Lower bound
+        :param hi: Upper bound
+        :return: None
+        """
+        with self.lock:
+            self._lo.value = lo
+            self._hi.value = hi
@@ -0,0 +1,81 @@
+"""
+Segmented sieve over arithmetic progressions
+"""
+from itertools import compress
+
+import primality
+
+# Upper bound (exclusive) of the primes crossed out by the sieve
+SIEVE_PRIME_LIMIT = 2 ** 15
+
+# Number of candidates sieved at once
+DEFAULT_WINDOW = 4096
+
+SIEVE_PRIMES = primality.primes_up_to(SIEVE_PRIME_LIMIT)
+
+
+class ProgressionSieve:
+    """Crosses out multiples of small primes in value, value + step, ..."""
+
+    def __init__(self, step, primes=None):
+        """
+        :param step: Difference between consecutive candidates
+        :param primes: Primes to cross out (SIEVE_PRIMES by default)
+        """
+        if step <= 0:
+            raise ValueError('The step must be positive')
+        self.step = step
+        self.primes = []
+        self.inverses = []
+        self.step_divisors = []
+        for p in SIEVE_PRIMES if primes is None else primes:
+            if step % p:
+                self.primes.append(p)
+                self.inverses.append(pow(step, -1, p))
+            else:
+                self.step_divisors.append(p)
+
+    def survivors(self, value, count):
+        """
+        Sieves a window of the progression.
+        :param value: First candidate of the window
+        :param count: Number of candidates in the window
+        :return: List of the candidates without small prime factors
+        """
+        step = self.step
+        flags = bytearray(b'\x01') * count
+        zeros = bytes(count)
+
+        for p, inverse in zip(self.primes, self.inverses):
+            # First index whose candidate is a multiple of p
+            k = -value * inverse % p
+            if k < count:
+                flags[k::p] = zeros[:(count - 1 - k) // p + 1]
+                # The prime itself is not crossed out
+                if value <= p and (p - value) % step == 0:
+                    own = (p - value) // step
+                    if own < count:
+                        flags[own] = 1
+
+        for p in self.step_divisors:
+            # Either every candidate is a multiple of p or none is
+            if value % p == 0:
+                own = (p - value) // step if value <= p else count
+                own_flag = flags[own] if own < count else 0
+                flags[:] = zeros
+                if own_flag and value + own * step == p:
+                    flags[own] = 1
+
+        return [value + i * step for i in compress(range(count), flags)]
+
+
+def survivors(value, step, count, primes=None):
+    """
+    Sieves a window of the progression value, value + step, ...
+    :param value: First candidate of the window
+    :param step: Difference between consecutive candidates
+    :param count: Number of candidates in the window
+    :param primes: Primes to cross out (SIEVE_PRIMES by default)
+    :return: List of the candidates without small prime factors
+    """
+    return ProgressionSieve(step, primes).survivors(value, count)
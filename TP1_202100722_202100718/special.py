@@ -0,0 +1,186 @@
+"""
+Primes of special form: Mersenne (2^p - 1) and Proth (k * 2^n + 1)
+"""
+import math
+import multiprocessing
+
+import primality
+
+# Largest trial factor tried on a Mersenne number before Lucas-Lehmer
+MERSENNE_FACTOR_LIMIT = 2 ** 20
+
+# Exponent n of the first Proth level
+DEFAULT_PROTH_EXPONENT = 1024
+
+# Multiplier of the exponent between Proth levels
+PROTH_GROWTH = 1.25
+
+# Values of k (odd) per Proth batch
+DEFAULT_PROTH_BATCH = 64
+
+
+def mersenne_factor(p, limit=MERSENNE_FACTOR_LIMIT):
+    """
+    Looks for a small factor of 2^p - 1 (p an odd prime). Any factor has the
+    form 2kp + 1 and is 1 or 7 modulo 8.
+    :param p: Exponent
+    :param limit: Upper bound (exclusive) of the factors tried
+    :return: Proper factor found, or None
+    """
+    mersenne = (1 << p) - 1
+    for q in range(2 * p + 1, min(limit, mersenne), 2 * p):
+        if q % 8 in (1, 7) and pow(2, p, q) == 1:
+            return q
+    return None
+
+
+def lucas_lehmer(p, deadline=None):
+    """
+    Lucas-Lehmer test of 2^p - 1.
+    :param p: Exponent
+    :param deadline: Deadline checked every iteration, if any
+    :return: Whether 2^p - 1 is prime, or None if the deadline passed first
+    """
+    if p == 2:
+        return True
+    if not primality.is_prime(p):
+        return False
+
+    mersenne = (1 << p) - 1
+    s = 4
+    for _ in range(p - 2):
+        if deadline is not None and deadline.check():
+            return None
+        s = s * s - 2
+        # Reduction modulo 2^p - 1 with a shift and a mask
+        s = (s & mersenne) + (s >> p)
+        if s >= mersenne:
+            s -= mersenne
+    return s == 0
+
+
+def proth_test(k, n):
+    """
+    Proth's theorem: N = k * 2^n + 1, with k odd and k < 2^n, is prime if
+    and only if a^((N - 1) / 2) = -1 (mod N) for a quadratic non-residue a.
+    :param k: Odd multiplier, below 2^n
+    :param n: Exponent
+    :return: Whether k * 2^n + 1 is prime
+    """
+    if k % 2 == 0 or not 0 < k < (1 << n):
+        raise ValueError('Proth numbers need an odd k below 2^n')
+    number = (k << n) + 1
+    for a in primality.SMALL_PRIMES:
+        symbol = primality.jacobi(a, number)
+        if symbol == 0:
+            return number == a
+        if symbol == -1:
+            return pow(a, (number - 1) // 2, number) == number - 1
+    return primality.is_prime(number)
+
+
+class MersenneScheduler:
+    """
+    Shared queue of the prime exponents p, in increasing order. Must be
+    shared with the worker processes on creation (process arguments).
+    """
+
+    def __init__(self, start=2, limit=None, ctx=None):
+        """
+        :param start: Smallest exponent
+        :param limit: Largest exponent, None for no limit
+        :param ctx: Multiprocessing context (the default one if omitted)
+        """
+        ctx = ctx or multiprocessing.get_context()
+        self.limit = limit
+        self.lock = ctx.Lock()
+        self._exponent = ctx.RawValue('Q', start)
+
+    @property
+    def cursor(self):
+        """Position (next exponent,) of the queue."""
+        with self.lock:
+            return (self._exponent.value,)
+
+    @cursor.setter
+    def cursor(self, cursor):
+        with self.lock:
+            self._exponent.value, = cursor
+
+    def next_exponent(self, frontier=None):
+        """
+        Takes the next prime exponent from the queue.
+        :param frontier: SharedInt set to the exponent before the cursor is released
+        :return: Exponent, or None past the limit
+        """
+        with self.lock:
+            p = self._exponent.value
+            while not primality.is_prime(p):
+                p += 1
+            if self.limit is not None and p > self.limit:
+                return None
+            if frontier is not None:
+                frontier.value = p
+            self._exponent.value = p + 1
+            return p
+
+
+class ProthScheduler:
+    """
+    Shared queue of batches of Proth numbers k * 2^n + 1, by increasing k.
+    Once the maximum reaches 2^n, the queue moves on to a larger exponent
+    (n * growth), since any Proth prime with it beats the maximum. Must be
+    shared with the worker processes on creation (process arguments).
+    """
+
+    def __init__(self, exponent=DEFAULT_PROTH_EXPONENT, batch=DEFAULT_PROTH_BATCH,
+                 growth=PROTH_GROWTH, limit=None, ctx=None):
+        """
+        :param exponent: Exponent n of the first level (lowered to fit the limit)
+        :param batch: Values of k per batch
+        :param growth: Multiplier of the exponent between levels
+        :param limit: Upper bound (exclusive) of the numbers, None for no bound
+        :param ctx: Multiprocessing context (the default one if omitted)
+        """
+        if growth <= 1:
+            raise ValueError('The growth factor must be greater than 1')
+        if limit is not None:
+            exponent = max(1, min(exponent, limit.bit_length() // 2))
+        ctx = ctx or multiprocessing.get_context()
+        self.batch = batch
+        self.growth = growth
+        self.limit = limit
+        self.lock = ctx.Lock()
+        self._exponent = ctx.RawValue('Q', exponent)
+        self._k = ctx.RawValue('Q', 1)
+
+    @property
+    def cursor(self):
+        """Position (n, next k) of the queue."""
+        with self.lock:
+            return self._exponent.value, self._k.value
+
+    @cursor.setter
+    def cursor(self, cursor):
+        with self.lock:
+            self._exponent.value, self._k.value = cursor
+
+    def next_batch(self, current_max=0, frontier=None):
+        """
+        Takes the next batch from the queue.
+        :param current_max: Maximum prime found so far
+        :param frontier: SharedBlock set to (n, first k) before the cursor is released
+        :return: Tuple (n, first k, number of k), or None past the limit
+        """
+        with self.lock:
+            n, k = self._exponent.value, self._k.value
+            # Levels whose numbers cannot beat the maximum, or out of k < 2^n
+            while current_max.bit_length() > n or k >= 1 << n:
+                n, k = max(n + 1, math.ceil(n * self.growth)), 1
+            if self.limit is not None and (k << n) + 1 >= self.limit:
+                return None
+            count = min(self.batch, ((1 << n) - k + 1) // 2)
+            if frontier is not None:
+                frontier.set(n, k)
+            self._exponent.value, self._k.value = n, k + 2 * count
+            return n, k, count
@@ -0,0 +1,103 @@
+"""
+Instrumentation of the search workers
+"""
+import time
+
+# Counters kept by every worker
+COUNTERS = ('generated', 'prefiltered', 'tested', 'primes',
+            'lock_acquisitions', 'lock_wait', 'shared_reads')
+
+
+class WorkerStats:
+    """
+    Counters of one worker process.
+    Reports are put on the results queue when the worker stops and, with
+    an interval, periodically while it runs.
+    """
+
+    def __init__(self, worker, results=None, interval=None):
+        """
+        :param worker: Worker number
+        :param results: Queue that receives the reports, if any
+        :param interval: Seconds between live reports, None for a final report only
+        """
+        self.worker = worker
+        self.results = results
+        self.interval = interval
+        self.generated = 0
+        self.prefiltered = 0
+        self.tested = 0
+        self.primes = 0
+        self.lock_acquisitions = 0
+        self.lock_wait = 0.0
+        self.shared_reads = 0
+        self.start_time = time.time()
+        self.next_report = self.start_time + interval if interval else None
+
+    def window(self, generated, survivors):
+        """
+        Counts a window of candidates.
+        :param generated: Candidates in the window
+        :param survivors: Candidates left by the generator
+        :return: None
+        """
+        self.generated += generated
+        self.prefiltered += generated - survivors
+
+    def report(self, final=False):
+        """
+        :param final: Whether the worker has stopped
+        :return: Dictionary with the worker, the elapsed time and the counters
+        """
+        report = {'worker': self.worker, 'final': final,
+                  'elapsed': time.time() - self.start_time}
+        for name in COUNTERS:
+            report[name] = getattr(self, name)
+        return report
+
+    def publish(self, final=False):
+        """
+        Puts a report on the results queue, if any.
+        :param final: Whether the worker has stopped
+        :return: None
+        """
+        if self.results is not None:
+            self.results.put(self.report(final))
+
+    def tick(self):
+        """
+        Publishes a live report when the interval has passed.
+        :return: None
+        """
+        if self.next_report is not None and time.time() >= self.next_report:
+            self.publish()
+            self.next_report += self.interval
+
+
+def aggregate(reports):
+    """
+    Sums the counters of several workers.
+    :param reports: Worker reports
+    :return: Report with the totals (worker 'all', longest elapsed time)
+    """
+    total = {'worker': 'all', 'final': all(r['final'] for r in reports),
+             'elapsed': max((r['elapsed'] for r in reports), default=0.0)}
+    for name in COUNTERS:
+        total[name] = sum(r[name] for r in reports)
+    return total
+
+
+def format_report(report):
+    """
+    :param report: Worker report
+    :return: One-line summary
+    """
+    elapsed = report['elapsed'] or 1e-9
+    return (f"worker {report['worker']}: "
+            f"{report['generated']} generated, "
+            f"{report['prefiltered']} pre-filtered, "
+            f"{report['tested']} tested ({report['tested'] / elapsed:.1f}/s), "
+            f"{report['primes']} primes, "
+            f"{report['lock_acquisitions']} lock acquisitions "
+            f"({report['lock_wait'] * 1000:.2f} ms waiting), "
+            f"{report['shared_reads']} shared reads")
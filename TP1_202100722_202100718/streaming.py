@@ -0,0 +1,165 @@
+"""
+Streaming enumeration of the primes in a range
+"""
+import itertools
+import math
+import multiprocessing
+import sys
+from array import array
+from collections import deque
+
+import prime_table
+import primality
+
+# Numbers per segment (the sieve of a segment holds half as many bytes)
+DEFAULT_SEGMENT_SIZE = 2 ** 22
+
+# Segments queued or finished ahead of the consumer, per worker process
+SEGMENTS_AHEAD = 2
+
+# Largest value of an array('Q') chunk
+MAX_VALUE = 2 ** 64 - 1
+
+# Largest prime used to sieve the segments. Above BASE_PRIME_LIMIT ** 2 the
+# sieve only pre-filters, and the survivors are checked by primality.is_prime
+BASE_PRIME_LIMIT = 2 ** 22
+
+
+def base_primes(limit):
+    """
+    Odd primes up to a limit, from the shared prime table.
+    :param limit: Upper bound (inclusive)
+    :return: Memoryview of the odd primes up to the limit
+    """
+    return prime_table.load_table(limit + 1).up_to(limit)[1:]
+
+
+def sieve_segment(lo, hi):
+    """
+    Segmented sieve of Eratosthenes over the odd numbers of [lo, hi).
+    Beyond BASE_PRIME_LIMIT ** 2 the survivors of the sieve are tested.
+    :param lo: Lower bound (inclusive)
+    :param hi: Upper bound (exclusive), at most 2 ** 64
+    :return: array('Q') of the primes in the segment, in order
+    """
+    if hi - 1 > MAX_VALUE:
+        raise ValueError('Segments must fit in 64 bits')
+    lo = max(lo, 0)
+    chunk = array('Q', [2] if lo <= 2 < hi else [])
+    first = lo | 1
+    if first >= hi:
+        return chunk
+
+    # flags[i] stands for first + 2 * i
+    size = (hi - first + 1) // 2
+    flags = bytearray([1]) * size
+    if first == 1:
+        flags[0] = 0
+    limit = min(math.isqrt(hi - 1), BASE_PRIME_LIMIT)
+    for p in base_primes(limit):
+        start = max(p * p, -(-first // p) * p)
+        if start % 2 == 0:
+            start += p
+        index = (start - first) // 2
+        if index < size:
+            flags[index::p] = bytes(len(range(index, size, p)))
+
+    survivors = itertools.compress(range(first, hi, 2), flags)
+    if limit < math.isqrt(hi - 1):
+        survivors = (n for n in survivors
+                     if n <= limit * limit or primality.is_prime(n))
+    chunk.extend(survivors)
+    return chunk
+
+
+def segments(start, stop, segment_size=DEFAULT_SEGMENT_SIZE):
+    """
+    Splits a range into segments.
+    :param start: Lower bound (inclusive)
+    :param stop: Upper bound (exclusive)
+    :param segment_size: Numbers per segment
+    :return: Generator of (lo, hi) tuples, in order
+    """
+    if segment_size <= 0:
+        raise ValueError('The segment size must be positive')
+    for lo in range(start, stop, segment_size):
+        yield lo, min(lo + segment_size, stop)
+
+
+def prime_chunks(start, stop, processes=None, segment_size=DEFAULT_SEGMENT_SIZE):
+    """
+    Primes in [start, stop), in order, one array('Q') chunk per segment.
+    Segments are sieved on a process pool; only a few segments per process
+    are in flight at a time, so memory stays bounded however large the range.
+    :param start: Lower bound (inclusive)
+    :param stop: Upper bound (exclusive), at most 2 ** 64
+    :param processes: Number of worker processes (one per CPU by default)
+    :param segment_size: Numbers per segment
+    :return: Generator of array('Q') chunks
+    """
+    if stop - 1 > MAX_VALUE:
+        raise ValueError('The range must fit in 64 bits')
+    pending = segments(start, stop, segment_size)
+    processes = processes or multiprocessing.cpu_count()
+
+    # Built before the pool starts, so the workers only map the table file
+    if stop > start:
+        prime_table.load_table(min(math.isqrt(stop - 1), BASE_PRIME_LIMIT) + 1)
+
+    with multiprocessing.Pool(processes) as pool:
+        in_flight = deque()
+        for segment in itertools.islice(pending, processes * SEGMENTS_AHEAD):
+            in_flight.append(pool.apply_async(sieve_segment, segment))
+        while in_flight:
+            chunk = in_flight.popleft().get()
+            for segment in itertools.islice(pending, 1):
+                in_flight.append(pool.apply_async(sieve_segment, segment))
+            yield chunk
+
+
+def primes(start, stop, processes=None, segment_size=DEFAULT_SEGMENT_SIZE):
+    """
+    Primes in [start, stop), in order.
+    :param start: Lower bound (inclusive)
+    :param stop: Upper bound (exclusive), at most 2 ** 64
+    :param processes: Number of worker processes (one per CPU by default)
+    :param segment_size: Numbers per segment
+    :return: Generator of the primes
+    """
+    for chunk in prime_chunks(start, stop, processes, segment_size):
+        yield from chunk
+
+
+def write_primes(path, start, stop, processes=None, segment_size=DEFAULT_SEGMENT_SIZE):
+    """
+    Writes the primes in [start, stop) to a binary file, in order, as
+    little-endian unsigned 64-bit integers.
+    :param path: Output file
+    :param start: Lower bound (inclusive)
+    :param stop: Upper bound (exclusive), at most 2 ** 64
+    :param processes: Number of worker processes (one per CPU by default)
+    :param segment_size: Numbers per segment
+    :return: Number of primes written
+    """
+    count = 0
+    with open(path, 'wb') as file:
+        for chunk in prime_chunks(start, stop, processes, segment_size):
+            if sys.byteorder == 'big':
+                chunk.byteswap()
+            chunk.tofile(file)
+            count += len(chunk)
+    return count
+
+
+def read_primes(path):
+    """
+    Reads a file written by write_primes.
+    :param path: Input file
+    :return: array('Q') of the primes
+    """
+    chunk = array('Q')
+    with open(path, 'rb') as file:
+        chunk.frombytes(file.read())
+    if sys.byteorder == 'big':
+        chunk.byteswap()
+    return chunk
@@ -0,0 +1,675 @@
+"""
+ Tests the prime search
+
+"""
+
+import contextlib
+import io
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+import prime_table
+import primality
+import sieve
+import special
+import streaming
+import vectorized
+import wheel
+from checkpoint import decode_int, encode_int, load_checkpoint, save_checkpoint
+from deadline import Deadline
+from distributed import Coordinator, run_remote_worker
+from scheduler import BlockScheduler
+from service import (LRUCache, PrimalityClient, PrimalityServer, PrimalityService,
+                     decode_number)
+from shared_state import SharedBlock, SharedInt
+from stats import WorkerStats, aggregate
+from main import gap_window, is_prime, largest_prime_below, main, parse_int, run_search
+
+# Composites that fool weaker tests
+CARMICHAEL_NUMBERS = [561, 1105, 1729, 2465, 2821, 6601, 8911, 3215031751]
+STRONG_PSEUDOPRIMES = [2047, 1373653, 25326001, 3825123056546413051,
+                       318665857834031151167461]
+LUCAS_PSEUDOPRIMES = [5459, 5777, 10877, 16109, 18971]
+
+
+class TestPrimality(unittest.TestCase):
+    """Tests the primality engines."""
+
+    def setUp(self):
+        self.primes = set(primality.primes_up_to(20000))
+
+    def testSmallNumbers(self):
+        """Every engine must agree with the sieve on small numbers."""
+        for name, engine in primality.ENGINES.items():
+            for n in range(-2, 20000):
+                self.assertEqual(engine(n), n in self.primes, (name, n))
+
+    def testTrialDivisionBound(self):
+        """Trial division must test divisors up to the square root."""
+        self.assertFalse(primality.trial_division(10007 * 10009))
+
+    def testCarmichaelNumbers(self):
+        """Carmichael numbers are composite."""
+        for n in CARMICHAEL_NUMBERS:
+            self.assertFalse(is_prime(n), n)
+
+    def testStrongPseudoprimes(self):
+        """Strong pseudoprimes to the first prime bases are composite."""
+        for n in STRONG_PSEUDOPRIMES:
+            self.assertFalse(is_prime(n, 'miller-rabin'), n)
+            self.assertFalse(is_prime(n, 'bpsw'), n)
+            self.assertFalse(is_prime(n), n)
+
+    def testLucasPseudoprimes(self):
+        """BPSW must reject strong Lucas pseudoprimes."""
+        for n in LUCAS_PSEUDOPRIMES:
+            self.assertTrue(primality.is_strong_lucas_probable_prime(n))
+            self.assertFalse(primality.bpsw(n), n)
+
+    def testLargePrimes(self):
+        """Large primes must be accepted."""
+        for n in [2 ** 61 - 1, 2 ** 89 - 1, 2 ** 127 - 1, 2 ** 521 - 1]:
+            self.assertTrue(is_prime(n), n)
+            self.assertFalse(is_prime(n * (2 ** 61 - 1)), n)
+
+    def testUnknownEngine(self):
+        """Unknown engines must raise an error."""
+        self.assertRaises(ValueError, is_prime, 7, 'nope')
+
+
+class TestSieve(unittest.TestCase):
+    """Tests the segmented sieve."""
+
+    def testSurvivors(self):
+        """Only candidates without small prime factors survive."""
+        primes = [2, 3, 5, 7]
+        for value, step in [(1, 1), (-10, 3), (1, 30), (7, 14), (100, 7)]:
+            expected = [value + i * step for i in range(200)
+                        if all((value + i * step) % p or value + i * step == p
+                               for p in primes)]
+            self.assertEqual(sieve.survivors(value, step, 200, primes),
+                             expected, (value, step))
+
+    def testKeepsPrimes(self):
+        """The sieve must never cross out a prime."""
+        primes = set(primality.primes_up_to(50000))
+        found = set(sieve.survivors(0, 1, 50000))
+        self.assertTrue(primes <= found)
+
+
+def raise_shared(shared, value):
+    """Worker that raises a shared maximum."""
+    shared.update_max(value)
+
+
+class TestSpecial(unittest.TestCase):
+    """Tests the special-form primes."""
+
+    def testLucasLehmer(self):
+        """Exactly the known Mersenne exponents must pass."""
+        exponents = [p for p in range(2, 700) if special.lucas_lehmer(p)]
+        self.assertEqual(exponents, [2, 3, 5, 7, 13, 17, 19, 31, 61, 89, 107, 127, 521, 607])
+
+    def testLucasLehmerDeadline(self):
+        """Tests past the deadline give up."""
+        self.assertIsNone(special.lucas_lehmer(44497, Deadline(0)))
+
+    def testMersenneFactor(self):
+        """Small factors must be proper factors."""
+        self.assertEqual(special.mersenne_factor(11), 23)
+        self.assertIsNone(special.mersenne_factor(13))
+        self.assertIsNone(special.mersenne_factor(3))
+
+    def testProth(self):
+        """Proth's theorem must agree with the general tests."""
+        for n in range(1, 10):
+            for k in range(1, 2 ** n, 2):
+                self.assertEqual(special.proth_test(k, n), is_prime(k * 2 ** n + 1), (k, n))
+        self.assertRaises(ValueError, special.proth_test, 2, 5)
+
+    def testProthScheduler(self):
+        """Batches move to a larger exponent once the maximum reaches 2^n."""
+        scheduler = special.ProthScheduler(exponent=4, batch=2)
+        self.assertEqual(scheduler.next_batch(), (4, 1, 2))
+        self.assertEqual(scheduler.next_batch(), (4, 5, 2))
+        self.assertEqual(scheduler.next_batch(2 ** 4 + 1), (5, 1, 2))
+
+    def testSearch(self):
+        """Special-form searches plug into the shared maximum."""
+        max_prime, _ = run_search(1, 30, scheduler='mersenne', target_digits=100)
+        self.assertEqual(max_prime, 2 ** 521 - 1)
+        max_prime, _ = run_search(1, 30, scheduler='proth', upper_bound=2 ** 30)
+        self.assertTrue(is_prime(max_prime))
+        self.assertLess(max_prime, 2 ** 30)
+
+
+class TestPrimeTable(unittest.TestCase):
+    """Tests the memory-mapped prime table."""
+
+    def testTable(self):
+        """The table must hold the primes below its bound."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'primes.bin')
+            table = prime_table.load_table(1000, path)
+            self.assertEqual(list(table), primality.primes_up_to(1000))
+            self.assertEqual(list(table.up_to(30)), [2, 3, 5, 7, 11, 13, 17, 19, 23, 29])
+            self.assertEqual(table.primes.itemsize, 4)
+            table.close()
+
+    def testRegeneratedOnlyWhenLarger(self):
+        """Smaller bounds reuse the file, larger ones rebuild it."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'primes.bin')
+            prime_table.write_table(path, 1000)
+            mtime = os.stat(path).st_mtime_ns
+            table = prime_table.PrimeTable(path)
+            self.assertEqual(table.bound, 1000)
+            table.close()
+
+            table = prime_table.load_table(500, path)
+            self.assertEqual(table.bound, 1000)
+            self.assertEqual(os.stat(path).st_mtime_ns, mtime)
+            table = prime_table.load_table(5000, path)
+            self.assertEqual(table.bound, 5000)
+            self.assertEqual(table[-1], 4999)
+            table.close()
+
+    def testInvalidFileIsRebuilt(self):
+        """Corrupt files are replaced."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'primes.bin')
+            with open(path, 'wb') as file:
+                file.write(b'garbage')
+            table = prime_table.load_table(100, path)
+            self.assertEqual(len(table), 25)
+            table.close()
+
+    def testTruncatedFileIsRebuilt(self):
+        """Tables shorter than their header says are replaced."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'primes.bin')
+            prime_table.write_table(path, 10000)
+            size = os.path.getsize(path)
+            for cut in (400, 401):
+                os.truncate(path, size - cut)
+                self.assertRaises(ValueError, prime_table.PrimeTable, path)
+                table = prime_table.load_table(10000, path)
+                self.assertEqual(len(table), 1229)
+                self.assertEqual(table[-1], 9973)
+                table.close()
+
+    def testCloseWithViews(self):
+        """Views returned by up_to outlive the table."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'primes.bin')
+            table = prime_table.load_table(100, path)
+            primes = table.up_to(10)
+            table.close()
+            self.assertEqual(list(primes), [2, 3, 5, 7])
+            primes.release()
+
+
+class TestStreaming(unittest.TestCase):
+    """Tests the streaming prime enumeration."""
+
+    def testSegmentsMatchSieve(self):
+        """Segments of any size must list the same primes, in order."""
+        expected = primality.primes_up_to(2000)
+        for segment_size in (1, 2, 7, 100, 4096):
+            self.assertEqual(list(streaming.primes(0, 2000, 2, segment_size)), expected)
+
+    def testLargeValues(self):
+        """Segments beyond the base primes must still be exact."""
+        for start in (10 ** 12, 2 ** 64 - 2000):
+            expected = [n for n in range(start, start + 2000) if primality.is_prime(n)]
+            self.assertEqual(list(streaming.primes(start, start + 2000, 2, 500)), expected)
+
+    def testChunks(self):
+        """Primes are streamed as array('Q') chunks, one per segment."""
+        chunks = list(streaming.prime_chunks(0, 100, 2, 50))
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(chunks[0].typecode, 'Q')
+        self.assertEqual(list(chunks[1]), [53, 59, 61, 67, 71, 73, 79, 83, 89, 97])
+
+    def testBinaryFile(self):
+        """Primes written to a file must be read back unchanged."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'primes.bin')
+            self.assertEqual(streaming.write_primes(path, 0, 1000, 2, 128), 168)
+            self.assertEqual(os.path.getsize(path), 168 * 8)
+            self.assertEqual(list(streaming.read_primes(path)),
+                             primality.primes_up_to(1000))
+
+    def testRangeLimit(self):
+        """Ranges beyond 64 bits are rejected."""
+        with self.assertRaises(ValueError):
+            next(streaming.prime_chunks(0, 2 ** 64 + 2))
+
+
+class TestVectorized(unittest.TestCase):
+    """Tests the batch trial division."""
+
+    def setUp(self):
+        self.primes = [2, 3, 5, 7, 11, 13]
+
+    def expected(self, candidates):
+        """Candidates without a small factor, and the small primes."""
+        return [n for n in candidates
+                if all(n % p or n == p for p in self.primes)]
+
+    def testSequence(self):
+        """Sequences are filtered, also beyond 64 bits."""
+        for candidates in [list(range(0, 500)),
+                           [2 ** 80 + i for i in range(500)]]:
+            self.assertEqual(vectorized.filter_composites(candidates, self.primes),
+                             self.expected(candidates))
+
+    @unittest.skipIf(vectorized.np is None, 'NumPy is not installed')
+    def testArray(self):
+        """Arrays of 64-bit candidates are filtered."""
+        candidates = [2 ** 63 + i for i in range(500)] + list(range(20))
+        array = vectorized.np.array(candidates, dtype=vectorized.np.uint64)
+        survivors = vectorized.filter_composites(array, self.primes)
+        self.assertEqual(survivors.tolist(), self.expected(candidates))
+
+    def testProgression(self):
+        """Windows of a progression are filtered."""
+        progression = vectorized.VectorProgression(3)
+        survivors = progression.survivors(10 ** 12 + 1, 1000)
+        self.assertEqual(len(set(survivors)), len(survivors))
+        self.assertTrue(all(n % 5 and n % 7 for n in survivors))
+
+
+class TestWheel(unittest.TestCase):
+    """Tests the wheel candidate generator."""
+
+    @staticmethod
+    def expected(start, stop, step):
+        """Terms coprime to the wheel, and the wheel primes."""
+        return [v for v in range(start, stop, step)
+                if v in wheel.WHEEL_PRIMES or math.gcd(v, wheel.WHEEL_MODULUS) == 1]
+
+    def testRanges(self):
+        """The wheel must only skip multiples of the wheel primes."""
+        for start, stop, step in [(0, 5000, 1), (1, 9000, 3), (10, 9000, 14),
+                                  (4000, -5, -1), (7001, 3, -30)]:
+            self.assertEqual(list(wheel.candidates(start, stop, step)),
+                             self.expected(start, stop, step),
+                             (start, stop, step))
+
+    def testEndless(self):
+        """Without a bound the wheel turns forever."""
+        first = list(itertools.islice(wheel.candidates(0), 8))
+        self.assertEqual(first, [1, 2, 3, 5, 7, 11, 13, 17])
+
+    def testSkipRatio(self):
+        """Only 480 of every 2310 integers are generated."""
+        count = sum(1 for _ in wheel.candidates(10 ** 12, 10 ** 12 + 2310 * 4))
+        self.assertEqual(count, 480 * 4)
+
+
+class TestSharedState(unittest.TestCase):
+    """Tests the shared maximum."""
+
+    def testArbitraryPrecision(self):
+        """Values beyond 64 bits must be kept."""
+        shared = SharedInt(1)
+        shared.value = 2 ** 521 - 1
+        self.assertEqual(shared.value, 2 ** 521 - 1)
+        self.assertRaises(OverflowError, SharedInt, 2 ** 100, 8)
+
+    def testCompareAndSet(self):
+        """Compare-and-set only replaces the expected value."""
+        shared = SharedInt(5)
+        self.assertFalse(shared.compare_and_set(4, 7))
+        self.assertTrue(shared.compare_and_set(5, 7))
+        self.assertFalse(shared.update_max(6))
+        self.assertEqual(shared.value, 7)
+
+    def testWorkerProcesses(self):
+        """Updates from worker processes must be visible to the parent."""
+        shared = SharedInt(1)
+        workers = [multiprocessing.Process(target=raise_shared,
+                                           args=(shared, 10 ** (20 + i)))
+                   for i in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(shared.value, 10 ** 23)
+
+
+class TestScheduler(unittest.TestCase):
+    """Tests the block scheduler."""
+
+    def testDescendingBlocks(self):
+        """Blocks must be disjoint and handed out from the top."""
+        scheduler = BlockScheduler(ceiling=100, block_size=30, floor=2)
+        blocks = []
+        block = scheduler.next_block()
+        while block is not None:
+            blocks.append(block)
+            block = scheduler.next_block()
+        self.assertEqual(blocks, [(70, 100), (40, 70), (10, 40), (2, 10)])
+
+    def testSkipsBlocksBelowMaximum(self):
+        """Blocks that cannot beat the maximum are not handed out."""
+        scheduler = BlockScheduler(ceiling=100, block_size=30, floor=2)
+        self.assertEqual(scheduler.next_block(50), (70, 100))
+        self.assertEqual(scheduler.next_block(50), (40, 70))
+        self.assertIsNone(scheduler.next_block(69))
+
+    def testGrowth(self):
+        """Open-ended searches move on to higher levels."""
+        scheduler = BlockScheduler(ceiling=100, block_size=30, growth=10,
+                                   blocks_per_level=1)
+        self.assertEqual(scheduler.next_block(), (70, 100))
+        self.assertEqual(scheduler.next_block(), (970, 1000))
+        self.assertEqual(scheduler.next_block(50000), (99970, 100000))
+
+    def testLimit(self):
+        """Open-ended searches stop at the limit, searching its level in full."""
+        scheduler = BlockScheduler(ceiling=100, block_size=30, growth=10,
+                                   blocks_per_level=1, limit=5000)
+        blocks = [scheduler.next_block() for _ in range(4)]
+        self.assertEqual(blocks, [(70, 100), (970, 1000), (4970, 5000), (4940, 4970)])
+        self.assertIsNone(scheduler.next_block(4960))
+
+    def testFrontier(self):
+        """Blocks are registered in the frontier as they are handed out."""
+        scheduler = BlockScheduler(ceiling=100, block_size=30, floor=2)
+        frontier = SharedBlock()
+        self.assertEqual(scheduler.next_block(frontier=frontier), (70, 100))
+        self.assertEqual(frontier.get(), (70, 100))
+        self.assertIsNone(scheduler.next_block(99, frontier))
+        self.assertEqual(frontier.get(), (70, 100))
+
+
+class TestDescendingSearch(unittest.TestCase):
+    """Tests the largest-prime-below-N search."""
+
+    def testGapWindow(self):
+        """Blocks span a few average prime gaps."""
+        self.assertEqual(gap_window(100), 64)
+        self.assertGreater(gap_window(10 ** 100), math.log(10 ** 100))
+
+    def testLargestPrimeBelow(self):
+        """The search must find the largest prime, not just any prime."""
+        self.assertIsNone(largest_prime_below(2, 2))
+        self.assertEqual(largest_prime_below(3, 2), 2)
+        self.assertEqual(largest_prime_below(1000, 2, window=10), 997)
+        self.assertEqual(largest_prime_below(2 ** 127, 2), 2 ** 127 - 1)
+        self.assertEqual(largest_prime_below(10 ** 100, 3), 10 ** 100 - 797)
+
+
+class TestDistributed(unittest.TestCase):
+    """Tests the TCP coordinator and its workers."""
+
+    def testReassignsSilentWorker(self):
+        """The unfinished part of a silent worker's block is handed out again."""
+        coordinator = Coordinator(port=0, heartbeat_timeout=0.1,
+                                  scheduler=BlockScheduler(ceiling=1000, block_size=100))
+        try:
+            reply = coordinator.handle(0, {'type': 'request'})
+            self.assertEqual((decode_int(reply['lo']), decode_int(reply['hi'])), (900, 1000))
+            coordinator.handle(0, {'type': 'heartbeat', 'progress': encode_int(950)})
+            time.sleep(0.2)
+            coordinator.reap()
+            reply = coordinator.handle(1, {'type': 'request'})
+            self.assertEqual((decode_int(reply['lo']), decode_int(reply['hi'])), (900, 950))
+        finally:
+            coordinator.server.server_close()
+
+    def testInvalidMessages(self):
+        """Malformed messages are answered with an error."""
+        coordinator = Coordinator(port=0, scheduler=BlockScheduler(ceiling=1000, block_size=100))
+        try:
+            coordinator.handle(0, {'type': 'request'})
+            for message in ({'type': 'heartbeat'}, {'type': 'heartbeat', 'progress': 950},
+                            {'type': 'result', 'prime': 'x'}, ['heartbeat']):
+                self.assertEqual(coordinator.handle(0, message)['type'], 'error', message)
+            self.assertEqual(coordinator.assignments[0][:2], [900, 1000])
+        finally:
+            coordinator.server.server_close()
+
+    def testLocalSearch(self):
+        """Workers on localhost find the largest prime, even if one leaves."""
+        coordinator = Coordinator(port=0, heartbeat_timeout=1,
+                                  scheduler=BlockScheduler(ceiling=10 ** 6, block_size=1000))
+        result = []
+        thread = threading.Thread(target=lambda: result.append(coordinator.serve()))
+        thread.start()
+        host, port = coordinator.address
+
+        # A worker that takes the first block and disconnects
+        with socket.create_connection((host, port)) as sock:
+            file = sock.makefile('rwb')
+            file.write(b'{"type": "request"}\n')
+            file.flush()
+            self.assertEqual(json.loads(file.readline())['type'], 'block')
+
+        workers = [multiprocessing.Process(target=run_remote_worker, args=(host, port))
+                   for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(30)
+        thread.join(30)
+        self.assertEqual(result, [999983])
+
+
+class TestService(unittest.TestCase):
+    """Tests the primality query service."""
+
+    def testLRUCache(self):
+        """The least recently used entry is evicted, and lookups are counted."""
+        cache = LRUCache(2)
+        cache.put(1, True)
+        cache.put(2, False)
+        self.assertFalse(cache.get(2))
+        self.assertTrue(cache.get(1))
+        cache.put(3, True)
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        self.assertAlmostEqual(cache.hit_rate, 2 / 3)
+
+    def testDecodeNumber(self):
+        """Strings are only read as 0x-prefixed hexadecimal."""
+        self.assertEqual(decode_number('0x61'), 97)
+        self.assertEqual(decode_number('-0X61'), -97)
+        self.assertEqual(decode_number(97), 97)
+        self.assertEqual(decode_number(encode_int(2 ** 127 - 1)), 2 ** 127 - 1)
+        self.assertRaises(ValueError, decode_number, '97')
+        self.assertRaises(ValueError, decode_number, 'ff')
+
+    def testServer(self):
+        """Batches are answered in order and repeated numbers hit the cache."""
+        numbers = [2 ** 127 - 1, 2 ** 127 + 1, 97, 91, 2 ** 127 - 1]
+        expected = [True, False, True, False, True]
+        service = PrimalityService(processes=2, cache_size=16)
+        server = PrimalityServer(('localhost', 0), service)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        client = PrimalityClient(*server.server_address)
+        try:
+            self.assertEqual(client.is_prime(numbers), expected)
+            self.assertEqual(client.is_prime(numbers), expected)
+            stats = client.stats()
+            self.assertEqual((stats['hits'], stats['misses']), (4, 4))
+            self.assertEqual(stats['hit_rate'], 0.5)
+            self.assertRaises(ValueError, client.call, {'type': 'unknown'})
+            self.assertEqual(client.call({'type': 'query', 'numbers': ['0x61', 97]})['primes'],
+                             [True, True])
+            self.assertRaises(ValueError, client.call, {'type': 'query', 'numbers': ['97']})
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+            service.close()
+
+
+class TestDeadline(unittest.TestCase):
+    """Tests the cooperative stop condition."""
+
+    def testClockInterval(self):
+        """The clock is only read every interval checks."""
+        deadline = Deadline(0, interval=4)
+        self.assertEqual([deadline.check() for _ in range(5)],
+                         [False, False, False, True, True])
+        self.assertTrue(Deadline(0).poll())
+        self.assertFalse(Deadline().poll())
+
+    def testCancel(self):
+        """Setting the shared event stops the workers."""
+        cancel = multiprocessing.Event()
+        deadline = Deadline(60, cancel)
+        self.assertFalse(deadline.poll())
+        cancel.set()
+        self.assertTrue(deadline.poll())
+
+    def testTargetStopsSearch(self):
+        """Reaching the target digits ends the search long before the timeout."""
+        start_time = time.time()
+        max_prime, reports = run_search(2, 60, target_digits=30)
+        self.assertLess(time.time() - start_time, 30)
+        self.assertGreaterEqual(primality.count_digits(max_prime), 30)
+        self.assertEqual(len(reports), 2)
+
+    def testInterrupt(self):
+        """An interrupted search drains the reports while its workers stop."""
+        received = []
+
+        def on_report(report):
+            # Lets the reports pile up in the queue, then interrupts once
+            received.append(report)
+            if len(received) == 1:
+                time.sleep(1)
+                raise KeyboardInterrupt
+
+        returned = []
+        search = threading.Thread(target=lambda: returned.append(run_search(
+                                      2, 60, stats_interval=0.0001, on_report=on_report,
+                                      scheduler='progression')),
+                                  daemon=True)
+        search.start()
+        search.join(30)
+        self.assertFalse(search.is_alive())
+        self.assertEqual(sum(r['final'] for r in received), 2)
+        _, reports = returned[0]
+        self.assertEqual(sorted(r['worker'] for r in reports), [0, 1])
+
+
+class TestCommandLine(unittest.TestCase):
+    """Tests the command-line helpers."""
+
+    def testCountDigits(self):
+        """Digits are counted without the int/str conversion limit."""
+        for n in (0, 9, 10, 99, 10 ** 50 - 1, 10 ** 50):
+            self.assertEqual(primality.count_digits(n), len(str(n)))
+        self.assertEqual(primality.count_digits(10 ** 5000), 5001)
+
+    def testParseInt(self):
+        """Bounds can be written as powers."""
+        self.assertEqual(parse_int('1000'), 1000)
+        self.assertEqual(parse_int('10**20'), 10 ** 20)
+        self.assertEqual(parse_int('2^64'), 2 ** 64)
+        self.assertEqual(parse_int('10**12+10**9'), 10 ** 12 + 10 ** 9)
+        self.assertRaises(ValueError, parse_int, '10**')
+
+    def testListPrimes(self):
+        """Segments without primes print nothing."""
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            main(['primes', '1000', '1200', '-p', '1', '--segment-size', '8'])
+        self.assertEqual(output.getvalue().split('\n'),
+                         [str(p) for p in range(1000, 1200) if is_prime(p)] + [''])
+
+    def testSpecialFormOptions(self):
+        """The engine and generator options are refused for special forms."""
+        for option in (['--engine', 'bpsw'], ['--generator', 'wheel']):
+            with contextlib.redirect_stderr(io.StringIO()):
+                self.assertRaises(SystemExit, main, ['--scheduler', 'proth', *option])
+
+
+class TestStats(unittest.TestCase):
+    """Tests the worker instrumentation."""
+
+    def testSharedStateCounters(self):
+        """Attached stats count the reads and the lock acquisitions."""
+        shared = SharedInt(1)
+        stats = WorkerStats(0)
+        shared.stats = stats
+        shared.update_max(7)
+        self.assertEqual(shared.value, 7)
+        self.assertEqual(stats.shared_reads, 1)
+        self.assertEqual(stats.lock_acquisitions, 1)
+
+    def testAggregate(self):
+        """Totals are the sums of the worker counters."""
+        first, second = WorkerStats(0), WorkerStats(1)
+        first.window(100, 10)
+        second.window(50, 5)
+        second.tested = 5
+        total = aggregate([first.report(final=True), second.report(final=True)])
+        self.assertEqual(total['generated'], 150)
+        self.assertEqual(total['prefiltered'], 135)
+        self.assertEqual(total['tested'], 5)
+        self.assertTrue(total['final'])
+
+
+class TestCheckpoint(unittest.TestCase):
+    """Tests the search checkpoints."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'checkpoint.json')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def testRoundTrip(self):
+        """Checkpoints must keep arbitrary-precision values."""
+        big = 2 ** 20000 + 1
+        save_checkpoint(self.path, big, (3, 1), [(big - 100, big)], [7, 11], 12.5,
+                        scheduler_kind='blocks')
+        state = load_checkpoint(self.path)
+        self.assertEqual(state['max_prime'], big)
+        self.assertEqual(state['scheduler_kind'], 'blocks')
+        self.assertEqual(state['scheduler'], (3, 1))
+        self.assertEqual(state['blocks'], [(big - 100, big)])
+        self.assertEqual(state['values'], [7, 11])
+        self.assertEqual(state['elapsed'], 12.5)
+
+    def testAtomicWrite(self):
+        """Saving must replace the file without leaving temporary files."""
+        save_checkpoint(self.path, 7)
+        save_checkpoint(self.path, 11)
+        self.assertEqual(load_checkpoint(self.path)['max_prime'], 11)
+        self.assertEqual(os.listdir(self.dir.name), ['checkpoint.json'])
+
+    def testSchedulerMismatch(self):
+        """Resuming with another scheduler must be refused."""
+        save_checkpoint(self.path, 7, (5,), values=[7], scheduler_kind='mersenne')
+        self.assertRaises(ValueError, run_search, 1, 1, self.path, resume=True,
+                          scheduler='blocks')
+
+    def testResume(self):
+        """A resumed search keeps the maximum and writes its scheduler."""
+        save_checkpoint(self.path, 2 ** 61 - 1, (61,), scheduler_kind='mersenne')
+        max_prime, _ = run_search(1, 30, self.path, resume=True, scheduler='mersenne',
+                                  target_digits=30)
+        self.assertEqual(max_prime, 2 ** 107 - 1)
+        self.assertEqual(load_checkpoint(self.path)['scheduler_kind'], 'mersenne')
+
+
+if __name__ == '__main__':
+    unittest.main()
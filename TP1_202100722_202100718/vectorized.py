@@ -0,0 +1,109 @@
+"""
+Vectorized batch trial division (NumPy, when available)
+"""
+import primality
+import sieve
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Upper bound (exclusive) of the primes tried by the batch trial division
+BATCH_PRIME_LIMIT = 2 ** 12
+
+# Primes tried against the whole batch in one operation
+PRIME_CHUNK = 64
+
+# Largest candidate handled by the vectorized path
+MAX_VECTOR_VALUE = 2 ** 64 - 1
+
+BATCH_PRIMES = primality.primes_up_to(BATCH_PRIME_LIMIT)
+
+if np is not None:
+    BATCH_PRIMES_ARRAY = np.array(BATCH_PRIMES, dtype=np.uint64)
+
+
+def filter_composites(candidates, primes=None):
+    """
+    Removes the candidates with a small prime factor (other than the primes
+    themselves). Arrays of 64-bit candidates are filtered with vectorized
+    modulus checks; without NumPy, or for values beyond 64 bits, the filter
+    falls back to plain Python.
+    :param candidates: NumPy array or sequence of candidates
+    :param primes: Primes to try (BATCH_PRIMES by default)
+    :return: The surviving candidates, in the same kind of container
+    """
+    primes = BATCH_PRIMES if primes is None else primes
+
+    if np is not None and isinstance(candidates, np.ndarray):
+        if candidates.dtype == object:
+            return np.array(_filter_python(candidates.tolist(), primes),
+                            dtype=object)
+        return _filter_numpy(candidates.astype(np.uint64, copy=False), primes)
+
+    if (np is not None and candidates
+            and 0 <= min(candidates) and max(candidates) <= MAX_VECTOR_VALUE):
+        array = np.array(candidates, dtype=np.uint64)
+        return _filter_numpy(array, primes).tolist()
+
+    return _filter_python(candidates, primes)
+
+
+def _filter_numpy(candidates, primes):
+    """Vectorized trial division of a uint64 array."""
+    if primes is BATCH_PRIMES:
+        primes = BATCH_PRIMES_ARRAY
+    else:
+        primes = np.asarray(primes, dtype=np.uint64)
+
+    keep = np.ones(len(candidates), dtype=bool)
+    column = candidates[:, None]
+    for i in range(0, len(primes), PRIME_CHUNK):
+        chunk = primes[i:i + PRIME_CHUNK]
+        divisible = (column % chunk == 0) & (column != chunk)
+        keep &= ~divisible.any(axis=1)
+    return candidates[keep]
+
+
+def _filter_python(candidates, primes):
+    """Trial division of a sequence of Python integers."""
+    survivors = []
+    for n in candidates:
+        for p in primes:
+            if n % p == 0 and n != p:
+                break
+        else:
+            survivors.append(n)
+    return survivors
+
+
+class VectorProgression:
+    """
+    Candidates of value, value + step, ..., a window at a time, filtered by
+    filter_composites. Windows beyond 64 bits (or without NumPy) use the
+    segmented sieve instead, the faster pure-Python path for progressions.
+    """
+
+    def __init__(self, step):
+        """
+        :param step: Difference between consecutive candidates
+        """
+        if step <= 0:
+            raise ValueError('The step must be positive')
+        self.step = step
+        self.fallback = sieve.ProgressionSieve(step)
+
+    def survivors(self, value, count):
+        """
+        Candidates of a window of the progression.
+        :param value: First term of the window
+        :param count: Number of terms in the window
+        :return: List of the terms without small prime factors
+        """
+        last = value + (count - 1) * self.step
+        if np is None or value < 0 or last > MAX_VECTOR_VALUE:
+            return self.fallback.survivors(value, count)
+        window = (np.arange(count, dtype=np.uint64) * np.uint64(self.step)
+                  + np.uint64(value))
+        return filter_composites(window).tolist()
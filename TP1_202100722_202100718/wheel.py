@@ -0,0 +1,118 @@
+"""
+Wheel factorization candidate generator
+"""
+import functools
+import math
+
+# Primes of the wheel and their product
+WHEEL_PRIMES = (2, 3, 5, 7, 11)
+WHEEL_MODULUS = math.prod(WHEEL_PRIMES)
+
+
+@functools.lru_cache(maxsize=None)
+def wheel_gaps(residue, step_residue):
+    """
+    Gaps between the terms of a progression that are coprime to the wheel.
+    Whether value + k * step is coprime only depends on k modulo the period
+    WHEEL_MODULUS / gcd(step, WHEEL_MODULUS).
+    :param residue: First term modulo WHEEL_MODULUS
+    :param step_residue: Step modulo WHEEL_MODULUS
+    :return: Tuple (first, gaps): index of the first coprime term and the
+             index gaps to the following ones, repeating forever
+    """
+    period = WHEEL_MODULUS // math.gcd(step_residue, WHEEL_MODULUS)
+    offsets = [k for k in range(period)
+               if math.gcd(residue + k * step_residue, WHEEL_MODULUS) == 1]
+    if not offsets:
+        return None, ()
+    gaps = [b - a for a, b in zip(offsets, offsets[1:])]
+    gaps.append(offsets[0] + period - offsets[-1])
+    return offsets[0], tuple(gaps)
+
+
+def _keep(value):
+    """Checks if a small value must be generated."""
+    return value in WHEEL_PRIMES or math.gcd(value, WHEEL_MODULUS) == 1
+
+
+def _turn(value, bound, step):
+    """
+    Turns the wheel: terms coprime to it, from value until the bound.
+    :param value: First term
+    :param bound: Bound (exclusive), None for an endless progression
+    :param step: Difference between consecutive terms
+    :return: Iterator over the coprime terms
+    """
+    first, gaps = wheel_gaps(value % WHEEL_MODULUS, step % WHEEL_MODULUS)
+    if first is None:
+        return
+    value += first * step
+    increments = [gap * step for gap in gaps]
+    if bound is None:
+        while True:
+            for increment in increments:
+                yield value
+                value += increment
+    while True:
+        for increment in increments:
+            if (value >= bound) if step > 0 else (value <= bound):
+                return
+            yield value
+            value += increment
+
+
+def candidates(start, stop=None, step=1):
+    """
+    Iterates over range(start, stop, step), skipping the multiples of the
+    wheel primes (other than the primes themselves).
+    :param start: First term
+    :param stop: Bound (exclusive), None for an endless progression
+    :param step: Difference between consecutive terms (may be negative)
+    :return: Iterator over the candidates, in the order of the progression
+    """
+    if step == 0:
+        raise ValueError('The step must not be zero')
+    small = WHEEL_PRIMES[-1]
+    value = start
+
+    if step > 0:
+        # Terms up to the largest wheel prime are checked one by one
+        while value <= small:
+            if stop is not None and value >= stop:
+                return
+            if _keep(value):
+                yield value
+            value += step
+        yield from _turn(value, stop, step)
+        return
+
+    low = small if stop is None else max(stop, small)
+    if value > low:
+        yield from _turn(value, low, step)
+        # First term at or below the largest wheel prime
+        value += -((low - value) // -step) * step
+    while stop is None or value > stop:
+        if _keep(value):
+            yield value
+        value += step
+
+
+class WheelProgression:
+    """Wheel candidates of value, value + step, ..., a window at a time."""
+
+    def __init__(self, step):
+        """
+        :param step: Difference between consecutive candidates
+        """
+        if step <= 0:
+            raise ValueError('The step must be positive')
+        self.step = step
+
+    def survivors(self, value, count):
+        """
+        Candidates of a window of the progression.
+        :param value: First term of the window
+        :param count: Number of terms in the window
+        :return: List of the terms coprime to the wheel
+        """
+        return list(candidates(value, value + count * self.step, self.step))
@@ -0,0 +1,252 @@
+"""
+ Asyncio JSON-RPC Client
+"""
+
+import asyncio
+import json
+
+from client import JSONRPCClient
+from framing import MAX_FRAME_SIZE, encode_frame, read_frame_async
+
+# Connections shared by the calls of an AsyncJSONRPCClient
+DEFAULT_CONNECTIONS = 4
+
+# Messages sent on a connection and not answered yet, at most
+DEFAULT_MAX_IN_FLIGHT = 256
+
+
+class AsyncConnection:
+    """
+    Connection of an AsyncJSONRPCClient. Messages are written back to back
+    and a reader task matches the responses to their requests by id.
+    """
+
+    def __init__(self, reader, writer, framing, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """
+        :param reader: asyncio.StreamReader of the connection
+        :param writer: asyncio.StreamWriter of the connection
+        :param framing: Framing of the messages, 'newline' or 'length'
+        :param max_in_flight: Messages sent and not answered yet, at most
+        """
+        self.reader = reader
+        self.writer = writer
+        self.framing = framing
+        self.slots = asyncio.Semaphore(max_in_flight)
+        # Request id -> future of its response
+        self.pending = {}
+        self.error = None
+        self.task = asyncio.create_task(self.read_responses())
+
+    @classmethod
+    async def open(cls, host, port, framing, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """
+        Connects to a server.
+        :return: AsyncConnection
+        """
+        reader, writer = await asyncio.open_connection(host, port, limit=MAX_FRAME_SIZE)
+        return cls(reader, writer, framing, max_in_flight)
+
+    async def write(self, msg):
+        """Sends a message."""
+        if self.error is not None:
+            raise self.error
+        self.writer.write(encode_frame(json.dumps(msg).encode(), self.framing))
+        try:
+            await self.writer.drain()
+        except OSError as error:
+            self.fail(ConnectionError(f'Could not send the request: {error}'))
+            raise self.error from error
+
+    async def send(self, msg, ids):
+        """
+        Sends a request or a batch and waits for its responses.
+        :param msg: Request, or list of requests
+        :param ids: Ids of the requests
+        :return: List of responses, in the order of the ids
+        """
+        async with self.slots:
+            loop = asyncio.get_running_loop()
+            futures = [loop.create_future() for _ in ids]
+            self.pending.update(zip(ids, futures))
+            await self.write(msg)
+            return await asyncio.gather(*futures)
+
+    async def read_responses(self):
+        """Resolves the futures of the responses until the connection closes."""
+        try:
+            while True:
+                msg = await read_frame_async(self.reader, self.framing)
+                if msg is None:
+                    break
+                res = json.loads(msg.decode())
+                for r in res if isinstance(res, list) else [res]:
+                    self.resolve(r)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.fail(ConnectionError('The connection to the server was closed'))
+
+    def resolve(self, res):
+        """Completes the future of a response."""
+        rpcid = res.get('id')
+        if rpcid is None and 'error' in res and self.pending:
+            # An error the server could not tie to a request (invalid
+            # request or parse error): fails the oldest one in flight
+            rpcid = next(iter(self.pending))
+        future = self.pending.pop(rpcid, None)
+        if future is not None and not future.done():
+            future.set_result(res)
+
+    def fail(self, error):
+        """Fails the requests in flight and the ones sent from now on."""
+        if self.error is None:
+            self.error = error
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self.pending.clear()
+
+    async def close(self):
+        """Closes the connection."""
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+
+class AsyncJSONRPCClient:
+    """
+    The asyncio JSON-RPC client. Remote functions are coroutines
+    (await client.add(1, 2)); concurrent calls are spread over a few
+    pipelined connections, opened on the first call.
+    """
+
+    def __init__(self, host, port, framing='length', connections=DEFAULT_CONNECTIONS,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, keep_alive=True):
+        """
+        :param host: Address of the server
+        :param port: Port of the server
+        :param framing: Framing of the messages, 'newline' or 'length' (see framing.FRAMINGS)
+        :param connections: Number of connections
+        :param max_in_flight: Messages sent on a connection and not answered yet, at most
+        :param keep_alive: Whether to ask the server to keep the connections alive
+        """
+        if framing == 'raw':
+            raise ValueError('Pipelining needs a framing that delimits the messages')
+        self.host = host
+        self.port = port
+        self.framing = framing
+        self.size = connections
+        self.max_in_flight = max_in_flight
+        self.keep_alive = keep_alive
+        self.connections = []
+        self.connect_lock = asyncio.Lock()
+        self.ID = 1
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def connect(self):
+        """Opens the connections, if they are not open yet."""
+        async with self.connect_lock:
+            if self.connections:
+                return
+            connections = await asyncio.gather(*(
+                AsyncConnection.open(self.host, self.port, self.framing, self.max_in_flight)
+                for _ in range(self.size)))
+            if self.keep_alive:
+                for connection in connections:
+                    await connection.write({"jsonrpc": "2.0", "method": "keepAlive"})
+            self.connections = list(connections)
+
+    async def close(self):
+        """Closes the connections."""
+        connections, self.connections = self.connections, []
+        for connection in connections:
+            await connection.close()
+
+    async def connection(self):
+        """
+        Connection with the fewest requests in flight.
+        :return: AsyncConnection
+        """
+        if not self.connections:
+            await self.connect()
+        alive = [c for c in self.connections if c.error is None]
+        if not alive:
+            raise self.connections[0].error
+        return min(alive, key=lambda c: len(c.pending))
+
+    def next_id(self):
+        """Takes the next request id."""
+        rpcid = self.ID
+        self.ID += 1
+        return rpcid
+
+    async def invoke(self, method, params):
+        """Invokes a remote function."""
+        req = {
+            "jsonrpc": "2.0",
+            "method": method,
+            "params": params,
+            "id": self.next_id()
+        }
+        connection = await self.connection()
+        res, = await connection.send(req, [req['id']])
+        return JSONRPCClient.unwrap(res)
+
+    async def batch(self, requests):
+        """Sends a batch of requests."""
+        batch_requests = [{
+            "jsonrpc": "2.0",
+            "method": req['method'],
+            "params": req.get('params', []),
+            "id": self.next_id()
+        } for req in requests]
+        connection = await self.connection()
+        return await connection.send(batch_requests, [req['id'] for req in batch_requests])
+
+    async def sendNotification(self, method):
+        """Sends a notification."""
+        connection = await self.connection()
+        await connection.write({"jsonrpc": "2.0", "method": method})
+
+    def __getattr__(self, name):
+        """Invokes a generic function."""
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        async def inner(*args, **kwargs):
+            if kwargs:
+                return await self.invoke(name, kwargs)
+            return await self.invoke(name, list(args))
+
+        return inner
+
+
+if __name__ == "__main__":
+    async def main():
+        # Test the AsyncJSONRPCClient class, with a server using the length framing
+        async with AsyncJSONRPCClient('127.0.0.1', 8000) as client:
+            # Concurrent requests example
+            print(await asyncio.gather(*(client.add(i, i) for i in range(10))))
+
+            # Batch request example
+            batch_requests = [
+                {"method": "hello"},
+                {"method": "greet", "params": ["World"]},
+                {"method": "add", "params": [1, 2]}
+            ]
+            print(await client.batch(batch_requests))
+
+    asyncio.run(main())
@@ -0,0 +1,190 @@
+"""
+ Asyncio JSON-RPC Server
+"""
+
+import asyncio
+import functools
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import functions
+from framing import DEFAULT_FRAMING, MAX_FRAME_SIZE, encode_frame, read_frame_async
+from server import DEFAULT_BACKLOG, JSONRPCServer
+
+
+class AsyncJSONRPCServer(JSONRPCServer):
+    """
+    JSON-RPC server on asyncio streams: every connection is a task of one
+    event loop, so keep-alive clients cost no thread. Functions defined with
+    async def are awaited on the loop; the others run on a thread pool.
+    """
+
+    def __init__(self, host, port, workers=None, backlog=DEFAULT_BACKLOG,
+                 framing=DEFAULT_FRAMING):
+        """
+        :param host: Address to listen on
+        :param port: Port to listen on
+        :param workers: Threads running the functions that are not coroutines (default of ThreadPoolExecutor)
+        :param backlog: Pending connections queued by the OS
+        :param framing: Framing of the messages (see framing.FRAMINGS)
+        """
+        super().__init__(host, port, backlog=backlog, framing=framing)
+        self.executor_workers = workers
+        self.executor = None
+        self.loop = None
+        self.stopped = None
+        self.ready = threading.Event()
+        self.writers = set()
+
+    def start(self):
+        """Starts the server and runs its event loop until stop is called."""
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        """Accepts and handles clients until stop is called."""
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+
+        with ThreadPoolExecutor(self.executor_workers) as executor:
+            self.executor = executor
+            server = await asyncio.start_server(self.handle_connection, self.host, self.port,
+                                                backlog=self.backlog, reuse_address=True,
+                                                limit=MAX_FRAME_SIZE)
+            self.running = True
+            print(f'Listening on port {self.port} ...')
+            self.ready.set()
+
+            await self.stopped.wait()
+            server.close()
+
+            # Ends the connections still open
+            for writer in list(self.writers):
+                writer.close()
+            await server.wait_closed()
+
+    def stop(self):
+        """Stops the server (from any thread)."""
+        self.running = False
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+
+    async def process_request_async(self, msg):
+        """Process a single JSON-RPC request, awaiting its function."""
+        res = {'jsonrpc': '2.0'}
+
+        try:
+            method, args, kwargs = self.bind_request(msg, res)
+        except Exception as error:
+            self.set_error(res, error)
+            return res
+
+        try:
+            if method.is_coroutine:
+                res['result'] = await method.function(*args, **kwargs)
+            else:
+                call = functools.partial(method.function, *args, **kwargs)
+                res['result'] = await self.loop.run_in_executor(self.executor, call)
+        except Exception as error:
+            self.set_call_error(res, method, error)
+
+        return res
+
+    async def process_msg_async(self, msg):
+        """Process the request message and build a response"""
+        try:
+            msgs = json.loads(msg)
+        except json.JSONDecodeError:
+            return self.parse_error()
+
+        # Check if there are multiple requests on the message
+        if isinstance(msgs, list):
+            # The requests of a batch run concurrently
+            return list(await asyncio.gather(*(self.process_request_async(m) for m in msgs)))
+
+        return await self.process_request_async(msgs)
+
+    async def handle_connection(self, reader, writer):
+        """Handles the client connection."""
+        self.writers.add(writer)
+        write_lock = asyncio.Lock()
+        tasks = set()
+        keep_alive = False
+
+        try:
+            while True:
+                # Receive message
+                msg = await read_frame_async(reader, self.framing)
+                if not msg:
+                    # The client closed the connection
+                    break
+                msg = msg.decode()
+                print('Received:', msg)
+
+                if keep_alive and self.framing != 'raw':
+                    # The messages of a kept-alive framed connection are
+                    # processed concurrently and answered as they finish
+                    task = asyncio.create_task(self.answer(msg, writer, write_lock))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    continue
+
+                # Check if the client wants to keep the connection alive
+                command = await self.answer(msg, writer, write_lock)
+                if command == 'keepAlive':
+                    keep_alive = True
+                elif command == 'exit':
+                    break
+
+                if not keep_alive:
+                    break
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except OSError:
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    async def answer(self, msg, writer, write_lock):
+        """
+        Processes a message and sends its response.
+        :param msg: Message
+        :param writer: asyncio.StreamWriter of the connection
+        :param write_lock: asyncio.Lock of the writes to the connection
+        :return: Connection command of the message (see connection_command)
+        """
+        res = await self.process_msg_async(msg)
+
+        reply = self.build_reply(res)
+        if reply is not None:
+            async with write_lock:
+                writer.write(encode_frame(reply.encode(), self.framing))
+                await writer.drain()
+
+        command = self.connection_command(res)
+        if command == 'exit' and not writer.is_closing():
+            # Closes a connection whose messages run concurrently
+            writer.close()
+        return command
+
+
+if __name__ == "__main__":
+    # Test the AsyncJSONRPCServer class
+    server = AsyncJSONRPCServer('0.0.0.0', 8000)
+
+    # Register functions
+    server.register('hello', functions.hello)
+    server.register('greet', functions.greet)
+    server.register('add', functions.add)
+    server.register('sub', functions.sub)
+    server.register('mul', functions.mul)
+    server.register('div', functions.div)
+    server.register('keepAlive', functions.keepAlive)
+    server.register('exit', functions.closeConnection)
+
+    # Start the server
+    try:
+        server.start()
+    except KeyboardInterrupt:
+        pass
@@ -2,27 +2,67 @@
  Simple JSON-RPC Client
 """
 
+import contextlib
 import json
+import select
 import socket
+import threading
 import time
+from collections import deque
+from concurrent.futures import Future
+
+from framing import DEFAULT_FRAMING, FrameReader, encode_frame
+
+# Requests of a PipelinedJSONRPCClient sent and not answered yet, at most
+DEFAULT_MAX_IN_FLIGHT = 64
+
+# Connections of a JSONRPCClientPool, at most
+DEFAULT_POOL_SIZE = 8
+
+# Seconds a pooled connection stays idle before it is closed
+DEFAULT_IDLE_TIMEOUT = 60
+
+# Seconds a pooled connection stays idle before it is checked on reuse
+DEFAULT_CHECK_INTERVAL = 5
+
+
+class RequestNotSentError(ConnectionError):
+    """The connection failed before the request was written, so it did not run."""
 
 
 class JSONRPCClient:
     """The JSON-RPC client."""
 
-    def __init__(self, host, port):
+    def __init__(self, host, port, framing=DEFAULT_FRAMING):
+        """
+        :param host: Address of the server
+        :param port: Port of the server
+        :param framing: Framing of the messages, the same as the server's (see framing.FRAMINGS)
+        """
         self.sock = socket.socket()
         self.sock.connect((host, port))
+        self.framing = framing
+        self.reader = FrameReader(self.sock, framing)
         self.ID = 1
 
     def close(self):
         """Closes the connection."""
         self.sock.close()
 
+    def write(self, msg):
+        """Writes a message to the server, without waiting for a response."""
+        try:
+            self.sock.sendall(encode_frame(msg.encode(), self.framing))
+        except OSError as error:
+            raise RequestNotSentError(f'Could not send the request: {error}') from error
+
     def send(self, msg):
         """Sends a message to the server."""
-        self.sock.sendall(msg.encode())
-        return self.sock.recv(1024).decode()
+        self.write(msg)
+        res = self.reader.read_frame()
+        if res is None:
+            raise ConnectionError('The server closed the connection')
+        return res.decode()
 
     def invoke(self, method, params):
         """Invokes a remote function."""
@@ -35,8 +75,15 @@ class JSONRPCClient:
         }
         self.ID += 1
         msg = self.send(json.dumps(req))
-        res = json.loads(msg)
+        return self.unwrap(json.loads(msg))
 
+    @staticmethod
+    def unwrap(res):
+        """
+        Takes the result out of a response.
+        :param res: Response
+        :return: Result, or the response itself for the other errors
+        """
         if 'error' in res:
             error_code = res['error'].get('code')
             error_message = res['error'].get('message')
@@ -80,7 +127,391 @@ class JSONRPCClient:
             "jsonrpc": "2.0",
             "method": method
         }
-        self.sock.sendall(json.dumps(req).encode())
+        self.write(json.dumps(req))
+
+
+class PipelinedJSONRPCClient(JSONRPCClient):
+    """
+    JSON-RPC client that writes its requests back to back on one connection,
+    without waiting for the responses. A reader thread matches the responses
+    to their requests by id, in whatever order they arrive. Safe to share
+    between threads.
+    """
+
+    def __init__(self, host, port, framing='length', max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                 keep_alive=True):
+        """
+        :param host: Address of the server
+        :param port: Port of the server
+        :param framing: Framing of the messages, 'newline' or 'length' (see framing.FRAMINGS)
+        :param max_in_flight: Requests sent and not answered yet, at most
+        :param keep_alive: Whether to ask the server to keep the connection alive
+        """
+        if framing == 'raw':
+            raise ValueError('Pipelining needs a framing that delimits the messages')
+        super().__init__(host, port, framing)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        # Request id -> (future, whether it gets the whole response)
+        self.pending = {}
+        self.error = None
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()
+
+        self.reader_thread = threading.Thread(target=self.read_responses, daemon=True)
+        self.reader_thread.start()
+        if keep_alive:
+            self.sendNotification('keepAlive')
+
+    def close(self):
+        """Closes the connection, failing the requests still in flight."""
+        try:
+            # Wakes up the reader thread
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.reader_thread.join()
+        self.sock.close()
+
+    def submit(self, method, params):
+        """
+        Sends a request without waiting for its response.
+        :param method: Name of the remote function
+        :param params: List or dictionary of parameters
+        :return: concurrent.futures.Future of the result
+        """
+        req = {"jsonrpc": "2.0", "method": method, "params": params}
+        return self.send_requests([req], raw=False)[0]
+
+    def invoke(self, method, params):
+        """Invokes a remote function."""
+        return self.submit(method, params).result()
+
+    def batch(self, requests):
+        """Sends a batch of requests."""
+        batch_requests = [{
+            "jsonrpc": "2.0",
+            "method": req['method'],
+            "params": req.get('params', [])
+        } for req in requests]
+        futures = self.send_requests(batch_requests, raw=True, batch=True)
+        return [future.result() for future in futures]
+
+    def sendNotification(self, method):
+        """Sends a notification."""
+        with self.write_lock:
+            super().sendNotification(method)
+
+    def send_requests(self, requests, raw, batch=False):
+        """
+        Numbers requests and sends them in one message, waiting while the
+        limit of requests in flight would be passed.
+        :param requests: Requests without ids
+        :param raw: Whether the futures get the whole responses instead of the results
+        :param batch: Whether to send the requests as a batch
+        :return: Futures of the requests, in the same order
+        """
+        if len(requests) > self.max_in_flight:
+            raise ValueError(f'At most {self.max_in_flight} requests can be in flight')
+
+        futures = []
+        with self.condition:
+            self.condition.wait_for(lambda: self.error is not None
+                                    or self.in_flight + len(requests) <= self.max_in_flight)
+            if self.error is not None:
+                raise self.error
+            self.in_flight += len(requests)
+            for req in requests:
+                req['id'] = self.ID
+                self.ID += 1
+                future = Future()
+                self.pending[req['id']] = (future, raw)
+                futures.append(future)
+
+        msg = json.dumps(requests if batch else requests[0])
+        try:
+            with self.write_lock:
+                self.sock.sendall(encode_frame(msg.encode(), self.framing))
+        except OSError as error:
+            self.fail(ConnectionError(f'Could not send the request: {error}'))
+        return futures
+
+    def read_responses(self):
+        """Resolves the futures of the responses until the connection closes."""
+        try:
+            while True:
+                msg = self.reader.read_frame()
+                if msg is None:
+                    break
+                res = json.loads(msg.decode())
+                for r in res if isinstance(res, list) else [res]:
+                    self.resolve(r)
+        except (OSError, ValueError):
+            pass
+        self.fail(ConnectionError('The connection to the server was closed'))
+
+    def resolve(self, res):
+        """
+        Completes the future of a response.
+        :param res: Response
+        :return: None
+        """
+        with self.condition:
+            rpcid = res.get('id')
+            if rpcid is None and 'error' in res and self.pending:
+                # An error the server could not tie to a request (invalid
+                # request or parse error): fails the oldest one in flight
+                rpcid = next(iter(self.pending))
+            entry = self.pending.pop(rpcid, None)
+            if entry is None:
+                # Not a response to one of our requests
+                return
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+        future, raw = entry
+        if raw:
+            future.set_result(res)
+            return
+        try:
+            future.set_result(self.unwrap(res))
+        except (TypeError, AttributeError) as error:
+            future.set_exception(error)
+
+    def fail(self, error):
+        """
+        Fails the requests in flight and the ones sent from now on.
+        :param error: Exception
+        :return: None
+        """
+        with self.condition:
+            if self.error is None:
+                self.error = error
+            pending = self.pending
+            self.pending = {}
+            self.in_flight = 0
+            self.condition.notify_all()
+        for future, _ in pending.values():
+            future.set_exception(error)
+
+
+class JSONRPCClientPool:
+    """
+    Pool of keep-alive connections to a server, shared by threads. Connections
+    are opened on demand, checked before reuse (with a keepAlive notification
+    when they were idle for a while) and closed after idling too long. A call
+    whose request could not be written is retried on a new connection.
+    """
+
+    def __init__(self, host, port, framing='length', min_size=0, max_size=DEFAULT_POOL_SIZE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, check_interval=DEFAULT_CHECK_INTERVAL,
+                 retries=1):
+        """
+        :param host: Address of the server
+        :param port: Port of the server
+        :param framing: Framing of the messages, 'newline' or 'length' (see framing.FRAMINGS)
+        :param min_size: Idle connections kept past the idle timeout
+        :param max_size: Connections open at a time, at most
+        :param idle_timeout: Seconds a connection stays idle before it is closed
+        :param check_interval: Seconds a connection stays idle before it is checked on reuse
+        :param retries: Times a call is retried on a new connection when its request could not be written
+        """
+        if framing == 'raw':
+            # The keepAlive notification would merge with the next request
+            raise ValueError('Pooled connections need a framing that delimits the messages')
+        if not 0 <= min_size <= max_size:
+            raise ValueError('The pool sizes must satisfy 0 <= min_size <= max_size')
+        self.host = host
+        self.port = port
+        self.framing = framing
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.retries = retries
+        # Idle connections with the time they were released, most recent last
+        self.idle = deque()
+        self.size = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def connect(self):
+        """
+        Opens a keep-alive connection.
+        :return: JSONRPCClient
+        """
+        client = JSONRPCClient(self.host, self.port, self.framing)
+        client.sendNotification('keepAlive')
+        return client
+
+    def is_alive(self, client, notify=True):
+        """
+        Checks an idle connection: the server must not have closed it, and,
+        if asked to, a keepAlive notification must go through.
+        :param client: JSONRPCClient
+        :param notify: Whether to send the keepAlive notification
+        :return: Whether the connection can be reused
+        """
+        try:
+            readable, _, _ = select.select([client.sock], [], [], 0)
+            if readable or client.reader.buffer:
+                # The server closed the connection, or sent something unexpected
+                return False
+            if notify:
+                client.sendNotification('keepAlive')
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def acquire(self, timeout=None):
+        """
+        Takes a connection from the pool, opening one if none is idle.
+        :param timeout: Seconds to wait for a connection when max_size are in use
+        :return: JSONRPCClient
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.condition:
+                self.prune()
+                client = None
+                while client is None:
+                    if self.closed:
+                        raise ConnectionError('The pool is closed')
+                    if self.idle:
+                        client, released = self.idle.pop()
+                    elif self.size < self.max_size:
+                        self.size += 1
+                        break
+                    elif not self.condition.wait(
+                            None if deadline is None else max(0, deadline - time.monotonic())):
+                        raise TimeoutError('No connection available')
+
+            if client is None:
+                try:
+                    return self.connect()
+                except BaseException:
+                    self.forget()
+                    raise
+            # The cheap check always, the notification after check_interval
+            if self.is_alive(client, time.monotonic() - released >= self.check_interval):
+                return client
+            self.discard(client)
+
+    def release(self, client):
+        """
+        Gives a healthy connection back to the pool.
+        :param client: JSONRPCClient taken with acquire
+        :return: None
+        """
+        with self.condition:
+            if not self.closed:
+                self.idle.append((client, time.monotonic()))
+                self.condition.notify()
+                return
+        self.discard(client)
+
+    def discard(self, client):
+        """
+        Closes a connection taken with acquire.
+        :param client: JSONRPCClient
+        :return: None
+        """
+        client.close()
+        self.forget()
+
+    def forget(self):
+        """Frees the place of a closed connection."""
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def prune(self):
+        """
+        Closes the connections idle for longer than the idle timeout, keeping
+        min_size of them (call with the condition held).
+        :return: None
+        """
+        deadline = time.monotonic() - self.idle_timeout
+        while self.idle and self.idle[0][1] < deadline and len(self.idle) > self.min_size:
+            client, _ = self.idle.popleft()
+            client.close()
+            self.size -= 1
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        """
+        Borrows a connection, closing it instead of giving it back if the
+        block fails with a connection error.
+        :param timeout: Seconds to wait for a connection when max_size are in use
+        """
+        client = self.acquire(timeout)
+        try:
+            yield client
+        except (TypeError, AttributeError):
+            # Errors of the remote functions, the connection is fine
+            self.release(client)
+            raise
+        except BaseException:
+            self.discard(client)
+            raise
+        self.release(client)
+
+    def call(self, function):
+        """
+        Runs function(client) on a pooled connection, retrying on a new
+        connection if the request could not be written. A connection that
+        fails after that is closed, but the call is not retried: the server
+        may have run it already.
+        :param function: Function of a JSONRPCClient
+        :return: Its result
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                with self.connection() as client:
+                    return function(client)
+            except RequestNotSentError:
+                if attempt == self.retries:
+                    raise
+
+    def invoke(self, method, params):
+        """Invokes a remote function."""
+        return self.call(lambda client: client.invoke(method, params))
+
+    def batch(self, requests):
+        """Sends a batch of requests."""
+        return self.call(lambda client: client.batch(requests))
+
+    def sendNotification(self, method):
+        """Sends a notification."""
+        self.call(lambda client: client.sendNotification(method))
+
+    def close(self):
+        """Closes the idle connections, and the others once they are released."""
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, deque()
+            self.size -= len(idle)
+            self.condition.notify_all()
+        for client, _ in idle:
+            client.close()
+
+    def __getattr__(self, name):
+        """Invokes a generic function."""
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def inner(*args, **kwargs):
+            if kwargs:
+                return self.invoke(name, kwargs)
+            return self.invoke(name, list(args))
+
+        return inner
 
 
 if __name__ == "__main__":
@@ -0,0 +1,127 @@
+"""
+ Dispatch entries of the registered JSON-RPC functions
+"""
+
+import inspect
+import typing
+
+POSITIONAL = (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+NAMED = (inspect.Parameter.POSITIONAL_OR_KEYWORD, inspect.Parameter.KEYWORD_ONLY)
+
+
+def coerce(value, annotation):
+    """
+    Converts an argument to the annotated type of its parameter.
+    :param value: Argument (decoded JSON)
+    :param annotation: Class
+    :return: Converted argument
+    """
+    # JSON booleans are only valid for bool, and only them
+    if annotation is bool or isinstance(value, bool):
+        if annotation is bool and isinstance(value, bool) or annotation is object:
+            return value
+        raise TypeError('Invalid params')
+    if isinstance(value, annotation):
+        return value
+
+    try:
+        converted = annotation(value)
+    except (TypeError, ValueError):
+        raise TypeError('Invalid params') from None
+    if annotation is int and isinstance(value, float) and converted != value:
+        # Would drop the fractional part
+        raise TypeError('Invalid params')
+    return converted
+
+
+class Method:
+    """
+    Dispatch entry of a registered function, built once by register: the
+    parameters of its signature, to bind the params of the requests without
+    reflection, and the converters of its annotated parameters, if asked to.
+    """
+
+    def __init__(self, function, coerce_params=False):
+        """
+        :param function: Function (or coroutine function)
+        :param coerce_params: Whether to convert the params to the annotated types
+        """
+        self.function = function
+        self.is_coroutine = inspect.iscoroutinefunction(function)
+
+        try:
+            parameters = list(inspect.signature(function).parameters.values())
+        except (TypeError, ValueError):
+            # Without a signature (some builtins) the params are passed as they come
+            self.parameters = None
+            return
+        self.parameters = parameters
+
+        kinds = {p.kind for p in parameters}
+        self.var_positional = inspect.Parameter.VAR_POSITIONAL in kinds
+        self.var_named = inspect.Parameter.VAR_KEYWORD in kinds
+        self.positional = [p.name for p in parameters if p.kind in POSITIONAL]
+        self.named = frozenset(p.name for p in parameters if p.kind in NAMED)
+        self.required = frozenset(p.name for p in parameters
+                                  if p.kind in POSITIONAL + NAMED and p.default is p.empty)
+        self.required_positional = sum(1 for p in parameters
+                                       if p.kind in POSITIONAL and p.default is p.empty)
+        self.required_named_only = any(p.kind is inspect.Parameter.KEYWORD_ONLY
+                                       and p.default is p.empty for p in parameters)
+
+        self.converters = {}
+        if coerce_params:
+            try:
+                hints = typing.get_type_hints(function)
+            except Exception:
+                hints = {}
+            self.converters = {p.name: hints[p.name] for p in parameters
+                               if isinstance(hints.get(p.name), type)}
+
+    def bind(self, params):
+        """
+        Binds the params of a request to the parameters of the function.
+        :param params: Params of the request (list, dictionary, or None if omitted)
+        :return: Tuple (positional arguments, named arguments)
+        """
+        if params is None:
+            params = []
+
+        if self.parameters is None:
+            if isinstance(params, dict):
+                return (), params
+            return params, {}
+
+        if not self.parameters:
+            # Functions without parameters ignore the params, as they always did
+            return (), {}
+
+        if isinstance(params, dict):
+            # Named parameters
+            if not self.var_named and not self.named.issuperset(params):
+                raise TypeError('Invalid params')
+            if not self.required.issubset(params):
+                raise TypeError('Invalid params')
+            if self.converters:
+                params = {name: self.convert(name, value) for name, value in params.items()}
+            return (), params
+
+        if isinstance(params, list):
+            # Positional parameters
+            if (len(params) < self.required_positional or self.required_named_only
+                    or len(params) > len(self.positional) and not self.var_positional):
+                raise TypeError('Invalid params')
+            if self.converters:
+                params = [self.convert(name, value)
+                          for name, value in zip(self.positional, params)] \
+                         + params[len(self.positional):]
+            return params, {}
+
+        raise TypeError('Invalid params')
+
+    def convert(self, name, value):
+        """Converts the argument of a parameter, if it has a converter."""
+        annotation = self.converters.get(name)
+        if annotation is None:
+            return value
+        return coerce(value, annotation)
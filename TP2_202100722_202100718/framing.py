@@ -0,0 +1,156 @@
+"""
+ Message framing of the JSON-RPC connections
+"""
+
+import asyncio
+
+# Framings: 'raw' takes whatever one recv returns as a message (the original
+# protocol), 'newline' ends every message with a newline and 'length' puts the
+# size of the message before it, as a 4-byte big-endian integer
+FRAMINGS = ('raw', 'newline', 'length')
+DEFAULT_FRAMING = 'raw'
+
+# Bytes asked for by every recv
+CHUNK_SIZE = 2 ** 16
+
+# Largest message accepted by the framed modes
+MAX_FRAME_SIZE = 2 ** 26
+
+# Size of the length prefix
+LENGTH_SIZE = 4
+
+
+def check_framing(framing):
+    """
+    Checks the name of a framing.
+    :param framing: Name of the framing (see FRAMINGS)
+    :return: The name
+    """
+    if framing not in FRAMINGS:
+        raise ValueError(f'Unknown framing: {framing} (expected one of {", ".join(FRAMINGS)})')
+    return framing
+
+
+def encode_frame(data, framing=DEFAULT_FRAMING):
+    """
+    Frames a message.
+    :param data: Message (bytes)
+    :param framing: Name of the framing
+    :return: Bytes to send
+    """
+    if framing == 'newline':
+        return data + b'\n'
+    if framing == 'length':
+        return len(data).to_bytes(LENGTH_SIZE, 'big') + data
+    return data
+
+
+class FrameReader:
+    """
+    Reads the messages of a socket. Every recv fills the same chunk, which is
+    appended to a buffer holding the bytes not consumed yet, so large
+    messages take several reads and messages sent back to back are split.
+    """
+
+    def __init__(self, sock, framing=DEFAULT_FRAMING, max_size=MAX_FRAME_SIZE,
+                 chunk_size=CHUNK_SIZE):
+        """
+        :param sock: Connected socket
+        :param framing: Name of the framing (see FRAMINGS)
+        :param max_size: Largest message accepted
+        :param chunk_size: Bytes asked for by every recv
+        """
+        self.sock = sock
+        self.framing = check_framing(framing)
+        self.max_size = max_size
+        self.buffer = bytearray()
+        self.chunk = bytearray(chunk_size)
+        self.view = memoryview(self.chunk)
+        # Bytes of the buffer already searched for a newline
+        self.scanned = 0
+
+    def fill(self):
+        """
+        Reads the next chunk into the buffer.
+        :return: Number of bytes read, 0 once the connection is closed
+        """
+        n = self.sock.recv_into(self.chunk)
+        self.buffer += self.view[:n]
+        return n
+
+    def read_frame(self):
+        """
+        Reads the next message.
+        :return: Message (bytes), or None once the connection is closed
+        """
+        if self.framing == 'raw':
+            if not self.buffer and not self.fill():
+                return None
+            frame = bytes(self.buffer)
+            self.buffer.clear()
+            return frame
+
+        while True:
+            frame = self.split()
+            if frame is not None:
+                return frame
+            if not self.fill():
+                if self.buffer:
+                    raise ConnectionError('Connection closed in the middle of a message')
+                return None
+
+    def split(self):
+        """
+        Takes the first complete message out of the buffer.
+        :return: Message (bytes), or None if it is not complete yet
+        """
+        if self.framing == 'newline':
+            end = self.buffer.find(b'\n', self.scanned)
+            if end < 0:
+                self.scanned = len(self.buffer)
+                if self.scanned > self.max_size:
+                    raise ConnectionError('Message too large')
+                return None
+            frame = bytes(self.buffer[:end])
+            del self.buffer[:end + 1]
+            self.scanned = 0
+            return frame
+
+        if len(self.buffer) < LENGTH_SIZE:
+            return None
+        size = int.from_bytes(self.buffer[:LENGTH_SIZE], 'big')
+        if size > self.max_size:
+            raise ConnectionError('Message too large')
+        end = LENGTH_SIZE + size
+        if len(self.buffer) < end:
+            return None
+        frame = bytes(self.buffer[LENGTH_SIZE:end])
+        del self.buffer[:end]
+        return frame
+
+
+async def read_frame_async(reader, framing=DEFAULT_FRAMING, max_size=MAX_FRAME_SIZE):
+    """
+    Reads the next message of an asyncio stream, whose buffer holds the bytes
+    not consumed yet.
+    :param reader: asyncio.StreamReader (with a limit of at least max_size for newlines)
+    :param framing: Name of the framing (see FRAMINGS)
+    :param max_size: Largest message accepted
+    :return: Message (bytes), or None once the connection is closed
+    """
+    try:
+        if framing == 'newline':
+            return (await reader.readuntil(b'\n'))[:-1]
+        if framing == 'length':
+            size = int.from_bytes(await reader.readexactly(LENGTH_SIZE), 'big')
+            if size > max_size:
+                raise ConnectionError('Message too large')
+            return await reader.readexactly(size)
+    except asyncio.IncompleteReadError as error:
+        if error.partial:
+            raise ConnectionError('Connection closed in the middle of a message') from error
+        return None
+    except asyncio.LimitOverrunError as error:
+        raise ConnectionError('Message too large') from error
+
+    return await reader.read(CHUNK_SIZE) or None
@@ -3,33 +3,117 @@
 """
 
 import json
+import pickle
 import socket
 import inspect
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
 import functions
+from dispatch import Method
+from framing import DEFAULT_FRAMING, FrameReader, check_framing, encode_frame
 
+# Pending connections queued by the OS in concurrent mode
+DEFAULT_BACKLOG = 128
 
-class JSONRPCServer:
-    """The JSON-RPC server."""
+# Seconds between checks for a stop while waiting for a free connection slot
+ACCEPT_POLL_INTERVAL = 0.1
+
+# Executors that can run the requests of a batch concurrently
+BATCH_EXECUTORS = {'thread': ThreadPoolExecutor, 'process': ProcessPoolExecutor}
 
-    def __init__(self, host, port):
+
+class JSONRPCServer:
+    """
+    The JSON-RPC server.
+    By default clients are handled one at a time. With workers, every
+    connection is handled by a thread pool, so keep-alive clients do not
+    block the others.
+    """
+
+    def __init__(self, host, port, workers=None, backlog=None, max_connections=None,
+                 framing=DEFAULT_FRAMING, batch_executor=None, batch_workers=None):
+        """
+        :param host: Address to listen on
+        :param port: Port to listen on
+        :param workers: Threads handling connections, None to handle them one at a time
+        :param backlog: Pending connections queued by the OS (1, or DEFAULT_BACKLOG with workers)
+        :param max_connections: Open connections at a time in concurrent mode, None for no limit
+        :param framing: Framing of the messages (see framing.FRAMINGS)
+        :param batch_executor: 'thread', 'process' or an Executor running the requests of a batch
+            concurrently, None to run them one after another (with processes, the functions
+            are pickled, so register rejects lambdas and closures)
+        :param batch_workers: Threads or processes of a 'thread' or 'process' batch executor
+        """
+        if not (batch_executor is None or batch_executor in BATCH_EXECUTORS
+                or isinstance(batch_executor, Executor)):
+            raise ValueError(f'Unknown batch executor: {batch_executor}')
         self.host = host
         self.port = port
         self.sock = None
-        self.funcs = {}
-
-    def register(self, name, function):
-        """Registers a function."""
-        self.funcs[name] = function
+        self.methods = {}
+        self.workers = workers
+        if backlog is None:
+            backlog = 1 if workers is None else DEFAULT_BACKLOG
+        self.backlog = backlog
+        self.max_connections = max_connections
+        self.framing = check_framing(framing)
+        self.batch_executor = batch_executor
+        self.batch_workers = batch_workers
+        self.batch_pool = batch_executor if isinstance(batch_executor, Executor) else None
+        self.running = False
+        self.connections = set()
+        self.lock = threading.Lock()
+
+    def register(self, name=None, function=None, coerce=False):
+        """
+        Registers a function, building its dispatch entry. Also works as a
+        decorator (@server.register or @server.register('name')), with a
+        function alone (named after it) and with a module (all its public
+        functions).
+        :param name: Name of the method, or the function or module to register
+        :param function: Function, None when used as a decorator
+        :param coerce: Whether to convert the params to the annotated types
+        :return: The function or module registered, or a decorator
+        """
+        if inspect.ismodule(name):
+            module = name
+            for attr, value in vars(module).items():
+                if (not attr.startswith('_') and inspect.isfunction(value)
+                        and value.__module__ == module.__name__):
+                    self.register(attr, value, coerce)
+            return module
+
+        if callable(name):
+            name, function = None, name
+        if function is None:
+            return lambda function: self.register(name, function, coerce)
+
+        if self.batch_executor == 'process' or isinstance(self.batch_executor, ProcessPoolExecutor):
+            # The batch executor sends the function to its processes
+            try:
+                pickle.dumps(function)
+            except (pickle.PicklingError, AttributeError, TypeError):
+                raise ValueError(f'Functions run by a process batch executor must be '
+                                 f'picklable: {name or function.__name__}') from None
+
+        self.methods[name or function.__name__] = Method(function, coerce)
+        return function
 
     def start(self):
         """Starts the server."""
         self.sock = socket.socket()
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.sock.bind((self.host, self.port))
-        self.sock.listen(1)
+        self.sock.listen(self.backlog)
+        self.running = True
         print(f'Listening on port {self.port} ...')
 
         try:
+            if self.workers is not None:
+                self.serve_concurrently()
+                return
+
             while True:
                 # Accepts and handles client
                 conn, _ = self.sock.accept()
@@ -39,59 +123,131 @@ class JSONRPCServer:
             pass
         except OSError:
             pass
+        finally:
+            self.close_batch_pool()
+
+    def serve_concurrently(self):
+        """Accepts clients and handles them on the thread pool."""
+        slots = None
+        if self.max_connections is not None:
+            slots = threading.BoundedSemaphore(self.max_connections)
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            try:
+                while self.running:
+                    # Waits for a free slot, leaving new clients in the backlog
+                    if slots is not None and not slots.acquire(timeout=ACCEPT_POLL_INTERVAL):
+                        continue
+                    try:
+                        conn, _ = self.sock.accept()
+                    except OSError:
+                        if slots is not None:
+                            slots.release()
+                        raise
+                    with self.lock:
+                        self.connections.add(conn)
+                    executor.submit(self.serve_client, conn, slots)
+            except OSError:
+                pass
+
+    def serve_client(self, conn, slots=None):
+        """Handles a client on the thread pool and frees its slot."""
+        try:
+            self.handle_client(conn)
+        except OSError:
+            conn.close()
+        finally:
+            with self.lock:
+                self.connections.discard(conn)
+            if slots is not None:
+                slots.release()
 
     def stop(self):
         """Stops the server."""
+        self.running = False
+        try:
+            # Wakes up the accept call
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
         self.sock.close()
 
+        # Ends the connections still open, so the pool can finish
+        with self.lock:
+            connections = list(self.connections)
+        for conn in connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
     def process_request(self, msg):
         """Process a single JSON-RPC request."""
         res = {'jsonrpc': '2.0'}
 
         try:
-            # Check if the request is valid
-            if 'method' not in msg:
-                raise ValueError('Invalid Request')
-            method = msg['method']
-
-            # Check if the request is a JSON-RPC notification
-            if 'id' in msg:
-                res['id'] = msg['id']
-
-            # Check if the method exists
-            if method not in self.funcs:
-                raise KeyError('Method not found')
-
-            # Check function arguments
-            func = self.funcs[method]
-            func_params = inspect.signature(func).parameters
-            if len(func_params) > 0:
-                if 'params' in msg:
-                    params = msg['params']
-
-                    if isinstance(params, dict):
-                        # Named parameters
-                        res['result'] = func(**params)
-                    elif len(params) == len(func_params):
-                        # Positional parameters
-                        res['result'] = func(*params)
-                    else:
-                        raise TypeError('Invalid params')
-                else:
-                    raise TypeError('Invalid params')
-            else:
-                res['result'] = func()
-        except ValueError:
+            method, args, kwargs = self.bind_request(msg, res)
+        except Exception as error:
+            self.set_error(res, error)
+            return res
+
+        try:
+            res['result'] = method.function(*args, **kwargs)
+        except Exception as error:
+            self.set_call_error(res, method, error)
+
+        return res
+
+    def bind_request(self, msg, res):
+        """
+        Checks a single JSON-RPC request and finds the method to call.
+        Copies the id of the request to the response.
+        :param msg: Request (decoded JSON)
+        :param res: Response being built
+        :return: Tuple (dispatch.Method, positional arguments, named arguments)
+        """
+        # Check if the request is valid
+        if 'method' not in msg:
+            raise ValueError('Invalid Request')
+        method = msg['method']
+
+        # Check if the request is a JSON-RPC notification
+        if 'id' in msg:
+            res['id'] = msg['id']
+
+        # Check if the method exists
+        if method not in self.methods:
+            raise KeyError('Method not found')
+
+        # Check function arguments
+        entry = self.methods[method]
+        args, kwargs = entry.bind(msg['params'] if 'params' in msg else None)
+        return entry, args, kwargs
+
+    @staticmethod
+    def set_error(res, error):
+        """Sets the JSON-RPC error of a request that bind_request rejected."""
+        if isinstance(error, ValueError):
             res['id'] = None
             res['error'] = {'code': -32600, 'message': 'Invalid Request'}
-        except KeyError:
+        elif isinstance(error, KeyError):
             res['error'] = {'code': -32601, 'message': 'Method not found'}
-        except TypeError:
+        elif isinstance(error, TypeError):
             res['error'] = {'code': -32602, 'message': 'Invalid params'}
-        except (ArithmeticError, Exception):
+        else:
             res['error'] = {'code': -32603, 'message': 'Internal error'}
 
-        return res
+    @staticmethod
+    def set_call_error(res, method, error):
+        """
+        Sets the JSON-RPC error of a request whose function raised, keeping
+        its id so the client can match the response.
+        """
+        if isinstance(error, TypeError) and method.parameters is None:
+            # Functions without a signature only check their params when called
+            res['error'] = {'code': -32602, 'message': 'Invalid params'}
+        else:
+            res['error'] = {'code': -32603, 'message': 'Internal error'}
 
     def process_msg(self, msg):
         """Process the request message and build a response"""
@@ -100,6 +256,9 @@ class JSONRPCServer:
 
             # Check if there are multiple requests on the message
             if isinstance(msgs, list):
+                if self.batch_executor is not None and len(msgs) > 1:
+                    return self.process_batch(msgs)
+
                 responses = []
                 for m in msgs:
                     response = self.process_request(m)
@@ -109,52 +268,130 @@ class JSONRPCServer:
             response = self.process_request(msgs)
             return response
         except json.JSONDecodeError:
-            return {'jsonrpc': '2.0',
-                    'error': {
-                        'code': -32700,
-                        'message': 'Parse error'},
-                    'id': None}
+            return self.parse_error()
+
+    def process_batch(self, msgs):
+        """
+        Process the requests of a batch concurrently on the batch executor.
+        :param msgs: Requests (decoded JSON)
+        :return: Responses, in the order of the requests
+        """
+        pool = self.get_batch_pool()
+
+        responses = []
+        futures = []
+        for m in msgs:
+            res = {'jsonrpc': '2.0'}
+            method = future = None
+            try:
+                method, args, kwargs = self.bind_request(m, res)
+            except Exception as error:
+                self.set_error(res, error)
+            else:
+                try:
+                    future = pool.submit(method.function, *args, **kwargs)
+                except Exception as error:
+                    self.set_call_error(res, method, error)
+            responses.append(res)
+            futures.append((method, future))
+
+        for res, (method, future) in zip(responses, futures):
+            if future is not None:
+                try:
+                    res['result'] = future.result()
+                except Exception as error:
+                    self.set_call_error(res, method, error)
+        return responses
+
+    def get_batch_pool(self):
+        """Batch executor, created on the first batch."""
+        with self.lock:
+            if self.batch_pool is None:
+                self.batch_pool = BATCH_EXECUTORS[self.batch_executor](self.batch_workers)
+            return self.batch_pool
+
+    def close_batch_pool(self):
+        """Shuts down the batch executor created by the server, if any."""
+        with self.lock:
+            pool = self.batch_pool
+            if isinstance(self.batch_executor, Executor) or pool is None:
+                return
+            self.batch_pool = None
+        pool.shutdown()
+
+    @staticmethod
+    def parse_error():
+        """Response to a message that is not valid JSON."""
+        return {'jsonrpc': '2.0',
+                'error': {
+                    'code': -32700,
+                    'message': 'Parse error'},
+                'id': None}
+
+    @staticmethod
+    def build_reply(res):
+        """
+        Builds the message answering a request or a batch.
+        :param res: Response, or list of responses
+        :return: JSON text, or None if there is nothing to answer (notification)
+        """
+        if isinstance(res, list):
+            return json.dumps([r for r in res if 'id' in r])
+        if 'id' in res:
+            return json.dumps(res)
+        return None
+
+    @staticmethod
+    def connection_command(res):
+        """
+        Finds a keepAlive or exit notification among the responses.
+        :param res: Response, or list of responses
+        :return: 'keepAlive', 'exit' or None
+        """
+        command = None
+        for r in res if isinstance(res, list) else [res]:
+            if 'id' not in r and r.get('result') in ('keepAlive', 'exit'):
+                command = r['result']
+                if command == 'exit':
+                    break
+        return command
 
     def handle_client(self, conn):
         """Handles the client connection."""
 
+        reader = FrameReader(conn, self.framing)
         keep_alive = False
 
-        while True:
-            # Receive message
-            msg = conn.recv(1024).decode()
-            print('Received:', msg)
-
-            # Process message
-            res = self.process_msg(msg)
-
-            # Send response
-            if isinstance(res, list):
-                batch_response = []
-                for r in res:
-                    if 'id' in r:
-                        batch_response.append(r)
-                conn.send(json.dumps(batch_response).encode())
-            elif 'id' in res:
-                conn.send(json.dumps(res).encode())
-
-            # Check if the client wants to keep the connection alive
-            if isinstance(res, list):
-                for r in res:
-                    if 'id' not in r and 'result' in r:
-                        if r['result'] == 'keepAlive':
-                            keep_alive = True
-                        elif r['result'] == 'exit':
-                            break
-
-            if 'id' not in res and 'result' in res:
-                if res['result'] == 'keepAlive':
+        try:
+            while True:
+                # Receive message
+                msg = reader.read_frame()
+                if not msg:
+                    # The client closed the connection
+                    break
+                msg = msg.decode()
+                print('Received:', msg)
+
+                # Process message
+                res = self.process_msg(msg)
+
+                # Send response
+                reply = self.build_reply(res)
+                if reply is not None:
+                    conn.sendall(encode_frame(reply.encode(), self.framing))
+
+                # Check if the client wants to keep the connection alive
+                command = self.connection_command(res)
+                if command == 'keepAlive':
                     keep_alive = True
-                elif res['result'] == 'exit':
+                elif command == 'exit':
                     break
 
-            if not keep_alive:
-                break
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            # Connection reset, or a message cut short or too large
+            pass
 
         conn.close()
 
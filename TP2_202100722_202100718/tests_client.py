@@ -3,17 +3,26 @@
 
 """
 
+import asyncio
 import json
 import socket
 import threading
 import unittest
 import concurrent.futures
+import time
 
-from client import JSONRPCClient
+from async_client import AsyncJSONRPCClient
+from async_server import AsyncJSONRPCServer
+import functions
+from client import JSONRPCClient, JSONRPCClientPool, PipelinedJSONRPCClient, RequestNotSentError
+from framing import FrameReader, encode_frame
+from server import JSONRPCServer
 
 # Define server host and port
 SERVER_HOST = '127.0.0.1'
 SERVER_PORT = 8000
+ASYNC_SERVER_PORT = 8004
+POOL_SERVER_PORT = 8005
 
 
 class TestBase(unittest.TestCase):
@@ -228,3 +237,366 @@ class TestBatchRequests(TestBase):
         self.assertEqual(res, expected_responses)
 
         thread.join()
+
+
+class TestFraming(unittest.TestCase):
+    """Tests the length-prefixed framing of the client."""
+
+    def setUp(self):
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((SERVER_HOST, SERVER_PORT))
+        self.sock.listen(1)
+        self.client = JSONRPCClient(SERVER_HOST, SERVER_PORT, framing='length')
+        self.conn, _ = self.sock.accept()
+
+    def tearDown(self):
+        self.conn.close()
+        self.sock.close()
+        self.client.close()
+
+    def testLargeResponse(self):
+        """A response sent in small pieces is read in full."""
+        result = 'x' * 200000
+
+        def respond():
+            req = json.loads(FrameReader(self.conn, 'length').read_frame().decode())
+            frame = encode_frame(json.dumps({'jsonrpc': '2.0', 'result': result,
+                                             'id': req['id']}).encode(), 'length')
+            for i in range(0, len(frame), 1000):
+                self.conn.sendall(frame[i:i + 1000])
+
+        thread = threading.Thread(target=respond)
+        thread.start()
+        self.assertEqual(self.client.hello(), result)
+        thread.join()
+
+
+class TestPipelinedClient(unittest.TestCase):
+    """Tests the pipelined client."""
+
+    def setUp(self):
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((SERVER_HOST, SERVER_PORT))
+        self.sock.listen(1)
+        self.client = PipelinedJSONRPCClient(SERVER_HOST, SERVER_PORT, max_in_flight=3)
+        self.conn, _ = self.sock.accept()
+        self.conn.settimeout(5)
+        self.reader = FrameReader(self.conn, 'length')
+        # The keep-alive notification
+        self.assertEqual(self.recv_json()['method'], 'keepAlive')
+
+    def tearDown(self):
+        self.conn.close()
+        self.sock.close()
+        self.client.close()
+
+    def recv_json(self):
+        """Receives a request from the client."""
+        return json.loads(self.reader.read_frame().decode())
+
+    def send_json(self, payload):
+        """Sends a response to the client."""
+        self.conn.sendall(encode_frame(json.dumps(payload).encode(), 'length'))
+
+    def testOutOfOrder(self):
+        """Responses are matched to their requests by id."""
+        futures = [self.client.submit('add', [i, 1]) for i in range(3)]
+        reqs = [self.recv_json() for _ in range(3)]
+        for req in reversed(reqs):
+            self.send_json({'jsonrpc': '2.0', 'result': sum(req['params']), 'id': req['id']})
+        self.assertEqual([f.result(5) for f in futures], [1, 2, 3])
+
+    def testErrors(self):
+        """Errors are raised by the future of their request."""
+        future = self.client.submit('missing', [])
+        req = self.recv_json()
+        self.send_json({'jsonrpc': '2.0', 'error': {'code': -32601, 'message': 'Method not found'},
+                        'id': req['id']})
+        self.assertRaises(AttributeError, future.result, 5)
+
+    def testNullIdError(self):
+        """Errors without an id fail the oldest request in flight."""
+        first = self.client.submit('bad', [1])
+        second = self.client.submit('hello', [])
+        reqs = [self.recv_json() for _ in range(2)]
+        self.send_json({'jsonrpc': '2.0', 'error': {'code': -32600, 'message': 'Invalid Request'},
+                        'id': None})
+        self.assertEqual(first.result(5)['error']['code'], -32600)
+        self.send_json({'jsonrpc': '2.0', 'result': 'Hi!', 'id': reqs[1]['id']})
+        self.assertEqual(second.result(5), 'Hi!')
+        self.assertEqual(self.client.in_flight, 0)
+
+    def testMaxInFlight(self):
+        """Requests past the limit wait for a response."""
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            calls = [executor.submit(self.client.hello) for _ in range(4)]
+            reqs = [self.recv_json() for _ in range(3)]
+            self.conn.settimeout(0.2)
+            self.assertRaises(socket.timeout, self.recv_json)
+            self.conn.settimeout(5)
+
+            self.send_json({'jsonrpc': '2.0', 'result': 'Hi!', 'id': reqs[0]['id']})
+            reqs = reqs[1:] + [self.recv_json()]
+            for req in reqs:
+                self.send_json({'jsonrpc': '2.0', 'result': 'Hi!', 'id': req['id']})
+            self.assertEqual([call.result(5) for call in calls], ['Hi!'] * 4)
+
+    def testConnectionClosed(self):
+        """Requests in flight fail when the connection closes."""
+        future = self.client.submit('hello', [])
+        self.recv_json()
+        self.conn.close()
+        self.assertRaises(ConnectionError, future.result, 5)
+        self.assertRaises(ConnectionError, self.client.hello)
+
+
+async def slow_add(a, b):
+    """Coroutine function whose responses come out of order."""
+    await asyncio.sleep(0.001 * (b % 5))
+    return a + b
+
+
+class TestAsyncClient(unittest.TestCase):
+    """Tests the asyncio client against the asyncio server."""
+
+    def setUp(self):
+        self.server = AsyncJSONRPCServer(SERVER_HOST, ASYNC_SERVER_PORT, framing='length')
+        self.server.register('hello', functions.hello)
+        self.server.register('add', slow_add)
+        self.server.register('keepAlive', functions.keepAlive)
+        self.server_thread = threading.Thread(target=self.server.start)
+        self.server_thread.start()
+        self.server.ready.wait(5)
+
+    def tearDown(self):
+        self.server.stop()
+        self.server_thread.join()
+
+    def run_client(self, coroutine_function, **options):
+        """Runs a coroutine function with a connected client."""
+        async def main():
+            async with AsyncJSONRPCClient(SERVER_HOST, ASYNC_SERVER_PORT, **options) as client:
+                return await asyncio.wait_for(coroutine_function(client), 10)
+        return asyncio.run(main())
+
+    def testCalls(self):
+        """Dynamic methods are coroutines."""
+        async def calls(client):
+            return await client.hello(), await client.add(1, 2), await client.add(a=1, b=3)
+        self.assertEqual(self.run_client(calls), ('Hi!', 3, 4))
+
+    def testErrors(self):
+        """Errors are raised as in the synchronous client."""
+        async def missing(client):
+            return await client.missing()
+
+        async def invalid_params(client):
+            return await client.add(1)
+
+        self.assertRaises(AttributeError, self.run_client, missing)
+        self.assertRaises(TypeError, self.run_client, invalid_params)
+
+    def testBatch(self):
+        """Batches return the responses in order."""
+        async def batch(client):
+            return await client.batch([{'method': 'hello'}, {'method': 'add', 'params': [1, 2]}])
+        self.assertEqual([r['result'] for r in self.run_client(batch)], ['Hi!', 3])
+
+    def testConcurrentCalls(self):
+        """Many concurrent calls share a few connections."""
+        async def calls(client):
+            results = await asyncio.gather(*(client.add(i, i) for i in range(2000)))
+            return results, len(client.connections)
+        results, connections = self.run_client(calls, connections=2, max_in_flight=100)
+        self.assertEqual(results, [2 * i for i in range(2000)])
+        self.assertEqual(connections, 2)
+
+
+def counting_function(server, calls):
+    """Remote function that counts its calls, then drops the connections."""
+    def count():
+        calls.append(1)
+        with server.lock:
+            connections = list(server.connections)
+        for conn in connections:
+            conn.shutdown(socket.SHUT_RDWR)
+    return count
+
+
+class TestClientPool(unittest.TestCase):
+    """Tests the connection pool against a concurrent server."""
+
+    def setUp(self):
+        self.startServer()
+
+    def tearDown(self):
+        self.server.stop()
+        self.server_thread.join()
+
+    def startServer(self):
+        """Starts a concurrent server in a thread."""
+        self.server = JSONRPCServer(SERVER_HOST, POOL_SERVER_PORT, workers=8, framing='length')
+        self.server.register('add', functions.add)
+        self.server.register('keepAlive', functions.keepAlive)
+        self.server_thread = threading.Thread(target=self.server.start)
+        self.server_thread.start()
+        time.sleep(0.05)
+
+    def testReuse(self):
+        """Sequential calls reuse one connection."""
+        with JSONRPCClientPool(SERVER_HOST, POOL_SERVER_PORT) as pool:
+            self.assertEqual([pool.add(i, 1) for i in range(20)], list(range(1, 21)))
+            self.assertEqual(pool.size, 1)
+
+    def testMaxSize(self):
+        """Threads share at most max_size connections."""
+        with JSONRPCClientPool(SERVER_HOST, POOL_SERVER_PORT, max_size=3) as pool:
+            with concurrent.futures.ThreadPoolExecutor(8) as executor:
+                results = list(executor.map(lambda i: pool.add(i, 1), range(200)))
+            self.assertEqual(results, list(range(1, 201)))
+            self.assertLessEqual(pool.size, 3)
+
+    def testErrors(self):
+        """Errors of the remote functions keep the connection."""
+        with JSONRPCClientPool(SERVER_HOST, POOL_SERVER_PORT) as pool:
+            self.assertRaises(AttributeError, pool.missing)
+            self.assertRaises(TypeError, pool.add, 1)
+            self.assertEqual(pool.add(1, 2), 3)
+            self.assertEqual(pool.size, 1)
+
+    def testIdleEviction(self):
+        """Connections idle for too long are closed, down to min_size."""
+        with JSONRPCClientPool(SERVER_HOST, POOL_SERVER_PORT, min_size=1, idle_timeout=0.05) as pool:
+            clients = [pool.acquire() for _ in range(3)]
+            for client in clients:
+                pool.release(client)
+            time.sleep(0.1)
+            self.assertEqual(pool.add(1, 2), 3)
+            self.assertEqual(pool.size, 1)
+
+    def testNoRetryAfterSend(self):
+        """A call whose connection fails after the request was written is not run twice."""
+        calls = []
+        self.server.register('count', counting_function(self.server, calls))
+        with JSONRPCClientPool(SERVER_HOST, POOL_SERVER_PORT) as pool:
+            self.assertRaises(ConnectionError, pool.count)
+            self.assertEqual(calls, [1])
+            self.assertEqual(pool.size, 0)
+            self.assertEqual(pool.add(1, 2), 3)
+
+    def testRetryBeforeSend(self):
+        """A call whose request could not be written is retried."""
+        with JSONRPCClientPool(SERVER_HOST, POOL_SERVER_PORT) as pool:
+            client = pool.acquire()
+
+            def fail(msg):
+                raise RequestNotSentError('Could not send the request')
+
+            client.write = fail
+            pool.release(client)
+            self.assertEqual(pool.add(1, 2), 3)
+            self.assertEqual(pool.size, 1)
+
+    def testAcquireTimeout(self):
+        """acquire waits for the timeout once, not on every wake-up."""
+        with JSONRPCClientPool(SERVER_HOST, POOL_SERVER_PORT, max_size=1) as pool:
+            client = pool.acquire()
+
+            def wake_up():
+                for _ in range(5):
+                    time.sleep(0.05)
+                    with pool.condition:
+                        pool.condition.notify_all()
+
+            thread = threading.Thread(target=wake_up)
+            thread.start()
+            start_time = time.time()
+            self.assertRaises(TimeoutError, pool.acquire, 0.1)
+            self.assertLess(time.time() - start_time, 0.2)
+            thread.join()
+            pool.release(client)
+
+    def testReconnect(self):
+        """Connections closed by the server are replaced."""
+        with JSONRPCClientPool(SERVER_HOST, POOL_SERVER_PORT, check_interval=0) as pool:
+            self.assertEqual(pool.add(1, 2), 3)
+            self.server.stop()
+            self.server_thread.join()
+            self.startServer()
+            self.assertEqual(pool.add(2, 2), 4)
+            self.assertEqual(pool.size, 1)
+
+    def testClosedSinceLastUse(self):
+        """A connection the server closed since its last use is replaced."""
+        with JSONRPCClientPool(SERVER_HOST, POOL_SERVER_PORT) as pool:
+            self.assertEqual(pool.add(1, 2), 3)
+            self.server.stop()
+            self.server_thread.join()
+            self.startServer()
+            self.assertEqual(pool.add(2, 2), 4)
+
+
+def bad(x):
+    """Remote function that raises a ValueError."""
+    raise ValueError(x)
+
+
+class TestRemoteErrors(unittest.TestCase):
+    """Tests the pipelined clients when the remote function raises."""
+
+    def setUp(self):
+        self.server = JSONRPCServer(SERVER_HOST, POOL_SERVER_PORT, workers=4, framing='length')
+        self.server.register('add', functions.add)
+        self.server.register('bad', bad)
+        self.server.register('keepAlive', functions.keepAlive)
+        self.server_thread = threading.Thread(target=self.server.start)
+        self.server_thread.start()
+        time.sleep(0.05)
+
+    def tearDown(self):
+        self.server.stop()
+        self.server_thread.join()
+
+    def testPipelinedClient(self):
+        """The error response completes the call and frees its slot."""
+        client = PipelinedJSONRPCClient(SERVER_HOST, POOL_SERVER_PORT, max_in_flight=2)
+        try:
+            for _ in range(3):
+                res = client.submit('bad', [1]).result(5)
+                self.assertEqual(res['error']['code'], -32603)
+            res = client.batch([{'method': 'bad', 'params': [1]}, {'method': 'add', 'params': [1, 2]}])
+            self.assertEqual([r.get('result') for r in res], [None, 3])
+            self.assertEqual(client.in_flight, 0)
+        finally:
+            client.close()
+
+    def testAsyncClient(self):
+        """The error response completes the coroutine."""
+        async def calls():
+            async with AsyncJSONRPCClient(SERVER_HOST, POOL_SERVER_PORT, connections=1) as client:
+                res = await asyncio.wait_for(client.bad(1), 5)
+                batch = await asyncio.wait_for(client.batch([
+                    {'method': 'bad', 'params': [1]}, {'method': 'add', 'params': [1, 2]}]), 5)
+                return res, batch, len(client.connections[0].pending)
+
+        res, batch, pending = asyncio.run(calls())
+        self.assertEqual(res['error']['code'], -32603)
+        self.assertEqual([r.get('result') for r in batch], [None, 3])
+        self.assertEqual(pending, 0)
+
+    def testAsyncClientNullId(self):
+        """Errors without an id fail the oldest request in flight."""
+        async def calls():
+            async with AsyncJSONRPCClient(SERVER_HOST, POOL_SERVER_PORT, connections=1) as client:
+                connection = client.connections[0]
+                call = asyncio.ensure_future(client.add(1, 2))
+                await asyncio.sleep(0)
+                connection.resolve({'jsonrpc': '2.0', 'id': None,
+                                    'error': {'code': -32600, 'message': 'Invalid Request'}})
+                return await asyncio.wait_for(call, 5), len(connection.pending)
+
+        res, pending = asyncio.run(calls())
+        self.assertEqual(res['error']['code'], -32600)
+        self.assertEqual(pending, 0)
@@ -3,7 +3,9 @@
 
 """
 
+import asyncio
 import json
+import math
 import random
 import socket
 import string
@@ -12,11 +14,17 @@ import threading
 import unittest
 
 import functions
+from async_server import AsyncJSONRPCServer
+from framing import FrameReader, encode_frame
 from server import JSONRPCServer
 
 # Define server host and port
 SERVER_HOST = '127.0.0.1'
 SERVER_PORT = 8000
+CONCURRENT_SERVER_PORT = 8001
+ASYNC_SERVER_PORT = 8002
+FRAMED_SERVER_PORT = 8003
+BATCH_SERVER_PORT = 8006
 
 
 class TestBase(unittest.TestCase):
@@ -260,6 +268,22 @@ class TestExecutionErrors(TestBase):
         self.assertEqual(res['error']['code'], -32603)
         self.assertEqual(res['error']['message'], 'Internal error')
 
+    def testFunctionRaisesValueError(self):
+        """Errors raised by the function keep the id of the request."""
+
+        def bad(x):
+            raise ValueError(x)
+
+        def wrong_type(x):
+            return x + 'x'
+
+        self.server.register('bad', bad)
+        self.server.register('wrongType', wrong_type)
+        for method in ('bad', 'wrongType'):
+            res = self.server.process_request({'jsonrpc': '2.0', 'method': method, 'params': [1], 'id': 7})
+            self.assertEqual(res['id'], 7)
+            self.assertEqual(res['error']['code'], -32603)
+
 
 class TestBacthRequest(TestBase):
     def testBatchRequest(self):
@@ -306,3 +330,377 @@ class TestExitCommand(TestBase):
             self.assertEqual(res, '')
         except ConnectionAbortedError:
             self.assertRaises(ConnectionAbortedError)
+
+
+class TestConcurrentServer(unittest.TestCase):
+    """Tests the concurrent mode of the server."""
+
+    def startServer(self, **options):
+        """Starts a concurrent server in a thread."""
+        self.server = JSONRPCServer(SERVER_HOST, CONCURRENT_SERVER_PORT, **options)
+        self.server.register('hello', functions.hello)
+        self.server.register('keepAlive', functions.keepAlive)
+        self.server_thread = threading.Thread(target=self.server.start)
+        self.server_thread.start()
+        time.sleep(0.05)
+
+    def tearDown(self):
+        self.server.stop()
+        self.server_thread.join()
+
+    def connect(self):
+        """Connects a client that keeps its connection alive."""
+        sock = socket.create_connection((SERVER_HOST, CONCURRENT_SERVER_PORT))
+        sock.sendall(json.dumps({'jsonrpc': '2.0', 'method': 'keepAlive'}).encode())
+        time.sleep(0.05)
+        return sock
+
+    def hello(self, sock):
+        """Invokes hello on a connection."""
+        sock.sendall(json.dumps({'jsonrpc': '2.0', 'method': 'hello', 'id': 1}).encode())
+        return json.loads(sock.recv(1024).decode())['result']
+
+    def testKeepAliveDoesNotBlock(self):
+        """A keep-alive client must not block the other clients."""
+        self.startServer(workers=4)
+        first = self.connect()
+        second = self.connect()
+        second.settimeout(2)
+        try:
+            self.assertEqual(self.hello(second), 'Hi!')
+            self.assertEqual(self.hello(first), 'Hi!')
+        finally:
+            first.close()
+            second.close()
+
+    def testMaxConnections(self):
+        """Clients over the limit wait until a connection closes."""
+        self.startServer(workers=4, max_connections=1)
+        first = self.connect()
+        second = socket.create_connection((SERVER_HOST, CONCURRENT_SERVER_PORT))
+        second.settimeout(0.3)
+        try:
+            self.assertRaises(socket.timeout, self.hello, second)
+            first.close()
+            second.settimeout(2)
+            self.assertEqual(json.loads(second.recv(1024).decode())['result'], 'Hi!')
+        finally:
+            second.close()
+
+
+async def slow_hello(delay):
+    """Coroutine function, awaited by the asyncio server."""
+    await asyncio.sleep(delay)
+    return 'Hi!'
+
+
+class TestAsyncServer(unittest.TestCase):
+    """Tests the asyncio server."""
+
+    def setUp(self):
+        self.server = AsyncJSONRPCServer(SERVER_HOST, ASYNC_SERVER_PORT)
+        self.server.register('hello', functions.hello)
+        self.server.register('add', functions.add)
+        self.server.register('div', functions.div)
+        self.server.register('keepAlive', functions.keepAlive)
+        self.server.register('sleep', time.sleep)
+        self.server.register('slowHello', slow_hello)
+        self.server.register('bad', math.sqrt)
+        self.server_thread = threading.Thread(target=self.server.start)
+        self.server_thread.start()
+        self.server.ready.wait(5)
+
+    def tearDown(self):
+        self.server.stop()
+        self.server_thread.join()
+
+    def call(self, payload, sock=None):
+        """Sends a message and returns the decoded reply."""
+        if sock is not None:
+            sock.sendall(json.dumps(payload).encode())
+            return json.loads(sock.recv(1024).decode())
+        with socket.create_connection((SERVER_HOST, ASYNC_SERVER_PORT)) as sock:
+            return self.call(payload, sock)
+
+    def testResults(self):
+        """Sync functions run on the thread pool."""
+        res = self.call({'jsonrpc': '2.0', 'method': 'add', 'params': [2, 3], 'id': 1})
+        self.assertEqual(res, {'jsonrpc': '2.0', 'id': 1, 'result': 5})
+        res = self.call({'jsonrpc': '2.0', 'method': 'add', 'params': {'a': 'x', 'b': 'y'}, 'id': 2})
+        self.assertEqual(res['result'], 'xy')
+
+    def testCoroutineFunction(self):
+        """Functions defined with async def are awaited."""
+        res = self.call({'jsonrpc': '2.0', 'method': 'slowHello', 'params': [0.01], 'id': 1})
+        self.assertEqual(res['result'], 'Hi!')
+
+    def testErrors(self):
+        """Errors are the same as on the threaded server."""
+        codes = [
+            ({'jsonrpc': '2.0', 'method': 'missing', 'id': 1}, -32601),
+            ({'jsonrpc': '2.0', 'method': 'add', 'params': [1], 'id': 1}, -32602),
+            ({'jsonrpc': '2.0', 'method': 'add', 'params': {'x': 1}, 'id': 1}, -32602),
+            ({'jsonrpc': '2.0', 'method': 'div', 'params': [1, 0], 'id': 1}, -32603),
+            ({'jsonrpc': '2.0', 'method': 'bad', 'params': [-1], 'id': 1}, -32603),
+            ({'jsonrpc': '2.0', 'id': 1}, -32600),
+        ]
+        for payload, code in codes:
+            res = self.call(payload)
+            self.assertEqual(res['error']['code'], code)
+            if code != -32600:
+                self.assertEqual(res['id'], 1)
+
+        with socket.create_connection((SERVER_HOST, ASYNC_SERVER_PORT)) as sock:
+            sock.sendall(b'{"jsonrpc": "2.0", "method"')
+            self.assertEqual(json.loads(sock.recv(1024).decode())['error']['code'], -32700)
+
+    def testBatch(self):
+        """The requests of a batch are answered in order, without notifications."""
+        res = self.call([
+            {'jsonrpc': '2.0', 'method': 'slowHello', 'params': [0.05], 'id': 1},
+            {'jsonrpc': '2.0', 'method': 'add', 'params': [1, 2]},
+            {'jsonrpc': '2.0', 'method': 'add', 'params': [1, 2], 'id': 2},
+        ])
+        self.assertEqual([r['id'] for r in res], [1, 2])
+        self.assertEqual([r['result'] for r in res], ['Hi!', 3])
+
+    def testSlowFunctionDoesNotBlock(self):
+        """A blocking function runs off the event loop."""
+        slow = socket.create_connection((SERVER_HOST, ASYNC_SERVER_PORT))
+        try:
+            slow.sendall(json.dumps({'jsonrpc': '2.0', 'method': 'sleep', 'params': [1], 'id': 1}).encode())
+            time.sleep(0.05)
+            start_time = time.time()
+            self.assertEqual(self.call({'jsonrpc': '2.0', 'method': 'hello', 'id': 2})['result'], 'Hi!')
+            self.assertLess(time.time() - start_time, 0.5)
+        finally:
+            slow.close()
+
+    def testManyKeepAliveConnections(self):
+        """Many keep-alive clients are served at the same time."""
+        keep_alive = {'jsonrpc': '2.0', 'method': 'keepAlive'}
+        socks = [socket.create_connection((SERVER_HOST, ASYNC_SERVER_PORT)) for _ in range(200)]
+        try:
+            for i, sock in enumerate(socks):
+                sock.settimeout(5)
+                res = self.call([keep_alive, {'jsonrpc': '2.0', 'method': 'add', 'params': [i, 1], 'id': i}], sock)
+                self.assertEqual(res[0]['result'], i + 1)
+            for i, sock in enumerate(socks):
+                res = self.call({'jsonrpc': '2.0', 'method': 'add', 'params': [i, 2], 'id': i}, sock)
+                self.assertEqual(res['result'], i + 2)
+        finally:
+            for sock in socks:
+                sock.close()
+
+
+class TestFraming(unittest.TestCase):
+    """Tests the newline-delimited and length-prefixed framings."""
+
+    def startServer(self, server_class, framing, **options):
+        """Starts a server with a framing in a thread."""
+        self.framing = framing
+        self.server = server_class(SERVER_HOST, FRAMED_SERVER_PORT, framing=framing, **options)
+        self.server.register('add', functions.add)
+        self.server.register('keepAlive', functions.keepAlive)
+        self.server_thread = threading.Thread(target=self.server.start)
+        self.server_thread.start()
+        time.sleep(0.05)
+        self.sock = socket.create_connection((SERVER_HOST, FRAMED_SERVER_PORT))
+        self.sock.settimeout(10)
+        self.reader = FrameReader(self.sock, framing)
+
+    def tearDown(self):
+        self.sock.close()
+        self.server.stop()
+        self.server_thread.join()
+
+    def send(self, *payloads):
+        """Sends messages back to back, in a single write."""
+        self.sock.sendall(b''.join(encode_frame(json.dumps(p).encode(), self.framing)
+                                   for p in payloads))
+
+    def receive(self):
+        """Receives a message."""
+        return json.loads(self.reader.read_frame().decode())
+
+    def checkLargeBatch(self):
+        """A batch far larger than a recv is answered in full."""
+        batch = [{'jsonrpc': '2.0', 'method': 'add', 'params': ['x' * 100, str(i)], 'id': i}
+                 for i in range(5000)]
+        self.send(batch)
+        res = self.receive()
+        self.assertEqual(len(res), 5000)
+        self.assertEqual(res[-1]['result'], 'x' * 100 + '4999')
+
+    def checkPipelinedMessages(self):
+        """Messages sent back to back are all answered."""
+        keep_alive = {'jsonrpc': '2.0', 'method': 'keepAlive'}
+        self.send(keep_alive, *({'jsonrpc': '2.0', 'method': 'add', 'params': [i, 1], 'id': i}
+                                for i in range(100)))
+        # The asyncio server may answer them out of order
+        results = {}
+        for _ in range(100):
+            res = self.receive()
+            results[res['id']] = res['result']
+        self.assertEqual(results, {i: i + 1 for i in range(100)})
+
+    def testNewline(self):
+        self.startServer(JSONRPCServer, 'newline')
+        self.checkLargeBatch()
+
+    def testLength(self):
+        self.startServer(JSONRPCServer, 'length')
+        self.checkLargeBatch()
+
+    def testPipelined(self):
+        self.startServer(JSONRPCServer, 'length')
+        self.checkPipelinedMessages()
+
+    def testAsyncNewline(self):
+        self.startServer(AsyncJSONRPCServer, 'newline')
+        self.checkPipelinedMessages()
+        self.checkLargeBatch()
+
+    def testAsyncLength(self):
+        self.startServer(AsyncJSONRPCServer, 'length')
+        self.checkPipelinedMessages()
+        self.checkLargeBatch()
+
+
+def slow_add(a, b):
+    """Slow function, run by the batch executors."""
+    time.sleep(0.3)
+    return a + b
+
+
+class TestBatchExecutor(unittest.TestCase):
+    """Tests the concurrent execution of batches."""
+
+    def setUp(self):
+        self.server = None
+
+    def startServer(self, batch_executor):
+        """Starts a server with a batch executor in a thread."""
+        self.server = JSONRPCServer(SERVER_HOST, BATCH_SERVER_PORT, batch_executor=batch_executor,
+                                    batch_workers=4)
+        self.server.register('add', functions.add)
+        self.server.register('div', functions.div)
+        self.server.register('sqrt', math.sqrt)
+        self.server.register('slowAdd', slow_add)
+        self.server_thread = threading.Thread(target=self.server.start)
+        self.server_thread.start()
+        time.sleep(0.05)
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.stop()
+            self.server_thread.join()
+
+    def checkBatch(self):
+        """A batch of slow requests takes about as long as one of them."""
+        batch = [{'jsonrpc': '2.0', 'method': 'slowAdd', 'params': [i, 1], 'id': i}
+                 for i in range(4)]
+        batch += [
+            {'jsonrpc': '2.0', 'method': 'slowAdd', 'params': [1, 1]},
+            {'jsonrpc': '2.0', 'method': 'missing', 'id': 'missing'},
+            {'jsonrpc': '2.0', 'method': 'add', 'params': [1], 'id': 'params'},
+            {'jsonrpc': '2.0', 'method': 'div', 'params': {'a': 1, 'b': 0}, 'id': 'internal'},
+            {'jsonrpc': '2.0', 'method': 'sqrt', 'params': [-1], 'id': 'value'},
+        ]
+        with socket.create_connection((SERVER_HOST, BATCH_SERVER_PORT)) as sock:
+            start_time = time.time()
+            sock.sendall(json.dumps(batch).encode())
+            res = json.loads(sock.recv(4096).decode())
+            elapsed = time.time() - start_time
+
+        self.assertLess(elapsed, 0.9)
+        self.assertEqual([r['id'] for r in res], [0, 1, 2, 3, 'missing', 'params', 'internal', 'value'])
+        self.assertEqual([r['result'] for r in res[:4]], [1, 2, 3, 4])
+        self.assertEqual([r['error']['code'] for r in res[4:]], [-32601, -32602, -32603, -32603])
+
+    def testThreadExecutor(self):
+        self.startServer('thread')
+        self.checkBatch()
+
+    def testProcessExecutor(self):
+        self.startServer('process')
+        self.checkBatch()
+
+    def testUnknownExecutor(self):
+        self.assertRaises(ValueError, JSONRPCServer, SERVER_HOST, BATCH_SERVER_PORT,
+                          batch_executor='fibers')
+
+    def testUnpicklableFunction(self):
+        """Process batch executors only accept picklable functions."""
+        server = JSONRPCServer(SERVER_HOST, BATCH_SERVER_PORT, batch_executor='process')
+        server.register('add', functions.add)
+        self.assertRaises(ValueError, server.register, 'third', lambda: 3)
+        self.assertNotIn('third', server.methods)
+
+
+def power(base: float, exponent: int = 2):
+    """Function with annotations and a default value."""
+    return base ** exponent
+
+
+class TestRegister(unittest.TestCase):
+    """Tests the register forms and the binding of the params."""
+
+    def setUp(self):
+        self.server = JSONRPCServer(SERVER_HOST, SERVER_PORT)
+
+    def call(self, method, params=None):
+        """Processes a request without a connection."""
+        req = {'jsonrpc': '2.0', 'method': method, 'id': 1}
+        if params is not None:
+            req['params'] = params
+        return self.server.process_request(req)
+
+    def testForms(self):
+        """register works with a name, as a decorator and with a module."""
+        @self.server.register
+        def first():
+            return 1
+
+        @self.server.register('second')
+        def named():
+            return 2
+
+        self.server.register(functions)
+        self.server.register('third', lambda: 3)
+
+        self.assertEqual(first(), 1)
+        self.assertEqual(self.call('first')['result'], 1)
+        self.assertEqual(self.call('second')['result'], 2)
+        self.assertEqual(self.call('third')['result'], 3)
+        self.assertEqual(self.call('greet', ['World'])['result'], 'Hello World')
+        self.assertEqual(self.call('named')['error']['code'], -32601)
+
+    def testBinding(self):
+        """Params are bound like a Python call, with proper errors."""
+        self.server.register('power', power)
+        self.assertEqual(self.call('power', [3])['result'], 9)
+        self.assertEqual(self.call('power', [2, 3])['result'], 8)
+        self.assertEqual(self.call('power', {'base': 2})['result'], 4)
+        for params in ([], [1, 2, 3], {'exponent': 2}, {'base': 2, 'other': 1}, 'x'):
+            self.assertEqual(self.call('power', params)['error']['code'], -32602)
+
+    def testParamsIgnored(self):
+        """Functions without parameters ignore the params, as before."""
+        self.server.register('hello', functions.hello)
+        for params in ([], [1], {'name': 'x'}):
+            self.assertEqual(self.call('hello', params)['result'], 'Hi!')
+
+    def testCoercion(self):
+        """Params are converted to the annotated types, if asked to."""
+        self.server.register('power', power, coerce=True)
+        self.server.register('plain', power)
+        self.assertEqual(self.call('power', ['1.5', 2.0])['result'], 2.25)
+        self.assertEqual(self.call('plain', [2, 2.0])['result'], 4.0)
+        for params in (['x'], [2, 2.5], [True], {'base': None}):
+            self.assertEqual(self.call('power', params)['error']['code'], -32602)
+
+    def testWithoutSignature(self):
+        """Functions without a signature get the params as they come."""
+        self.server.register('maximum', max)
+        self.assertEqual(self.call('maximum', [1, 3, 2])['result'], 3)